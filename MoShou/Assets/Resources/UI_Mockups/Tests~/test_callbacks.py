@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+"""
+Completion callbacks against a local stand-in LiblibAI provider.
+
+Run from this folder's parent:  python -m pytest "Tests~"
+(The "~" keeps Unity from importing the folder.)
+"""
+
+import http.client
+import http.server
+import json
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+import sprite_cli  # noqa: E402
+
+# Long enough that a test finishing quickly proves it was woken, not polled
+SLOW_POLL = 30
+
+
+class StandInProvider(http.server.ThreadingHTTPServer):
+    """
+    Minimal text2img/status API. Renders finish render_seconds after submit; with notify, the
+    provider then POSTs {"generateUuid": ...} to the task's callbackUrl (before answering the
+    submit when render_seconds is 0, i.e. ahead of the client's callback_watch).
+    """
+
+    def __init__(self, render_seconds, notify=True):
+        super().__init__(("127.0.0.1", 0), StandInHandler)
+        self.daemon_threads = True
+        self.render_seconds = render_seconds
+        self.notify = notify
+        self.tasks = {}
+        self.polls = 0
+
+    def finish(self, task_id, callback_url):
+        self.tasks[task_id]["done"] = True
+        if self.notify and callback_url:
+            body = json.dumps({"generateUuid": task_id, "generateStatus": 5}).encode("utf-8")
+            req = urllib.request.Request(callback_url, data=body, method="POST")
+            req.add_header("Content-Type", "application/json")
+            urllib.request.urlopen(req, timeout=5).close()
+
+
+class StandInHandler(http.server.BaseHTTPRequestHandler):
+    def log_message(self, fmt, *args):
+        pass
+
+    def reply(self, data):
+        body = json.dumps({"code": 0, "data": data}).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        provider = self.server
+        payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+        if self.path.startswith("/api/generate/webui/text2img"):
+            task_id = uuid.uuid4().hex
+            provider.tasks[task_id] = {"done": False}
+            callback_url = payload.get("callbackUrl")
+            if provider.render_seconds <= 0:
+                provider.finish(task_id, callback_url)
+            else:
+                timer = threading.Timer(provider.render_seconds, provider.finish, (task_id, callback_url))
+                timer.daemon = True
+                timer.start()
+            self.reply({"generateUuid": task_id})
+        elif self.path.startswith("/api/generate/webui/status"):
+            provider.polls += 1
+            task = provider.tasks[payload["generateUuid"]]
+            if task["done"]:
+                self.reply({"generateStatus": 5, "images": [{"imageUrl": "http://127.0.0.1/render.png"}]})
+            else:
+                self.reply({"generateStatus": 2})
+        else:
+            self.send_error(404)
+
+
+@pytest.fixture
+def provider_factory(monkeypatch):
+    servers = []
+
+    def start(render_seconds, notify=True):
+        server = StandInProvider(render_seconds, notify)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        monkeypatch.setattr(sprite_cli, "LIBLIB_BASE", "http://127.0.0.1:%d" % server.server_address[1])
+        return server
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def receiver():
+    def start(verify_interval=SLOW_POLL):
+        return sprite_cli.callback_start(0, None, "127.0.0.1", verify_interval)
+    yield start
+    sprite_cli.callback_stop()
+    sprite_cli.CALLBACK_WATCHERS.clear()
+    sprite_cli.CALLBACK_PENDING.clear()
+
+
+def notify(url, payload):
+    req = urllib.request.Request(url, data=json.dumps(payload).encode("utf-8"), method="POST")
+    req.add_header("Content-Type", "application/json")
+    with urllib.request.urlopen(req, timeout=5) as resp:
+        return resp.status
+
+
+def generate(tmp_path):
+    start = time.time()
+    result = sprite_cli.liblib_generate_and_wait("ak", "sk", "test prompt", None, timeout=60,
+                                                 poll_interval=SLOW_POLL, ledger_path=tmp_path / "ledger.jsonl")
+    return result, time.time() - start
+
+
+def test_callback_wakes_wait(provider_factory, receiver, tmp_path):
+    provider = provider_factory(1.0)
+    receiver()
+    result, elapsed = generate(tmp_path)
+    assert result["ok"] and result["status"] == "success"
+    assert result["polls"] == 1 and provider.polls == 1
+    assert elapsed < 5
+    assert not sprite_cli.CALLBACK_WATCHERS
+
+
+def test_callback_before_watch_is_kept(provider_factory, receiver, tmp_path):
+    # The provider notifies before the submit returns, so the id is pending when the watch starts
+    provider = provider_factory(0)
+    receiver()
+    result, elapsed = generate(tmp_path)
+    assert result["ok"]
+    assert provider.polls == 1
+    assert elapsed < 5
+    assert not sprite_cli.CALLBACK_PENDING
+
+
+def test_receiver_routes_notifications(receiver):
+    url = receiver()
+    assert notify(url, {"data": {"generateUuid": "early"}}) == 200
+    assert "early" in sprite_cli.CALLBACK_PENDING
+    event = threading.Event()
+    sprite_cli.callback_watch("early", event)
+    assert event.is_set()
+    late = threading.Event()
+    sprite_cli.callback_watch("late", late)
+    assert notify(url, {"task_id": "late"}) == 200
+    assert late.wait(5)
+    sprite_cli.callback_unwatch(["early", "late"])
+    assert not sprite_cli.CALLBACK_WATCHERS
+    with pytest.raises(urllib.error.HTTPError):
+        notify(url.rsplit("/", 1)[0] + "/other", {"task_id": "late"})
+
+
+def test_verify_interval_without_callback(provider_factory, receiver, tmp_path):
+    # Lost notification: the verification poll still finds the render, long before --poll-interval
+    provider = provider_factory(0.5, notify=False)
+    receiver(verify_interval=2)
+    result, elapsed = generate(tmp_path)
+    assert result["ok"]
+    assert provider.polls == 1
+    assert 1.5 <= elapsed < 5
+
+
+def test_no_receiver_polls_at_poll_interval(monkeypatch):
+    waits = []
+    monkeypatch.setattr(sprite_cli.time, "sleep", waits.append)
+    sprite_cli.wait_for_update(threading.Event(), 7, 100)
+    assert waits == [7]
+
+
+def test_pending_ids_expire_and_are_capped(receiver, monkeypatch):
+    monkeypatch.setattr(sprite_cli, "CALLBACK_PENDING_MAX", 3)
+    clock = [1000.0]
+    monkeypatch.setattr(sprite_cli.time, "time", lambda: clock[0])
+    for i in range(5):
+        sprite_cli.callback_notify("id%d" % i)
+    assert list(sprite_cli.CALLBACK_PENDING) == ["id2", "id3", "id4"]
+    clock[0] += sprite_cli.CALLBACK_PENDING_TTL + 1
+    sprite_cli.callback_notify("fresh")
+    assert list(sprite_cli.CALLBACK_PENDING) == ["fresh"]
+
+
+def test_expired_pending_id_does_not_wake(receiver, monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(sprite_cli.time, "time", lambda: clock[0])
+    sprite_cli.callback_notify("old")
+    clock[0] += sprite_cli.CALLBACK_PENDING_TTL + 1
+    event = threading.Event()
+    sprite_cli.callback_watch("old", event)
+    assert not event.is_set()
+    assert not sprite_cli.CALLBACK_PENDING
+    sprite_cli.callback_unwatch(["old"])
+
+
+def post_raw(url, body, length):
+    parts = urllib.parse.urlsplit(url)
+    conn = http.client.HTTPConnection(parts.hostname, parts.port, timeout=5)
+    try:
+        conn.putrequest("POST", parts.path)
+        conn.putheader("Content-Length", length)
+        conn.endheaders()
+        conn.send(body)
+        return conn.getresponse().status
+    finally:
+        conn.close()
+
+
+def test_receiver_rejects_bad_or_oversized_bodies(receiver):
+    url = receiver()
+    assert post_raw(url, b"", "abc") == 400
+    assert post_raw(url, b"", "-5") == 400
+    assert post_raw(url, b"", str(sprite_cli.CALLBACK_MAX_BODY + 1)) == 413
+    assert not sprite_cli.CALLBACK_PENDING
+    body = json.dumps({"task_id": "ok"}).encode("utf-8")
+    assert post_raw(url, body, str(len(body))) == 200
+    assert "ok" in sprite_cli.CALLBACK_PENDING
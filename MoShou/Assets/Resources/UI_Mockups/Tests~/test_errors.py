@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+"""
+Permanent vs transient submit error classification.
+
+Run from this folder's parent:  python -m pytest "Tests~"
+(The "~" keeps Unity from importing the folder.)
+"""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+import sprite_cli  # noqa: E402
+
+
+@pytest.mark.parametrize("message", [
+    '{"code": 401, "msg": "Unauthorized"}',
+    "Invalid API key",
+    "invalid signature",
+    "Signature does not match",
+    '{"msg": "templateUuid not found"}',
+    "Insufficient balance",
+    '{"msg": "账户积分不足"}',
+])
+def test_permanent_messages(message):
+    assert sprite_cli.is_permanent_error(message)
+
+
+@pytest.mark.parametrize("message", [
+    "author field missing, try again",
+    "oauth token refresh in progress",
+    "signature expired: request timestamp too far from server time",
+    "upstream timeout",
+    "rate limited",
+])
+def test_transient_messages(message):
+    assert not sprite_cli.is_permanent_error(message)
+
+
+def test_permanent_http_codes():
+    assert sprite_cli.is_permanent_error("HTTP 403 Forbidden", 403)
+    assert not sprite_cli.is_permanent_error("HTTP 503 Service Unavailable", 503)
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+"""
+9-slice detection on synthetic frames.
+
+Run from this folder's parent:  python -m pytest "Tests~"
+(The "~" keeps Unity from importing the folder.)
+"""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("PIL")
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+import sprite_cli  # noqa: E402
+
+SIZE = 64
+BORDER = 8
+
+
+def frame(center):
+    """Opaque 8px border with corner ornaments around `center` (an RGBA array for the middle)."""
+    pixels = np.zeros((SIZE, SIZE, 4), dtype=np.float32)
+    pixels[...] = (120, 80, 40, 255)
+    for y in (0, SIZE - BORDER):
+        for x in (0, SIZE - BORDER):
+            pixels[y:y + BORDER, x:x + BORDER, :3] = (230, 200, 60)
+    pixels[BORDER:-BORDER, BORDER:-BORDER] = center
+    return pixels
+
+
+@pytest.mark.parametrize("leftover", [False, True])
+def test_transparent_center_is_stretchable(tmp_path, leftover):
+    inner = SIZE - 2 * BORDER
+    center = np.zeros((inner, inner, 4), dtype=np.float32)
+    if leftover:
+        # Renderer noise under alpha 0 must not count as detail
+        center[..., :3] = np.random.default_rng(3).random((inner, inner, 3)) * 255
+    path = tmp_path / "UI_Frame.png"
+    sprite_cli.save_rgba_array(np, frame(center), path)
+    report = sprite_cli.check_nine_slice(path)
+    assert report["stretch_x"] and report["stretch_y"]
+    assert report["left"] >= BORDER and report["right"] >= BORDER
+
+
+def test_visible_detail_is_not_stretchable(tmp_path):
+    inner = SIZE - 2 * BORDER
+    center = np.random.default_rng(4).random((inner, inner, 4)).astype(np.float32) * 255
+    center[..., 3] = 255
+    path = tmp_path / "UI_Frame.png"
+    sprite_cli.save_rgba_array(np, frame(center), path)
+    assert sprite_cli.check_nine_slice(path) == {}
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+"""
+Asset store variant numbering.
+
+Run from this folder's parent:  python -m pytest "Tests~"
+(The "~" keeps Unity from importing the folder.)
+"""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+import sprite_cli  # noqa: E402
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = sprite_cli.store_open(tmp_path / "store")
+    yield store
+    sprite_cli.store_close(store)
+
+
+def test_auto_variant_follows_highest_number(store):
+    assert sprite_cli.store_put(store, b"a", {"name": "Icon.png"})["variant"] == "1"
+    assert sprite_cli.store_put(store, b"b", {"name": "Icon.png", "variant": "2"})["variant"] == "2"
+    assert sprite_cli.store_put(store, b"c", {"name": "Icon.png", "variant": "alt"})["variant"] == "alt"
+    assert sprite_cli.store_put(store, b"d", {"name": "Icon.png"})["variant"] == "3"
+    records, missing = sprite_cli.store_select(store, ["Icon.png@2"])
+    assert not missing and sprite_cli.store_read(store, records[0]).tobytes() == b"b"
+
+
+def test_explicit_variant_must_be_new(store):
+    sprite_cli.store_put(store, b"a", {"name": "Icon.png", "variant": "2"})
+    with pytest.raises(ValueError):
+        sprite_cli.store_put(store, b"b", {"name": "Icon.png", "variant": "2"})
+    # Same content under the same name is still a no-op, not a conflict
+    assert sprite_cli.store_put(store, b"a", {"name": "Icon.png", "variant": "2"})["variant"] == "2"
+    assert len(store["records"]) == 1
+
+
+def test_export_renumbers_taken_variants(store, tmp_path):
+    record = sprite_cli.store_put(store, b"new", {"name": "Icon.png"})
+    dest = sprite_cli.store_open(tmp_path / "dest")
+    sprite_cli.store_put(dest, b"old", {"name": "Icon.png"})
+    sprite_cli.store_close(dest)
+    sprite_cli.store_export(store, [record], tmp_path / "dest")
+    dest = sprite_cli.store_open(tmp_path / "dest")
+    assert [r["variant"] for r in dest["records"]] == ["1", "2"]
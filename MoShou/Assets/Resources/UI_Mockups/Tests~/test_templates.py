@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+"""
+Prompt template rendering and spec validation.
+
+Run from this folder's parent:  python -m pytest "Tests~"
+(The "~" keeps Unity from importing the folder.)
+"""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+import sprite_cli  # noqa: E402
+
+
+def test_empty_variables_leave_no_dangling_commas():
+    compose = sprite_cli.prompt_compiler({"prompt_template": "{style}, {prompt}, {palette} palette, {extra}",
+                                          "vars": {"palette": "gold", "extra": ""}}, "")
+    assert compose({"prompt": "a sword"}) == "a sword, gold palette"
+
+
+def test_literal_commas_are_kept():
+    compose = sprite_cli.prompt_compiler({"prompt_template": "{style}, {prompt}, a,,b"}, "")
+    assert compose({"prompt": "x"}) == "x, a,,b"
+
+
+@pytest.mark.parametrize("header, item", [
+    ({"templates": ["icon"]}, {}),
+    ({"templates": {"icon": 3}}, {}),
+    ({"vars": "warm"}, {}),
+    ({"prompt_template": ["{prompt}"]}, {}),
+    ({"prompt_template": "{prompt}"}, {"vars": ["warm"]}),
+    ({"templates": {"icon": "{prompt}"}}, {"template": ["icon"]}),
+])
+def test_malformed_specs_raise_value_error(header, item):
+    with pytest.raises(ValueError):
+        sprite_cli.prompt_compiler(header, "")(item)
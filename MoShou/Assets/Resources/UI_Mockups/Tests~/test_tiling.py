@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""
+Tiling seam scores on synthetic textures.
+
+Run from this folder's parent:  python -m pytest "Tests~"
+(The "~" keeps Unity from importing the folder.)
+"""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("PIL")
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+import sprite_cli  # noqa: E402
+
+SIZE = 128
+
+
+def gray(values):
+    values = np.clip(values, 0, 255).astype(np.float32)
+    return np.dstack([values, values, values, np.full_like(values, 255)])
+
+
+def smooth_noise(periodic, width=0.0005, seed=1):
+    """Low-pass noise; cropped from a larger periodic field it no longer wraps."""
+    n = SIZE if periodic else 2 * SIZE
+    freq = np.fft.fftfreq(n)
+    lowpass = np.exp(-(freq[:, None] ** 2 + freq[None, :] ** 2) / width)
+    field = np.fft.ifft2(np.fft.fft2(np.random.default_rng(seed).random((n, n))) * lowpass).real[:SIZE, :SIZE]
+    return gray((field - field.min()) / np.ptp(field) * 255)
+
+
+def score(pixels):
+    return sprite_cli.tile_seam_score(np, pixels)[0]
+
+
+def test_linear_gradient_scores_its_seam_finitely():
+    gradient = gray(np.tile(np.linspace(0, 255, SIZE), (SIZE, 1)))
+    before = score(gradient)
+    assert sprite_cli.TILE_SEAM_THRESHOLD < before < 1000
+    assert score(sprite_cli.tile_blend_fix(np, gradient)) <= sprite_cli.TILE_SEAM_THRESHOLD
+
+
+@pytest.mark.parametrize("width", [0.0005, 0.0002, 0.00005])
+def test_smooth_noise_passes_after_blend(width):
+    noise = smooth_noise(periodic=False, width=width)
+    assert score(noise) > sprite_cli.TILE_SEAM_THRESHOLD
+    assert score(sprite_cli.tile_blend_fix(np, noise)) <= sprite_cli.TILE_SEAM_THRESHOLD
+
+
+def test_seamless_textures_pass():
+    assert score(smooth_noise(periodic=True)) <= sprite_cli.TILE_SEAM_THRESHOLD
+    white = gray(np.random.default_rng(2).random((SIZE, SIZE)) * 255)
+    assert score(white) <= sprite_cli.TILE_SEAM_THRESHOLD
+
+
+def test_check_tiling_repairs_smooth_texture(tmp_path):
+    path = tmp_path / "Ground.png"
+    sprite_cli.save_rgba_array(np, smooth_noise(periodic=False), path)
+    report = sprite_cli.check_tiling(path)
+    assert report["fixed"] and report["ok"]
+    assert report["score"] < report["score_before"]
@@ -16,23 +16,96 @@ Usage examples:
   python sprite_cli.py ui --prompt "health bar background" --width 300 --height 40 -o bar.png
 
   # 3D model
-  python sprite_cli.py model --prompt "wooden treasure chest" -o chest.glb
+  python sprite_cli.py model --prompt "wooden treasure chest" -o chest.glb --lod
+
+  # 8-frame VFX flipbook (4x2 sheet of 128px frames + VFX_Hit_Spark.flipbook.json for Texture Sheet Animation)
+  python sprite_cli.py vfx --prompt "hit spark effect, white yellow sparks, black background" --frames 8 --columns 4 -o VFX_Hit_Spark.png
+  # (batch: give the item "flipbook": {"frames": 8} to do the same)
+
+  # LOD chain for an existing GLB (chest_LOD0.glb, chest_LOD1.glb, chest_LOD2.glb)
+  python sprite_cli.py lod -i chest.glb --budgets 10000,4000,1500
 
   # Batch from spec file
   python sprite_cli.py batch --spec ui_spec.json --skip-existing
 
+  # Projected cost / wall-clock, then a capped run (points, see .sprite_cli/cost_ledger.jsonl)
+  python sprite_cli.py batch --spec ui_spec.json --dry-run
+  python sprite_cli.py batch --spec ui_spec.json --budget 50
+
+  # Outputs under Assets/ get a .meta (stable GUID + importer preset); pick the preset for single images
+  python sprite_cli.py ui --prompt "grass ground texture" -o ../../Textures/Ground_Grass_01.png --importer terrain
+
+  # Duplicate renders stuck past the p95 of past render times, at most 1 hedge per 5 items
+  python sprite_cli.py batch -s ui_mockups_spec.json --hedge-budget 0.2
+
+  # Wake on provider callbacks (tunnel https://example.trycloudflare.com -> localhost:8787)
+  python sprite_cli.py batch -s ui_mockups_spec.json --callback-port 8787 --callback-url https://example.trycloudflare.com
+
+  # 9-slice borders into the sprite .meta, center cropped so one small texture fits every size
+  python sprite_cli.py slice -i ../../Sprites/UI/UI_HealthBar_Frame.png --crop
+
+  # Match the color grading of new renders per category (scores reported per item)
+  python sprite_cli.py batch -s ui_mockups_spec.json --color-normalize category
+  python sprite_cli.py color -i Screens/*.png --report-only
+  python sprite_cli.py color -i Sprites/*.png -o Corrected
+
+  # Gate a build: PlayMode captures in .task/screenshots vs Screens/ and Popups/ mockups
+  python sprite_cli.py compare --min-ssim 0.6
+  python sprite_cli.py compare -i ../../../../.task/screenshots/MS-009 --jobs 4
+
+  # Keep every render as a variant in the packed store; later put a chosen one back into Assets/
+  python sprite_cli.py batch -s ui_mockups_spec.json --store
+  python sprite_cli.py store list --select UI_MainMenu.png
+  python sprite_cli.py store checkout --select UI_MainMenu.png@2
+
+  # Outputs are staged in .sprite_cli/staging and moved into Assets/ together; long runs can settle every 20 items
+  python sprite_cli.py batch -s ui_mockups_spec.json --commit-every 20 --writer-threads 4
+
+  # Very large generated specs: JSONL in, JSONL results out, flat memory
+  python sprite_cli.py batch -s icons.jsonl --results icons_results.jsonl --skip-existing
+
+  # Seam check / repair for tileable textures (batch does this for terrain items automatically)
+  python sprite_cli.py tile -i Ground_Grass_01.png Ground_Dirt_01.png --fix
+
+  # Concurrent 3D models; items with "concept" render a LiblibAI image and chain it into image_to_model
+  python sprite_cli.py model-batch --spec models_spec.json --concurrency 4 --lod-budgets 10000,4000,1500
+
+  # Stream one JSON line per event (start/progress/item/summary) for n8n and Unity import
+  python sprite_cli.py batch --spec ui_spec.json --output-format ndjson
+
+  # Spec prompts as templates: "prompt_template"/"templates" with {style} {prompt} {category} {name} and "vars"
+  python sprite_cli.py ui --prompt "a sword" --prompt-template "{style}, game icon of {prompt}, {palette} palette" --var palette=steel
+
+  # Steps x size grid on one Screens and one Components prompt; table of render time and cost vs sharpness/coverage
+  python sprite_cli.py sweep -s ui_mockups_spec.json --steps 12,20,28 --size 512x896,768x1344 --dry-run
+  python sprite_cli.py sweep --prompt "gold coin icon" --category Components --steps 12,20 --concurrency 4
+
+  # Where did the time go over the last weeks (queue vs render vs polling vs local work)?
+  python sprite_cli.py perf report --bucket week --fail-on-regression
+
   # Check task status
   python sprite_cli.py status --service liblib --task-id "uuid..."
 """
 import argparse
 import base64
+import concurrent.futures
+import errno
 import hashlib
 import hmac
+import http.server
+import io
 import json
+import mmap
 import os
 import random
+import re
+import shutil
+import sqlite3
 import string
+import statistics
+import struct
 import sys
+import threading
 import time
 import urllib.error
 import urllib.parse
@@ -63,10 +136,139 @@ DEFAULT_GEN_HEIGHT = 1344
 DEFAULT_STEPS = 20
 DEFAULT_SEED = -1
 DEFAULT_IMG_COUNT = 1
+DEFAULT_MODEL_TIMEOUT = 600
+DEFAULT_MODEL_CONCURRENCY = 4
+DEFAULT_CALLBACK_HOST = "127.0.0.1"
+DEFAULT_VERIFY_INTERVAL = 30
 
 SCRIPT_DIR = Path(__file__).resolve().parent
 DEFAULT_CONFIG_PATH = SCRIPT_DIR / "liblib_config.json"
 DEFAULT_OUTPUT_DIR = SCRIPT_DIR / "output"
+# Dot-prefixed so Unity does not import local tool state
+STATE_DIR = SCRIPT_DIR / ".sprite_cli"
+DEFAULT_LEDGER_PATH = STATE_DIR / "cost_ledger.jsonl"
+DEFAULT_STORE_DIR = STATE_DIR / "store"
+STORE_PACK_NAME = "assets.pack"
+STORE_INDEX_NAME = "assets.idx"
+DEFAULT_PERF_DB = STATE_DIR / "perf.sqlite3"
+# Output writer: files are staged here and moved into place together (same volume as Assets/)
+DEFAULT_STAGING_DIR = STATE_DIR / "staging"
+DEFAULT_WRITER_THREADS = 4
+# Staged outputs are moved into place at least this often, so a crash loses few paid renders
+DEFAULT_COMMIT_EVERY = 20
+
+# Cost estimate: points for one 512x512 image at 20 steps, scaled linearly by pixels, steps and imgCount
+COST_PER_BASE_IMAGE = 1.0
+COST_BASE_PIXELS = 512 * 512
+COST_BASE_STEPS = 20
+DEFAULT_RENDER_ESTIMATE = 120
+
+# Hedged renders: a task still running past this percentile of past render times gets a duplicate
+DEFAULT_HEDGE_PERCENTILE = 95
+DEFAULT_HEDGE_BUDGET = 0.1
+HEDGE_MIN_SAMPLES = 20
+
+# Performance history: `perf report` compares the last PERF_WINDOW_DAYS against the PERF_BASELINE_DAYS before
+PERF_WINDOW_DAYS = 7
+PERF_BASELINE_DAYS = 28
+PERF_REGRESSION_THRESHOLD = 0.2
+PERF_MIN_SAMPLES = 5
+# Changes smaller than this (seconds / polls / retries) are noise, whatever the ratio
+PERF_MIN_DELTA = 0.5
+PERF_FAILURE_DELTA = 0.05
+
+# Tileable texture check: seam score ~1.0 when seamless
+TILEABLE_CATEGORIES = ("terrain", "ground", "tiles")
+TILE_SEAM_THRESHOLD = 1.5
+TILE_BLEND_FRACTION = 0.125
+# Interior curvature below this fraction of the interior step is too small to score the wrap against
+TILE_CURVE_NEGLIGIBLE = 0.25
+# Trailing "~" keeps Unity from importing rejected outputs
+TILE_REJECT_DIR = "Rejected~"
+
+# 9-slice detection: stretchable center = longest interior run of near-identical rows/columns
+NINE_SLICE_HINTS = ("frame", "panel", "border")
+NINE_SLICE_TOLERANCE = 3.0
+NINE_SLICE_PERCENTILE = 99
+NINE_SLICE_MIN_CENTER = 0.1
+NINE_SLICE_KEEP = 4
+
+# Color consistency: quantile levels of the per-channel reference distribution
+COLOR_LEVELS = 256
+COLOR_SAMPLE_STRIDE = 2
+DEFAULT_COLOR_STRENGTH = 1.0
+COLOR_NORMALIZE_MODES = ("category", "batch", "off")
+# `color` writes corrected copies as <stem>_color.<ext> unless --in-place or -o is given
+COLOR_OUTPUT_SUFFIX = "_color"
+# VFX flipbooks: N seed-locked renders -> aligned frames packed into a texture-sheet grid
+DEFAULT_FLIPBOOK_FRAMES = 8
+DEFAULT_FLIPBOOK_FPS = 24
+DEFAULT_FLIPBOOK_FRAME_SIZE = 128
+DEFAULT_FLIPBOOK_GEN_SIZE = 768
+# Alpha (0-255) below which a pixel is background when trimming
+FLIPBOOK_ALPHA_TRIM = 8
+# Prompt suffix per animation phase, spread over the frames
+FLIPBOOK_PHASES = ("emerging, small and faint", "building up, expanding", "peak intensity, full size, brightest",
+                   "dissipating, breaking apart", "fading out, faint wisps")
+# Raw frames are kept next to the sheet; "~" keeps Unity from importing them
+FLIPBOOK_FRAMES_SUFFIX = "_frames~"
+
+# Visual regression: PlayMode screenshots scored against the mockups they implement
+COMPARE_MOCKUP_DIRS = ("Screens", "Popups")
+# .task/screenshots at the repository root, next to MoShou/
+DEFAULT_SCREENSHOT_DIR = SCRIPT_DIR.parents[3] / ".task" / "screenshots"
+DEFAULT_HEATMAP_DIR = STATE_DIR / "compare"
+COMPARE_MAX_SIDE = 512
+COMPARE_WINDOW = 7
+DEFAULT_COMPARE_MIN_SSIM = 0.6
+# CIE76 delta E above which a pixel counts as visibly changed
+COMPARE_DELTA_E = 10.0
+# Settings sweeps: a grid of render settings per prompt, scored at a common size
+DEFAULT_SWEEP_DIR = STATE_DIR / "sweep"
+SWEEP_EVAL_SIDE = 512
+# Max per-channel difference from the border color that still counts as background
+SWEEP_SUBJECT_TOLERANCE = 24
+# Recommended settings keep at least this fraction of the category's best sharpness
+DEFAULT_SWEEP_MIN_QUALITY = 0.8
+# zlib level for rewritten PNGs: ~5x faster than Pillow's default, Unity recompresses on import
+PNG_FAST_COMPRESS = 1
+
+# Unity .meta generation: TextureImporter presets by category (see unity_texture_preset)
+UNITY_ASSETS_DIR = "Assets"
+UNITY_MAX_TEXTURE_SIZE = 2048
+VFX_CATEGORIES = ("vfx", "effects", "particles")
+UNITY_TEXTURE_PRESETS = {
+    # UI / Components / Screens: Sprite (2D and UI), single, no mips, clamped
+    "sprite": {"texture_type": 8, "sprite_mode": 1, "enable_mip": 0, "wrap": 1, "npot": 0, "alpha_transparency": 1},
+    # Terrain: Default with mipmaps, repeat wrap for tiling
+    "terrain": {"texture_type": 0, "sprite_mode": 0, "enable_mip": 1, "wrap": 0, "npot": 1, "alpha_transparency": 0},
+    # VFX: Default, no mips, clamped, alpha is transparency
+    "vfx": {"texture_type": 0, "sprite_mode": 0, "enable_mip": 0, "wrap": 1, "npot": 0, "alpha_transparency": 1},
+}
+
+# GLB / LOD post-processing
+GLB_MAGIC = 0x46546C67
+GLB_CHUNK_JSON = 0x4E4F534A
+GLB_CHUNK_BIN = 0x004E4942
+GLTF_COMPONENT_DTYPES = {5120: "i1", 5121: "u1", 5122: "<i2", 5123: "<u2", 5125: "<u4", 5126: "<f4"}
+GLTF_TYPE_SIZES = {"SCALAR": 1, "VEC2": 2, "VEC3": 3, "VEC4": 4, "MAT2": 4, "MAT3": 9, "MAT4": 16}
+DEFAULT_LOD_BUDGETS = (10000, 4000, 1500)
+LOD_FLIP_COSINE = 0.2
+LOD_POOL_DIVISOR = 4
+LOD_SELECT_ROUNDS = 3
+
+# Errors that will never succeed on retry. English phrases match as whole words, so "author",
+# "oauth" or a clock-skew "signature expired" stay retryable; Chinese markers match as substrings.
+PERMANENT_HTTP_CODES = (400, 401, 403, 404, 422)
+PERMANENT_ERROR_PHRASES = (
+    r"unauthori[sz]ed", r"forbidden", r"authentication failed", r"invalid (?:api|access) ?key",
+    r"access ?key (?:is )?(?:invalid|not found|does not exist)", r"invalid signature",
+    r"signature (?:mismatch|does not match)", r"(?:invalid|unknown) template(?:uuid)?",
+    r"template(?:uuid)? (?:not found|does not exist)", r"insufficient (?:balance|credits?|funds|points|quota)",
+    r"balance (?:is )?(?:insufficient|not enough)", r"quota (?:exhausted|used up)",
+)
+PERMANENT_ERROR_RE = re.compile(r"\b(?:%s)\b" % "|".join(PERMANENT_ERROR_PHRASES))
+PERMANENT_ERROR_MARKERS = ("积分不足", "余额不足")
 
 
 # Logging & Output Helpers
@@ -77,8 +279,37 @@ def log(message):
     print("[%s] %s" % (ts, message), file=sys.stderr, flush=True)
 
 
+# "json": one indented document at the end. "ndjson": one line per event as it happens
+# (start / progress / item / summary); list fields of the final result were already
+# streamed as item events and are left out of the summary line.
+OUTPUT = {"format": "json"}
+OUTPUT_LOCK = threading.Lock()
+EVENT_CONTEXT = threading.local()
+STREAMED_LIST_KEYS = ("results", "items")
+
+
+def set_event_context(**fields):
+    """Fields merged into every event emitted from the current thread (e.g. the item being worked on)."""
+    EVENT_CONTEXT.fields = fields
+
+
+def emit_event(event, **fields):
+    """In ndjson mode, write one event line to stdout immediately; no-op in json mode."""
+    if OUTPUT["format"] != "ndjson":
+        return
+    line = {"event": event, "ts": round(time.time(), 3)}
+    line.update(getattr(EVENT_CONTEXT, "fields", {}))
+    line.update(fields)
+    with OUTPUT_LOCK:
+        print(json.dumps(line, ensure_ascii=False), flush=True)
+
+
 def emit_result(result_dict):
-    """Output final JSON result to stdout."""
+    """Output final JSON result to stdout (a single summary line in ndjson mode)."""
+    if OUTPUT["format"] == "ndjson":
+        set_event_context()
+        emit_event("summary", **dict((k, v) for k, v in result_dict.items() if k not in STREAMED_LIST_KEYS))
+        return
     print(json.dumps(result_dict, ensure_ascii=False, indent=2), flush=True)
 
 
@@ -89,6 +320,332 @@ def default_output_path(prefix, ext):
     return str(DEFAULT_OUTPUT_DIR / ("%s_%s%s" % (prefix, ts, ext)))
 
 
+# Error Classification
+
+class PermanentError(RuntimeError):
+    """Submit error that will not succeed on retry (auth, invalid template, exhausted quota)."""
+
+
+def is_permanent_error(message, http_code=None):
+    """Classify an error as permanent (do not retry) or transient."""
+    if http_code is not None and http_code in PERMANENT_HTTP_CODES:
+        return True
+    text = (message or "").lower()
+    return bool(PERMANENT_ERROR_RE.search(text)) or any(marker in text for marker in PERMANENT_ERROR_MARKERS)
+
+
+def submit_error(service, message, http_code=None):
+    """Build the exception for a failed submit, permanent if classified as such."""
+    if is_permanent_error(message, http_code):
+        return PermanentError("%s submit failed (permanent): %s" % (service, message))
+    return RuntimeError("%s submit failed: %s" % (service, message))
+
+
+# Cost Ledger
+
+LEDGER_LOCK = threading.Lock()
+
+
+def estimate_cost(params=None):
+    """Estimated points for one LiblibAI task, from resolution, steps and imgCount."""
+    gen = build_gen_params("", params)
+    scale = (gen["width"] * gen["height"]) / float(COST_BASE_PIXELS)
+    return round(COST_PER_BASE_IMAGE * scale * gen["steps"] / float(COST_BASE_STEPS) * gen["imgCount"], 2)
+
+
+def ledger_append(entry, ledger_path=None):
+    """Append one task record to the local JSONL cost ledger."""
+    path = Path(ledger_path) if ledger_path else DEFAULT_LEDGER_PATH
+    entry = dict(entry)
+    entry.setdefault("ts", time.strftime("%Y-%m-%dT%H:%M:%S"))
+    try:
+        with LEDGER_LOCK:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with open(path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+    except OSError as e:
+        log("WARNING: Failed to write ledger %s: %s" % (path, e))
+
+
+def ledger_load(ledger_path=None):
+    """Read all ledger records; unreadable lines are skipped."""
+    return read_jsonl(Path(ledger_path) if ledger_path else DEFAULT_LEDGER_PATH)
+
+
+def read_jsonl(path):
+    entries = []
+    if not path.exists():
+        return entries
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                continue
+    return entries
+
+
+def render_samples(params=None, history=None, statuses=("success",)):
+    """
+    LiblibAI render times from the ledger for this template/resolution/steps, or for all
+    renders when there are none for this configuration yet. Pass statuses=("success", "timeout")
+    to include the stuck tasks in a latency distribution.
+    """
+    gen = build_gen_params("", params)
+    template = (params or {}).get("templateUuid", LIBLIB_TEMPLATE)
+    done = [e for e in (history or []) if e.get("service") == "liblib"
+            and e.get("status") in statuses and e.get("elapsed_seconds")]
+    same = [e["elapsed_seconds"] for e in done
+            if e.get("template") == template and e.get("width") == gen["width"]
+            and e.get("height") == gen["height"] and e.get("steps") == gen["steps"]]
+    return same or [e["elapsed_seconds"] for e in done]
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a non-empty sequence."""
+    ordered = sorted(values)
+    rank = max(1, int(-(-pct * len(ordered) // 100)))
+    return ordered[rank - 1]
+
+
+def estimate_render_seconds(params=None, history=None):
+    """Median historical render time for this template/resolution/steps, else DEFAULT_RENDER_ESTIMATE."""
+    samples = render_samples(params, history)
+    if samples:
+        return round(statistics.median(samples), 1)
+    return float(DEFAULT_RENDER_ESTIMATE)
+
+
+class HedgePolicy:
+    """
+    When to hedge a slow LiblibAI task: once it has run for after_seconds (the historical p95),
+    one duplicate is submitted and whichever finishes first wins. At most max_hedges duplicates
+    are submitted over the policy's lifetime. `remaining` (optional) returns the points left in
+    the caller's budget, not counting the task in flight; a hedge that would overrun it is refused.
+    """
+
+    def __init__(self, after_seconds, max_hedges, remaining=None):
+        self.after_seconds = after_seconds
+        self.max_hedges = max_hedges
+        self.remaining = remaining
+        self.lock = threading.Lock()
+        self.hedges = 0
+        self.wins = 0
+        self.over_budget = False
+
+    def allow(self, elapsed, task_cost=0.0):
+        """task_cost: what the task would cost in total, the hedge included."""
+        if self.after_seconds is None or elapsed < self.after_seconds:
+            return False
+        with self.lock:
+            if self.hedges >= self.max_hedges:
+                return False
+            left = self.remaining() if self.remaining else None
+            if left is not None and task_cost > left:
+                if not self.over_budget:
+                    log("[BUDGET] Hedge would exceed budget (%.2f > %.2f left), not hedging" % (task_cost, left))
+                self.over_budget = True
+                return False
+            self.hedges += 1
+            return True
+
+    def record_win(self):
+        with self.lock:
+            self.wins += 1
+
+
+def hedge_policy_for(history, params=None, hedge_after=None, hedge_percentile=DEFAULT_HEDGE_PERCENTILE,
+                     max_hedges=0, remaining=None):
+    """HedgePolicy from ledger history; hedging stays off until HEDGE_MIN_SAMPLES renders are recorded."""
+    samples = render_samples(params, history)
+    if hedge_after is None and len(samples) >= HEDGE_MIN_SAMPLES:
+        hedge_after = percentile(samples, hedge_percentile)
+    if hedge_after is None and max_hedges > 0:
+        log("Hedging off: %d render times in ledger, need %d (or pass --hedge-after)"
+            % (len(samples), HEDGE_MIN_SAMPLES))
+    return HedgePolicy(hedge_after, max_hedges, remaining)
+
+
+# Performance Database
+#
+# One row per batch run and per attempted item in .sprite_cli/perf.sqlite3, so latency can be
+# split into provider queue time, render time, our polling, download and local post-processing
+# and compared across weeks (`perf report`). The JSONL cost ledger stays the per-task record
+# that cost and hedging estimates read.
+
+PERF_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY, command TEXT, spec TEXT, started REAL, finished REAL,
+    total INTEGER, succeeded INTEGER, skipped INTEGER, failed INTEGER, cost REAL,
+    elapsed_seconds REAL, color_seconds REAL, commit_seconds REAL);
+CREATE TABLE IF NOT EXISTS items (
+    id INTEGER PRIMARY KEY, run_id INTEGER REFERENCES runs(id), ts REAL, name TEXT, category TEXT,
+    status TEXT, template TEXT, width INTEGER, height INTEGER, steps INTEGER, queue_seconds REAL,
+    render_seconds REAL, polls INTEGER, bytes INTEGER, download_seconds REAL, post_seconds REAL,
+    retries INTEGER, hedged INTEGER, cost REAL, elapsed_seconds REAL);
+CREATE INDEX IF NOT EXISTS items_ts ON items(ts);
+"""
+PERF_ITEM_FIELDS = ("name", "category", "status", "template", "width", "height", "steps", "queue_seconds",
+                    "render_seconds", "polls", "bytes", "download_seconds", "post_seconds", "retries", "hedged",
+                    "cost", "elapsed_seconds")
+# (report name, items column, percentile or None for the mean); higher is worse for all of them
+PERF_METRICS = (("render_p50", "render_seconds", 50), ("render_p95", "render_seconds", 95),
+                ("queue_p50", "queue_seconds", 50), ("polls_mean", "polls", None),
+                ("download_p50", "download_seconds", 50), ("post_p50", "post_seconds", 50),
+                ("retries_mean", "retries", None))
+
+
+def perf_open(db_path=None):
+    """Open (creating if needed) the performance database; None when it cannot be opened."""
+    path = Path(db_path) if db_path else DEFAULT_PERF_DB
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        db = sqlite3.connect(str(path))
+        db.row_factory = sqlite3.Row
+        db.executescript(PERF_SCHEMA)
+        return db
+    except (OSError, sqlite3.Error) as e:
+        log("WARNING: Performance database %s unavailable: %s" % (path, e))
+        return None
+
+
+def perf_start_run(db, command, spec=None):
+    """Record a new run; returns its id, or None (closing db) when it cannot be recorded."""
+    if db is None:
+        return None
+    try:
+        with db:
+            return db.execute("INSERT INTO runs (command, spec, started) VALUES (?, ?, ?)",
+                              (command, str(spec) if spec else None, time.time())).lastrowid
+    except sqlite3.Error as e:
+        log("WARNING: Performance recording off for this run: %s" % e)
+        db.close()
+        return None
+
+
+def perf_add_item(db, run_id, metrics):
+    """Record one attempted item; metrics keys are PERF_ITEM_FIELDS (missing ones stay NULL)."""
+    if db is None:
+        return
+    try:
+        with db:
+            db.execute("INSERT INTO items (run_id, ts, %s) VALUES (?, ?, %s)"
+                       % (", ".join(PERF_ITEM_FIELDS), ", ".join("?" * len(PERF_ITEM_FIELDS))),
+                       [run_id, time.time()] + [metrics.get(k) for k in PERF_ITEM_FIELDS])
+    except sqlite3.Error as e:
+        log("WARNING: Performance record not written: %s" % e)
+
+
+def perf_finish_run(db, run_id, summary, color_seconds=None, commit_seconds=None):
+    if db is None:
+        return
+    try:
+        with db:
+            db.execute("UPDATE runs SET finished=?, total=?, succeeded=?, skipped=?, failed=?, cost=?, "
+                       "elapsed_seconds=?, color_seconds=?, commit_seconds=? WHERE id=?",
+                       (time.time(), summary.get("total"), summary.get("succeeded"), summary.get("skipped"),
+                        summary.get("failed"), summary.get("cost_spent"), summary.get("elapsed_seconds"),
+                        color_seconds, commit_seconds, run_id))
+    except sqlite3.Error as e:
+        log("WARNING: Performance run not finished: %s" % e)
+    finally:
+        db.close()
+
+
+def perf_local_seconds(db_path=None):
+    """Median download + post-processing seconds of past successful items (0.0 without history)."""
+    path = Path(db_path) if db_path else DEFAULT_PERF_DB
+    if not path.exists():
+        return 0.0
+    db = perf_open(path)
+    if db is None:
+        return 0.0
+    try:
+        rows = db.execute("SELECT COALESCE(download_seconds, 0) + COALESCE(post_seconds, 0) FROM items "
+                          "WHERE status = 'success' ORDER BY ts DESC LIMIT 500").fetchall()
+    finally:
+        db.close()
+    return round(statistics.median(r[0] for r in rows), 1) if rows else 0.0
+
+
+def perf_metrics(rows):
+    """PERF_METRICS plus failure_rate over item rows; metrics without samples are None."""
+    done = [r for r in rows if r["status"] == "success"]
+    out = {"items": len(rows),
+           "failure_rate": round(sum(1 for r in rows if r["status"] != "success") / float(len(rows)), 3)
+           if rows else None}
+    for name, column, pct in PERF_METRICS:
+        values = [r[column] for r in (rows if column == "retries" else done) if r[column] is not None]
+        if not values:
+            out[name] = None
+        elif pct is None:
+            out[name] = round(statistics.mean(values), 2)
+        else:
+            out[name] = round(percentile(values, pct), 2)
+    return out
+
+
+def perf_regressions(baseline, recent, threshold=PERF_REGRESSION_THRESHOLD, min_samples=PERF_MIN_SAMPLES):
+    """Metrics where the recent window is worse than the baseline by more than threshold (relative)."""
+    flagged = []
+    if baseline["items"] < min_samples or recent["items"] < min_samples:
+        return flagged
+    for name in ["failure_rate"] + [m[0] for m in PERF_METRICS]:
+        before, after = baseline.get(name), recent.get(name)
+        if before is None or after is None:
+            continue
+        if name == "failure_rate":
+            worse = after - before > PERF_FAILURE_DELTA
+        else:
+            worse = after - before > max(PERF_MIN_DELTA, threshold * before)
+        if worse:
+            flagged.append({"metric": name, "baseline": before, "recent": after,
+                            "change": round((after - before) / before, 3) if before else None})
+    return flagged
+
+
+def perf_report(db, days, window_days, baseline_days, bucket="week", threshold=PERF_REGRESSION_THRESHOLD):
+    """Trend per day/week, percentiles per template/resolution, and baseline-vs-recent regressions."""
+    now = time.time()
+    since = now - max(days, window_days + baseline_days) * 86400
+    rows = db.execute("SELECT * FROM items WHERE ts >= ? ORDER BY ts", (since,)).fetchall()
+    runs = db.execute("SELECT * FROM runs WHERE started >= ? ORDER BY started", (since,)).fetchall()
+    fmt = "%G-W%V" if bucket == "week" else "%Y-%m-%d"
+    periods = {}
+    for r in rows:
+        if r["ts"] >= now - days * 86400:
+            periods.setdefault(time.strftime(fmt, time.localtime(r["ts"])), []).append(r)
+    run_periods = {}
+    for r in runs:
+        run_periods.setdefault(time.strftime(fmt, time.localtime(r["started"])), []).append(r)
+    trend = []
+    for period, members in sorted(periods.items()):
+        entry = {"period": period, "runs": len(run_periods.get(period, []))}
+        entry.update(perf_metrics(members))
+        run_seconds = [r["elapsed_seconds"] for r in run_periods.get(period, []) if r["elapsed_seconds"] is not None]
+        entry["run_seconds_mean"] = round(statistics.mean(run_seconds), 1) if run_seconds else None
+        trend.append(entry)
+    groups = {}
+    for r in rows:
+        groups.setdefault((r["template"], r["width"], r["height"], r["steps"]), []).append(r)
+    by_config = []
+    for (template, width, height, steps), members in sorted(groups.items(), key=lambda g: -len(g[1])):
+        renders = [r["render_seconds"] for r in members if r["status"] == "success" and r["render_seconds"] is not None]
+        queues = [r["queue_seconds"] for r in members if r["queue_seconds"] is not None]
+        entry = {"template": template, "resolution": "%sx%s" % (width, height), "steps": steps, "items": len(members)}
+        for name, values, pct in (("render_p50", renders, 50), ("render_p95", renders, 95),
+                                  ("render_p99", renders, 99), ("queue_p50", queues, 50)):
+            entry[name] = round(percentile(values, pct), 2) if values else None
+        by_config.append(entry)
+    window_start = now - window_days * 86400
+    baseline_start = window_start - baseline_days * 86400
+    baseline = perf_metrics([r for r in rows if baseline_start <= r["ts"] < window_start])
+    recent = perf_metrics([r for r in rows if r["ts"] >= window_start])
+    return {"runs": len(runs), "items": len(rows), "trend": trend, "by_config": by_config,
+            "baseline": dict(baseline, days=baseline_days), "recent": dict(recent, days=window_days),
+            "regressions": perf_regressions(baseline, recent, threshold)}
+
+
 # Credential Loading
 
 def load_config(config_path=None, tripo_key_override=None):
@@ -119,6 +676,133 @@ def load_config(config_path=None, tripo_key_override=None):
     return result
 
 
+# Completion Callbacks
+#
+# Optional local HTTP receiver for provider completion notifications (--callback-port, with
+# --callback-url as the public address when tunnelled). A notification only wakes the waiting
+# job; the status API stays the source of truth, polled every --verify-interval seconds instead
+# of every --poll-interval, so a spoofed or lost notification costs at most one extra poll.
+# Ids nobody is watching yet are kept for CALLBACK_PENDING_TTL seconds (at most
+# CALLBACK_PENDING_MAX of them), and bodies over CALLBACK_MAX_BODY bytes are refused.
+# LiblibAI receives the URL per task as callbackUrl; Tripo3D webhooks are configured in its
+# dashboard and should point at the same URL.
+
+CALLBACK_PATH = "/callback"
+CALLBACK_TASK_KEYS = ("generateUuid", "task_id", "taskId", "uuid")
+CALLBACK = {"server": None, "url": None, "verify_interval": DEFAULT_VERIFY_INTERVAL}
+CALLBACK_LOCK = threading.Lock()
+CALLBACK_WATCHERS = {}
+CALLBACK_PENDING = {}  # task id -> arrival time, for notifications ahead of their watch
+CALLBACK_PENDING_TTL = 600
+CALLBACK_PENDING_MAX = 1000
+CALLBACK_MAX_BODY = 64 * 1024
+
+
+def callback_task_ids(payload):
+    """Task ids named in a notification body (top level or under "data")."""
+    ids = []
+    for obj in (payload, payload.get("data") if isinstance(payload, dict) else None):
+        if isinstance(obj, dict):
+            ids.extend(str(obj[k]) for k in CALLBACK_TASK_KEYS if obj.get(k))
+    return ids
+
+
+def callback_notify(task_id):
+    with CALLBACK_LOCK:
+        event = CALLBACK_WATCHERS.get(task_id)
+        if event is None:
+            now = time.time()
+            CALLBACK_PENDING.pop(task_id, None)
+            CALLBACK_PENDING[task_id] = now
+            # Oldest first: drop expired ids, then the oldest beyond the cap
+            for stale in list(CALLBACK_PENDING):
+                expired = now - CALLBACK_PENDING[stale] > CALLBACK_PENDING_TTL
+                if not expired and len(CALLBACK_PENDING) <= CALLBACK_PENDING_MAX:
+                    break
+                del CALLBACK_PENDING[stale]
+    if event is not None:
+        event.set()
+
+
+def callback_watch(task_id, event):
+    """Route notifications for task_id to event (including one that arrived before the watch)."""
+    with CALLBACK_LOCK:
+        CALLBACK_WATCHERS[task_id] = event
+        arrived = CALLBACK_PENDING.pop(task_id, None)
+        early = arrived is not None and time.time() - arrived <= CALLBACK_PENDING_TTL
+    if early:
+        event.set()
+
+
+def callback_unwatch(task_ids):
+    with CALLBACK_LOCK:
+        for task_id in task_ids:
+            CALLBACK_WATCHERS.pop(task_id, None)
+
+
+class CallbackHandler(http.server.BaseHTTPRequestHandler):
+    def log_message(self, fmt, *args):
+        pass
+
+    def do_POST(self):
+        if urllib.parse.urlsplit(self.path).path.rstrip("/") != CALLBACK_PATH:
+            self.send_error(404)
+            return
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            length = -1
+        if length < 0:
+            self.send_error(400, "Bad Content-Length")
+            return
+        if length > CALLBACK_MAX_BODY:
+            self.send_error(413)
+            return
+        try:
+            payload = json.loads(self.rfile.read(length).decode("utf-8") or "{}")
+        except ValueError:
+            payload = {}
+        task_ids = callback_task_ids(payload)
+        for task_id in task_ids:
+            callback_notify(task_id)
+        emit_event("progress", stage="callback", task_ids=task_ids)
+        body = json.dumps({"ok": True}).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def callback_start(port, public_url=None, host=DEFAULT_CALLBACK_HOST, verify_interval=DEFAULT_VERIFY_INTERVAL):
+    """Start the receiver in a background thread; returns the URL providers should notify."""
+    server = http.server.ThreadingHTTPServer((host, port), CallbackHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = public_url.rstrip("/") if public_url else "http://%s:%d" % (host, server.server_address[1])
+    CALLBACK.update({"server": server, "url": base + CALLBACK_PATH, "verify_interval": verify_interval})
+    log("Callback receiver on %s:%d, notify URL %s (verify every %ds)"
+        % (host, server.server_address[1], CALLBACK["url"], verify_interval))
+    return CALLBACK["url"]
+
+
+def callback_stop():
+    server = CALLBACK["server"]
+    if server is not None:
+        server.shutdown()
+        server.server_close()
+    CALLBACK.update({"server": None, "url": None})
+
+
+def wait_for_update(event, poll_interval, remaining):
+    """Sleep one poll interval, or with a receiver running, until notified or the verify interval passes."""
+    if CALLBACK["server"] is None:
+        time.sleep(poll_interval)
+        return
+    event.wait(max(0.0, min(CALLBACK["verify_interval"], remaining)))
+    event.clear()
+
+
 # LiblibAI API Functions
 
 def liblib_sign(secret_key, uri):
@@ -132,13 +816,13 @@ def liblib_sign(secret_key, uri):
     return sig, ts, nonce
 
 
-def liblib_text2img(access_key, secret_key, prompt, params=None):
-    uri = "/api/generate/webui/text2img"
-    sig, ts, nonce = liblib_sign(secret_key, uri)
-    url = "{0}{1}?AccessKey={2}&Signature={3}&Timestamp={4}&SignatureNonce={5}".format(
-        LIBLIB_BASE, uri,
-        urllib.parse.quote(access_key), urllib.parse.quote(sig), ts, nonce
-    )
+def compose_prompt(prefix, prompt):
+    """Join a style prefix and an item prompt the way every subcommand does."""
+    return (prefix + ", " + prompt) if prefix else prompt
+
+
+def build_gen_params(prompt, params=None):
+    """LiblibAI generateParams: defaults overridden by any supplied params."""
     gen_params = {
         "prompt": prompt, "steps": DEFAULT_STEPS,
         "width": DEFAULT_GEN_WIDTH, "height": DEFAULT_GEN_HEIGHT,
@@ -148,8 +832,22 @@ def liblib_text2img(access_key, secret_key, prompt, params=None):
         for k in ("steps", "width", "height", "imgCount", "seed", "restoreFaces"):
             if k in params:
                 gen_params[k] = params[k]
+    return gen_params
+
+
+def liblib_text2img(access_key, secret_key, prompt, params=None):
+    uri = "/api/generate/webui/text2img"
+    sig, ts, nonce = liblib_sign(secret_key, uri)
+    url = "{0}{1}?AccessKey={2}&Signature={3}&Timestamp={4}&SignatureNonce={5}".format(
+        LIBLIB_BASE, uri,
+        urllib.parse.quote(access_key), urllib.parse.quote(sig), ts, nonce
+    )
+    gen_params = build_gen_params(prompt, params)
     template_uuid = (params or {}).get("templateUuid", LIBLIB_TEMPLATE)
-    body = json.dumps({"templateUuid": template_uuid, "generateParams": gen_params}).encode("utf-8")
+    payload = {"templateUuid": template_uuid, "generateParams": gen_params}
+    if CALLBACK["url"]:
+        payload["callbackUrl"] = CALLBACK["url"]
+    body = json.dumps(payload).encode("utf-8")
     req = urllib.request.Request(url, data=body, method="POST")
     req.add_header("Content-Type", "application/json")
     try:
@@ -159,7 +857,9 @@ def liblib_text2img(access_key, secret_key, prompt, params=None):
                 uuid = data["data"].get("generateUuid")
                 if uuid:
                     return uuid
-            raise RuntimeError("LiblibAI submit failed: %s" % json.dumps(data, ensure_ascii=False))
+            raise submit_error("LiblibAI", json.dumps(data, ensure_ascii=False))
+    except urllib.error.HTTPError as e:
+        raise submit_error("LiblibAI", "HTTP %d %s" % (e.code, e.reason), e.code)
     except urllib.error.URLError as e:
         raise RuntimeError("LiblibAI network error: %s" % e)
 
@@ -193,35 +893,114 @@ def liblib_status(access_key, secret_key, uuid):
                 if status in ("FAILED", 4, "4"):
                     err = d.get("failReason") or d.get("message") or "unknown failure"
                     return {"status": "failed", "error": err}
-                return {"status": "processing"}
+                # 1: waiting for a worker, 2: rendering
+                return {"status": "processing", "queued": status in (1, "1")}
         return {"status": "error", "error": "invalid response"}
     except urllib.error.URLError as e:
         return {"status": "error", "error": "network error: %s" % e}
 
 
 def liblib_generate_and_wait(access_key, secret_key, prompt, params=None,
-                             timeout=DEFAULT_TIMEOUT, poll_interval=DEFAULT_POLL_INTERVAL):
+                             timeout=DEFAULT_TIMEOUT, poll_interval=DEFAULT_POLL_INTERVAL,
+                             ledger_path=None, hedge=None):
     start = time.time()
     try:
         task_id = liblib_text2img(access_key, secret_key, prompt, params)
     except RuntimeError as e:
         return {"ok": False, "task_id": None, "status": "submit_failed",
-                "error": str(e), "elapsed_seconds": round(time.time() - start, 1)}
+                "error": str(e), "retryable": not isinstance(e, PermanentError),
+                "elapsed_seconds": round(time.time() - start, 1)}
     log("Task submitted: %s" % task_id)
+    emit_event("progress", stage="submitted", service="liblib", task_id=task_id)
+    gen = build_gen_params(prompt, params)
+    cost = estimate_cost(params)
+    started = {task_id: start}
+    notified = threading.Event()
+    callback_watch(task_id, notified)
+
+    def submit_hedge():
+        try:
+            hedge_id = liblib_text2img(access_key, secret_key, prompt, params)
+        except RuntimeError as e:
+            log("WARNING: Hedge submit failed: %s" % e)
+            return None
+        started[hedge_id] = time.time()
+        callback_watch(hedge_id, notified)
+        log("Task %s past %.0fs, hedge submitted: %s" % (task_id, hedge.after_seconds, hedge_id))
+        emit_event("progress", stage="hedged", service="liblib", task_id=hedge_id, primary_task_id=task_id)
+        return hedge_id
+    result = {"ok": False, "task_id": task_id, "status": "interrupted", "error": "interrupted"}
+    try:
+        result = liblib_wait(access_key, secret_key, task_id, start, timeout, poll_interval, hedge, submit_hedge,
+                             notified, cost)
+    finally:
+        callback_unwatch(started)
+        result["cost"] = round(cost * len(started), 2)
+        if len(started) > 1:
+            result["hedged"] = True
+            result["hedge_cost"] = round(cost * (len(started) - 1), 2)
+        now = time.time()
+        for tid, tid_start in started.items():
+            # Renders are timed from their own submit; the abandoned side of a hedge is not a sample
+            won = tid == result["task_id"]
+            status = result["status"] if won or result["status"] != "success" else "abandoned"
+            ledger_append({"service": "liblib", "task_id": tid,
+                           "template": (params or {}).get("templateUuid", LIBLIB_TEMPLATE),
+                           "width": gen["width"], "height": gen["height"], "steps": gen["steps"],
+                           "img_count": gen["imgCount"], "cost": cost, "status": status,
+                           "elapsed_seconds": round(now - tid_start, 1),
+                           "hedge": tid != task_id}, ledger_path)
+    return result
+
+
+def liblib_wait(access_key, secret_key, task_id, start, timeout=DEFAULT_TIMEOUT,
+                poll_interval=DEFAULT_POLL_INTERVAL, hedge=None, submit_hedge=None, notified=None, task_cost=0.0):
+    """
+    Poll a submitted LiblibAI task until success, failure or timeout (measured from start).
+    With a HedgePolicy, a task running past its threshold gets one duplicate from submit_hedge();
+    the first of the two to succeed wins and the other is abandoned. task_cost (one render's
+    points) goes to the policy's budget check. `notified` is the event a callback receiver sets
+    to trigger the next poll early. Results carry "polls" (status calls) and "queue_seconds"
+    (when a poll last saw the task still waiting for a worker).
+    """
+    notified = notified or threading.Event()
+    active = [task_id]
+    hedged = False
+    stats = {"polls": 0, "queue_seconds": 0.0}
     while True:
         elapsed = time.time() - start
         if elapsed > timeout:
-            return {"ok": False, "task_id": task_id, "status": "timeout",
-                    "error": "timeout after %ds" % int(elapsed), "elapsed_seconds": round(elapsed, 1)}
-        time.sleep(poll_interval)
-        result = liblib_status(access_key, secret_key, task_id)
-        if result["status"] == "success":
-            return {"ok": True, "task_id": task_id, "status": "success",
-                    "image_url": result.get("image_url", ""), "elapsed_seconds": round(time.time() - start, 1)}
-        if result["status"] in ("failed", "error"):
-            return {"ok": False, "task_id": task_id, "status": result["status"],
-                    "error": result.get("error", "unknown"), "elapsed_seconds": round(time.time() - start, 1)}
-        log("Polling... elapsed=%ds status=%s" % (int(elapsed), result["status"]))
+            return dict(stats, ok=False, task_id=task_id, status="timeout",
+                        error="timeout after %ds" % int(elapsed), elapsed_seconds=round(elapsed, 1))
+        wait_for_update(notified, poll_interval, timeout - elapsed)
+        if hedge is not None and not hedged and hedge.allow(time.time() - start, 2 * task_cost):
+            hedged = True
+            hedge_id = submit_hedge()
+            if hedge_id:
+                active.append(hedge_id)
+        for tid in list(active):
+            result = liblib_status(access_key, secret_key, tid)
+            stats["polls"] += 1
+            if tid == task_id and result.get("queued"):
+                stats["queue_seconds"] = round(time.time() - start, 1)
+            if result["status"] == "success":
+                if tid != task_id:
+                    hedge.record_win()
+                    log("Hedge %s finished first, abandoning %s" % (tid, task_id))
+                return dict(stats, ok=True, task_id=tid, status="success", image_url=result.get("image_url", ""),
+                            elapsed_seconds=round(time.time() - start, 1))
+            if result["status"] in ("failed", "error") and len(active) > 1:
+                log("Task %s %s (%s), still waiting on %s" % (tid, result["status"], result.get("error", "unknown"),
+                                                                [t for t in active if t != tid][0]))
+                active.remove(tid)
+            elif result["status"] in ("failed", "error"):
+                return dict(stats, ok=False, task_id=tid, status=result["status"], error=result.get("error", "unknown"),
+                            retryable=not is_permanent_error(result.get("error")),
+                            elapsed_seconds=round(time.time() - start, 1))
+        log("Polling... elapsed=%ds status=%s%s" % (int(elapsed), result["status"],
+                                                   " (hedged)" if len(active) > 1 else ""))
+        emit_event("progress", stage="polling", service="liblib", task_id=task_id,
+                   elapsed_seconds=int(elapsed), status=result["status"])
 
 
 # Tripo3D API Functions
@@ -233,7 +1012,7 @@ def tripo_create_task(api_key, task_type, prompt=None, image_url=None):
     elif task_type == "image_to_model" and image_url:
         payload["image_url"] = image_url
     else:
-        raise RuntimeError("Invalid task_type or missing prompt/image_url")
+        raise PermanentError("Invalid task_type or missing prompt/image_url")
     body = json.dumps(payload).encode("utf-8")
     req = urllib.request.Request(TRIPO_BASE + "/task", data=body, method="POST")
     req.add_header("Content-Type", "application/json")
@@ -244,7 +1023,9 @@ def tripo_create_task(api_key, task_type, prompt=None, image_url=None):
             tid = data.get("data", {}).get("task_id") or data.get("task_id")
             if tid:
                 return tid
-            raise RuntimeError("Tripo3D submit failed: %s" % json.dumps(data, ensure_ascii=False))
+            raise submit_error("Tripo3D", json.dumps(data, ensure_ascii=False))
+    except urllib.error.HTTPError as e:
+        raise submit_error("Tripo3D", "HTTP %d %s" % (e.code, e.reason), e.code)
     except urllib.error.URLError as e:
         raise RuntimeError("Tripo3D network error: %s" % e)
 
@@ -276,20 +1057,34 @@ def tripo_get_task(api_key, task_id):
 
 
 def tripo_generate_and_wait(api_key, task_type, prompt=None, image_url=None,
-                            timeout=600, poll_interval=DEFAULT_POLL_INTERVAL):
+                            timeout=DEFAULT_MODEL_TIMEOUT, poll_interval=DEFAULT_POLL_INTERVAL):
     start = time.time()
     try:
         task_id = tripo_create_task(api_key, task_type, prompt, image_url)
     except RuntimeError as e:
         return {"ok": False, "task_id": None, "status": "submit_failed",
-                "error": str(e), "elapsed_seconds": round(time.time() - start, 1)}
+                "error": str(e), "retryable": not isinstance(e, PermanentError),
+                "elapsed_seconds": round(time.time() - start, 1)}
     log("Tripo3D task submitted: %s" % task_id)
+    emit_event("progress", stage="submitted", service="tripo", task_id=task_id)
+    notified = threading.Event()
+    callback_watch(task_id, notified)
+    try:
+        return tripo_wait(api_key, task_id, start, timeout, poll_interval, notified)
+    finally:
+        callback_unwatch([task_id])
+
+
+def tripo_wait(api_key, task_id, start, timeout=DEFAULT_MODEL_TIMEOUT, poll_interval=DEFAULT_POLL_INTERVAL,
+               notified=None):
+    """Poll a submitted Tripo3D task until success, failure or timeout (measured from start)."""
+    notified = notified or threading.Event()
     while True:
         elapsed = time.time() - start
         if elapsed > timeout:
             return {"ok": False, "task_id": task_id, "status": "timeout",
                     "error": "timeout after %ds" % int(elapsed), "elapsed_seconds": round(elapsed, 1)}
-        time.sleep(poll_interval)
+        wait_for_update(notified, poll_interval, timeout - elapsed)
         result = tripo_get_task(api_key, task_id)
         if result["status"] == "success" and result.get("model_url"):
             return {"ok": True, "task_id": task_id, "status": "success",
@@ -298,206 +1093,2953 @@ def tripo_generate_and_wait(api_key, task_type, prompt=None, image_url=None,
             return {"ok": False, "task_id": task_id, "status": result["status"],
                     "error": result.get("error", "unknown"), "elapsed_seconds": round(time.time() - start, 1)}
         log("Polling Tripo3D... elapsed=%ds status=%s" % (int(elapsed), result["status"]))
+        emit_event("progress", stage="polling", service="tripo", task_id=task_id,
+                   elapsed_seconds=int(elapsed), status=result["status"])
 
 
 # File Operations
 
-def download_file(url, output_path):
-    output_path = Path(output_path)
-    output_path.parent.mkdir(parents=True, exist_ok=True)
+def download_bytes(url):
     try:
         with urllib.request.urlopen(url, timeout=120) as resp:
-            data = resp.read()
-        with open(output_path, "wb") as f:
-            f.write(data)
-        log("Downloaded: %s (%d bytes)" % (output_path, len(data)))
-        return output_path
+            return resp.read()
     except Exception as e:
         raise RuntimeError("Download failed (%s): %s" % (url, e))
 
 
-def resize_image(input_path, width, height):
+def download_file(url, output_path, writer=None, transform=None, stats=None):
+    """
+    Download url to output_path in one write; transform (bytes -> bytes) runs in memory first.
+    With a writer the file is staged and only lands on commit. A stats dict gets "bytes" and
+    "download_seconds".
+    """
+    output_path = Path(output_path)
+    start = time.time()
+    data = download_bytes(url)
+    if stats is not None:
+        stats.update(bytes=len(data), download_seconds=round(time.time() - start, 2))
+    write_output(output_path, data, writer, transform)
+    log("Downloaded: %s (%d bytes)" % (output_path, len(data)))
+    emit_event("progress", stage="downloaded", output_path=str(output_path), bytes=len(data))
+    return output_path
+
+
+def resize_png(data, width, height):
+    """Image bytes resized to width x height and re-encoded as PNG, without touching disk."""
+    Image = require_pillow()
+    with Image.open(io.BytesIO(data)) as img:
+        img = img.convert("RGBA").resize((width, height), Image.LANCZOS)
+    buf = io.BytesIO()
+    img.save(buf, "PNG")
+    return buf.getvalue()
+
+
+def resized_output(path, width, height):
+    """(output path, transform) for a download resized to width x height; (path, None) without Pillow."""
     try:
-        from PIL import Image
-    except ImportError:
+        require_pillow()
+    except RuntimeError:
         log("WARNING: Pillow not installed, skipping resize. Install with: pip install Pillow")
-        return input_path
-    input_path = Path(input_path)
-    img = Image.open(input_path).convert("RGBA")
-    img = img.resize((width, height), Image.LANCZOS)
-    out_path = input_path.with_suffix(".png")
-    img.save(out_path)
-    if out_path != input_path:
-        input_path.unlink(missing_ok=True)
-    log("Resized to %dx%d: %s" % (width, height, out_path))
-    return out_path
+        return Path(path), None
+    return Path(path).with_suffix(".png"), lambda data: resize_png(data, width, height)
 
 
-# Subcommand: ui
+def atomic_write(path, data):
+    """Write via a hidden temp file in the same folder and rename, so watchers never see a partial file."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.parent / ("." + path.name + ".part~")
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(str(tmp), str(path))
 
-def cmd_ui(args):
-    creds = load_config(args.config)
-    if not creds["liblib_access_key"] or not creds["liblib_secret_key"]:
-        emit_result({"ok": False, "command": "ui", "error": "Missing LiblibAI credentials."})
-        return 1
-    prefix = args.style_prefix if args.style_prefix is not None else BASE_PROMPT
-    full_prompt = (prefix + ", " + args.prompt) if prefix else args.prompt
-    params = {"steps": args.steps, "width": args.gen_width, "height": args.gen_height,
-              "imgCount": args.img_count, "seed": args.seed}
-    if args.template_uuid:
-        params["templateUuid"] = args.template_uuid
-    log("Generating UI image...")
-    log("Prompt: %s" % full_prompt)
-    result = liblib_generate_and_wait(
-        creds["liblib_access_key"], creds["liblib_secret_key"],
-        full_prompt, params, args.timeout, args.poll_interval
-    )
-    if result["ok"] and not args.no_download:
-        output_path = args.output or default_output_path("ui", ".png")
-        try:
-            download_file(result["image_url"], output_path)
-            if args.width and args.height and not args.no_resize:
-                resize_image(output_path, args.width, args.height)
-            result["output_path"] = str(Path(output_path).resolve())
-        except RuntimeError as e:
-            result["ok"] = False
-            result["error"] = str(e)
-    if args.width: result["width"] = args.width
-    if args.height: result["height"] = args.height
-    result["command"] = "ui"
-    result["prompt"] = full_prompt
-    emit_result(result)
-    return 0 if result["ok"] else 1
 
+def write_output(path, data, writer=None, transform=None):
+    """Stage on the writer when given, otherwise write atomically now."""
+    if writer is not None:
+        writer.stage(path, data, transform)
+    else:
+        atomic_write(path, transform(data) if transform else data)
 
-# Subcommand: model
 
-def cmd_model(args):
-    creds = load_config(args.config, tripo_key_override=args.tripo_key)
-    if not creds["tripo_api_key"]:
-        emit_result({"ok": False, "command": "model", "error": "Missing Tripo3D API key."})
-        return 1
-    task_type = args.type
-    if task_type == "text_to_model" and not args.prompt:
-        emit_result({"ok": False, "command": "model", "error": "text_to_model requires --prompt"})
-        return 1
-    if task_type == "image_to_model" and not args.image_url:
-        emit_result({"ok": False, "command": "model", "error": "image_to_model requires --image-url"})
-        return 1
-    log("Generating 3D model (%s)..." % task_type)
-    result = tripo_generate_and_wait(
-        creds["tripo_api_key"], task_type,
-        prompt=args.prompt, image_url=args.image_url,
-        timeout=args.timeout, poll_interval=args.poll_interval
-    )
-    if result["ok"] and not args.no_download:
-        output_path = args.output or default_output_path("model", ".glb")
-        try:
-            download_file(result["model_url"], output_path)
-            result["output_path"] = str(Path(output_path).resolve())
-        except RuntimeError as e:
-            result["ok"] = False
-            result["error"] = str(e)
-    result["command"] = "model"
-    result["type"] = task_type
-    emit_result(result)
-    return 0 if result["ok"] else 1
+def move_into_place(src, dest):
+    """os.replace, falling back to copy + rename in the destination folder across volumes."""
+    try:
+        os.replace(str(src), str(dest))
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        tmp = dest.parent / ("." + dest.name + ".part~")
+        shutil.copyfile(str(src), str(tmp))
+        os.replace(str(tmp), str(dest))
+        os.unlink(str(src))
 
 
-# Subcommand: batch
+class OutputWriter:
+    """
+    Output stage for batch runs. Encoding and writing happen on a bounded thread pool into a
+    staging folder; commit() then moves every finished file into place in staging order (asset
+    before its .meta), so Unity's watcher sees one settled change set instead of a stream of
+    partial writes and rewrites. Post-processing works on the staged copy via local().
+    """
 
-def cmd_batch(args):
-    creds = load_config(args.config)
-    if not creds["liblib_access_key"] or not creds["liblib_secret_key"]:
-        emit_result({"ok": False, "command": "batch", "error": "Missing LiblibAI credentials."})
-        return 1
-    try:
-        with open(args.spec, "r", encoding="utf-8") as f:
-            spec = json.load(f)
-    except Exception as e:
-        emit_result({"ok": False, "command": "batch", "error": "Failed to load spec: %s" % e})
-        return 1
-    items = spec.get("items", [])
-    if not items:
-        emit_result({"ok": False, "command": "batch", "error": "No items in spec."})
-        return 1
-    if args.style_prefix is not None:
-        style_prefix = args.style_prefix
+    def __init__(self, threads=DEFAULT_WRITER_THREADS, staging_dir=None):
+        self.root = Path(staging_dir or DEFAULT_STAGING_DIR) / ("%d-%d" % (os.getpid(), int(time.time() * 1000)))
+        self.pool = concurrent.futures.ThreadPoolExecutor(max_workers=max(1, threads))
+        # Backpressure: at most two writes queued per thread, each holding its bytes in memory
+        self.slots = threading.BoundedSemaphore(max(1, threads) * 2)
+        self.staged = {}
+        self.count = 0
+        self.committed = 0
+        self.errors = []
+
+    def stage(self, dest, data, transform=None):
+        dest = Path(dest)
+        self.discard(dest)
+        self.count += 1
+        staging = self.root / ("%06d_%s" % (self.count, dest.name))
+        self.slots.acquire()
+
+        def write():
+            try:
+                body = transform(data) if transform else data
+                self.root.mkdir(parents=True, exist_ok=True)
+                with open(staging, "wb") as f:
+                    f.write(body)
+                return staging
+            finally:
+                self.slots.release()
+        self.staged[dest] = self.pool.submit(write)
+        return dest
+
+    def is_staged(self, dest):
+        return Path(dest) in self.staged
+
+    def local(self, dest):
+        """Where dest's bytes are right now: its staged copy (once written), or dest itself."""
+        future = self.staged.get(Path(dest))
+        return future.result() if future is not None else Path(dest)
+
+    def restage(self, dest):
+        """
+        Staged copy of dest, copying an already committed file back into staging first, so a
+        post-processing rewrite lands through commit() instead of in place.
+        """
+        dest = Path(dest)
+        if dest not in self.staged and dest.exists():
+            with open(dest, "rb") as f:
+                self.stage(dest, f.read())
+        return self.local(dest)
+
+    def move(self, dest, new_dest):
+        """Retarget a staged file (or move an already committed one)."""
+        dest, new_dest = Path(dest), Path(new_dest)
+        if dest in self.staged:
+            self.discard(new_dest)
+            self.staged[new_dest] = self.staged.pop(dest)
+        else:
+            new_dest.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(str(dest), str(new_dest))
+
+    def discard(self, dest):
+        future = self.staged.pop(Path(dest), None)
+        if future is not None:
+            try:
+                future.result().unlink()
+            except Exception:
+                pass
+
+    def commit(self):
+        """
+        Wait for pending writes, then move everything staged into place. A failed write or move
+        (e.g. a file Unity holds open) is recorded in errors and the rest still land.
+        Returns the number of files moved.
+        """
+        staged, self.staged = self.staged, {}
+        ready = []
+        for dest, future in staged.items():
+            try:
+                ready.append((dest, future.result()))
+            except Exception as e:
+                log("WARNING: Write failed for %s: %s" % (dest, e))
+                self.errors.append({"output_path": str(dest), "error": str(e)})
+        moved = 0
+        for dest, src in ready:
+            try:
+                dest.parent.mkdir(parents=True, exist_ok=True)
+                move_into_place(src, dest)
+                moved += 1
+            except OSError as e:
+                log("WARNING: Could not move %s into place: %s" % (dest, e))
+                self.errors.append({"output_path": str(dest), "error": str(e)})
+        self.committed += moved
+        if moved:
+            log("Committed %d file(s)" % moved)
+            emit_event("progress", stage="committed", files=moved)
+        return moved
+
+    def close(self):
+        try:
+            self.commit()
+        finally:
+            self.pool.shutdown()
+            shutil.rmtree(str(self.root), ignore_errors=True)
+        return self.committed
+
+
+# Spec Loading
+#
+# JSON specs ({"style_prefix", "output_root", "items": [...]}) are loaded whole. JSONL specs
+# (.jsonl / .ndjson) hold one item per line, optionally preceded by a {"spec": {...}} header
+# line with the same top-level keys; their items are streamed from disk, so memory stays flat
+# however many items a generated spec has.
+
+def open_spec(path):
+    """
+    Returns {"header": top-level keys, "total": item count, "items": fn returning an item iterator}.
+    JSONL lines are validated in a first streaming pass so a bad line fails before any submit.
+    """
+    if Path(path).suffix.lower() not in (".jsonl", ".ndjson"):
+        with open(path, "r", encoding="utf-8") as f:
+            spec = json.load(f)
+        items = spec.pop("items", [])
+        return {"header": spec, "total": len(items), "items": lambda: iter(items)}
+    header, total = {}, 0
+    for lineno, obj in read_spec_lines(path):
+        if lineno == 1 and "spec" in obj:
+            header = obj["spec"]
+        else:
+            total += 1
+    return {"header": header, "total": total,
+            "items": lambda: (obj for lineno, obj in read_spec_lines(path) if not (lineno == 1 and "spec" in obj))}
+
+
+def read_spec_lines(path):
+    """(line number, object) for each non-empty line of a JSONL spec."""
+    with open(path, "r", encoding="utf-8") as f:
+        for lineno, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                obj = json.loads(line)
+            except ValueError as e:
+                raise ValueError("%s line %d: %s" % (path, lineno, e))
+            if not isinstance(obj, dict):
+                raise ValueError("%s line %d: expected an object" % (path, lineno))
+            yield lineno, obj
+
+
+class ResultWriter:
+    """
+    Per-item entries of a batch run or dry-run: streamed as ndjson item events, written line by
+    line to a JSONL file (truncated first) when a path is given, and only kept for the final
+    JSON document when neither of those already carries them.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.file = None
+        if path:
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+            self.file = open(path, "w", encoding="utf-8")
+        self.items = [] if path is None and OUTPUT["format"] == "json" else None
+
+    def add(self, entry):
+        emit_event("item", **entry)
+        if self.file is not None:
+            self.file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            self.file.flush()
+        if self.items is not None:
+            self.items.append(entry)
+
+    def close(self, summary, key="results"):
+        """Finish the summary: the kept list under `key`, or the JSONL path."""
+        if self.file is not None:
+            self.file.close()
+            summary["results_path"] = str(Path(self.path).resolve())
+        if self.items is not None:
+            summary[key] = self.items
+        return summary
+
+
+# Prompt Templates
+#
+# Specs may describe prompts as templates instead of a fixed "style_prefix, prompt" join:
+#   {"prompt_template": "{style}, {prompt}, {palette} palette",
+#    "templates": {"icon": "{style}, game icon of {prompt}, {palette} palette, centered, plain background"},
+#    "vars": {"palette": "warm gold"},
+#    "items": [{"filename": "Icon_Sword.png", "template": "icon", "prompt": "a sword", "vars": {"palette": "steel"}}]}
+# Variables: style (the style prefix), prompt, category, name (filename stem), width, height, the
+# spec's "vars" and the item's "vars". Templates are parsed once per spec; comma-separated parts
+# left blank by empty variables are dropped, so an empty {style} leaves no dangling comma (literal
+# text such as "a,,b" is kept as written).
+
+# Stands in for an empty variable while rendering, so only the parts it blanked are dropped
+TEMPLATE_EMPTY = "\0"
+
+def compile_template(text):
+    """Parse a prompt template into (literal, variable or None) pairs."""
+    parts = []
+    for literal, field, format_spec, conversion in string.Formatter().parse(text):
+        if format_spec or conversion:
+            raise ValueError("format specs are not supported in prompt templates: %s" % text)
+        if field == "":
+            raise ValueError("empty {} in prompt template: %s" % text)
+        parts.append((literal, field))
+    return parts
+
+
+def render_template(parts, variables):
+    out = []
+    for literal, field in parts:
+        out.append(literal)
+        if field is not None:
+            if field not in variables:
+                raise ValueError("undefined template variable: %s" % field)
+            value = str(variables[field])
+            out.append(value if value.strip() else TEMPLATE_EMPTY)
+    segments = "".join(out).split(",")
+    kept = [seg for seg in segments if TEMPLATE_EMPTY not in seg or seg.replace(TEMPLATE_EMPTY, "").strip()]
+    return ",".join(kept).replace(TEMPLATE_EMPTY, "").strip()
+
+
+def template_mapping(value, what):
+    """A spec's "templates"/"vars" object ({} when absent); ValueError for anything but a JSON object."""
+    if value is None:
+        return {}
+    if not isinstance(value, dict):
+        raise ValueError("%s must be an object, got %s" % (what, type(value).__name__))
+    return value
+
+
+def prompt_compiler(header, style_prefix):
+    """
+    Returns item -> full prompt for a spec header (see above). Specs without templates keep
+    compose_prompt's plain join. Raises ValueError for malformed templates, unknown template
+    names and undefined variables.
+    """
+    named = {}
+    for name, text in template_mapping(header.get("templates"), '"templates"').items():
+        if not isinstance(text, str):
+            raise ValueError("prompt template %s must be a string" % name)
+        named[name] = compile_template(text)
+    default = header.get("prompt_template")
+    if default and not isinstance(default, str):
+        raise ValueError('"prompt_template" must be a string')
+    default = compile_template(default) if default else None
+    shared = template_mapping(header.get("vars"), '"vars"')
+
+    def compose(item):
+        name = item.get("template")
+        if name is not None and (not isinstance(name, str) or name not in named):
+            raise ValueError("unknown prompt template: %s" % name)
+        parts = named[name] if name is not None else default
+        if parts is None:
+            return compose_prompt(style_prefix, item.get("prompt", ""))
+        variables = dict(shared, style=style_prefix, prompt=item.get("prompt", ""),
+                         category=item.get("category", ""), name=Path(item.get("filename", "")).stem,
+                         width=item.get("width", ""), height=item.get("height", ""))
+        variables.update(template_mapping(item.get("vars"), 'item "vars"'))
+        return render_template(parts, variables)
+    return compose
+
+
+# Texture Post-processing (tiling)
+
+def require_pillow():
+    """Import Pillow's Image module lazily."""
+    try:
+        from PIL import Image
+    except ImportError:
+        raise RuntimeError("Pillow not installed. Install with: pip install Pillow")
+    return Image
+
+
+def load_rgba_array(np, path, dtype=None):
+    """Image file -> (h, w, 4) RGBA array, float32 unless another dtype is given."""
+    with require_pillow().open(path) as img:
+        return np.asarray(img.convert("RGBA"), dtype=dtype or np.float32)
+
+
+def save_rgba_array(np, pixels, path):
+    Image = require_pillow()
+    Image.fromarray(np.clip(np.rint(pixels), 0, 255).astype(np.uint8), "RGBA").save(path)
+
+
+def tile_seam_axis(np, rgb):
+    """Seam score across the wrap from the last column back to the first (rows along axis 0)."""
+    step = np.abs(np.diff(rgb, axis=1)).mean()
+    curve = np.abs(np.diff(rgb, n=2, axis=1)).mean()
+    wrap_step = np.abs(rgb[:, 0] - rgb[:, -1]).mean()
+    wrap_curve = 0.5 * (np.abs(rgb[:, 1] - 2 * rgb[:, 0] + rgb[:, -1]).mean()
+                        + np.abs(rgb[:, 0] - 2 * rgb[:, -1] + rgb[:, -2]).mean())
+    if curve <= TILE_CURVE_NEGLIGIBLE * step:
+        # Locally linear (gradients, soft noise): any wrap curvature dwarfs the interior's; score the step
+        return float(wrap_step / max(step, 1e-6))
+    return float(0.5 * (wrap_step / max(step, 1e-6) + wrap_curve / curve))
+
+
+def tile_seam_score(np, pixels):
+    """
+    How visible the seams are when the texture is tiled: the color step and the gradient
+    change (second difference) across each wrap edge, relative to an ordinary interior step;
+    the gradient change is left out on locally linear textures. About 1.0 for a seamless
+    texture. Returns (score, score_x, score_y).
+    """
+    rgb = pixels[..., :3]
+    score_x = tile_seam_axis(np, rgb)
+    score_y = tile_seam_axis(np, rgb.transpose(1, 0, 2))
+    return max(score_x, score_y), score_x, score_y
+
+
+def tile_blend_fix(np, pixels, blend_fraction=TILE_BLEND_FRACTION):
+    """
+    Offset-and-blend seam repair, one axis at a time: near each edge, cross-fade into a copy
+    of the texture shifted by half its size, whose edge pixels are neighbours in the
+    original. The interior is untouched and the result wraps seamlessly.
+    """
+    out = pixels
+    for axis in (1, 0):
+        n = out.shape[axis]
+        band = max(1, int(n * blend_fraction))
+        idx = np.arange(n)
+        weight = np.clip(1.0 - np.minimum(idx, n - 1 - idx) / float(band), 0.0, 1.0)
+        weight = weight[None, :, None] if axis == 1 else weight[:, None, None]
+        shifted = np.roll(out, n // 2, axis=axis)
+        out = out * (1.0 - weight) + shifted * weight
+    return out
+
+
+def item_is_tileable(item):
+    """Spec items are tileable when flagged "tileable", or by default in a terrain category."""
+    return bool(item.get("tileable", str(item.get("category", "")).lower() in TILEABLE_CATEGORIES))
+
+
+def check_tiling(path, threshold=TILE_SEAM_THRESHOLD, fix="blend"):
+    """
+    Score a texture's tiling seams; with fix="blend", repair it in place when over threshold.
+    Returns a report dict, or None when NumPy/Pillow are unavailable.
+    """
+    try:
+        np = require_numpy()
+        require_pillow()
+    except RuntimeError as e:
+        log("WARNING: Tiling check skipped: %s" % e)
+        return None
+    pixels = load_rgba_array(np, path)
+    score, score_x, score_y = tile_seam_score(np, pixels)
+    report = {"score": round(score, 3), "score_x": round(score_x, 3), "score_y": round(score_y, 3),
+              "threshold": threshold, "fixed": False}
+    if score > threshold and fix == "blend":
+        pixels = tile_blend_fix(np, pixels)
+        save_rgba_array(np, pixels, path)
+        score, score_x, score_y = tile_seam_score(np, pixels)
+        report.update({"fixed": True, "score_before": report["score"], "score": round(score, 3),
+                       "score_x": round(score_x, 3), "score_y": round(score_y, 3)})
+        log("Seam repair: %s (score %.2f -> %.2f)" % (path, report["score_before"], score))
+    report["ok"] = score <= threshold
+    return report
+
+
+# Texture Post-processing (9-slice)
+#
+# Stretchable frames only need their corners and one slice of each edge: the center run of
+# rows/columns that are (nearly) identical to their neighbours is what a sliced sprite
+# stretches. Borders are reported in pixels (left/right/top/bottom) and end up in the
+# sprite's .meta; with crop, the center is cut down to NINE_SLICE_KEEP pixels so one small
+# texture serves every size.
+
+def item_is_nine_slice(item):
+    """Spec items are 9-sliced when flagged "nine_slice", or by default for frame/panel filenames."""
+    hinted = any(hint in str(item.get("filename", "")).lower() for hint in NINE_SLICE_HINTS)
+    return bool(item.get("nine_slice", hinted))
+
+
+def nine_slice_flat_run(np, pixels, start, end, tolerance):
+    """
+    Longest sub-run of columns [start, end) that each stay within tolerance of the run's median
+    column, so a slow gradient (flat between neighbours, not flat overall) is not stretchable.
+    """
+    ref = np.median(pixels[:, start:end], axis=1)
+    dev = np.abs(pixels[:, start:end] - ref[:, None]).mean(axis=2)
+    ok = np.percentile(dev, NINE_SLICE_PERCENTILE, axis=0) <= tolerance
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], ok.astype(np.int8), [0]))))
+    if not len(edges):
+        return start, start
+    best = int(np.argmax(edges[1::2] - edges[0::2]))
+    return start + int(edges[0::2][best]), start + int(edges[1::2][best])
+
+
+def nine_slice_axis(np, pixels, tolerance=NINE_SLICE_TOLERANCE, min_center=NINE_SLICE_MIN_CENTER):
+    """
+    Columns [start, end) that can be stretched: the longest run of columns that differ by at most
+    tolerance from their neighbours and from the run's median column in (nearly) every row, not
+    touching the image edge. The 99th percentile over rows rather than the max keeps generation
+    noise from breaking runs while a corner or ornament spanning more than 1% of the rows still
+    does. (0, w) for a uniform image; None if the run is shorter than min_center of the width.
+    """
+    w = pixels.shape[1]
+    step = np.abs(np.diff(pixels, axis=1)).mean(axis=2)
+    flat = np.percentile(step, NINE_SLICE_PERCENTILE, axis=0) <= tolerance
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], flat.astype(np.int8), [0]))))
+    # Runs of flat steps i..j-1 cover columns i..j
+    runs = [(int(a), int(b) + 1) for a, b in zip(edges[0::2], edges[1::2])]
+    if runs == [(0, w)]:
+        start, end = nine_slice_flat_run(np, pixels, 0, w, tolerance)
+        if (start, end) == (0, w):
+            return 0, w
+        runs = [(start, end)] if start > 0 and end < w else []
+    best = None
+    for start, end in runs:
+        if start == 0 or end == w:
+            continue
+        start, end = nine_slice_flat_run(np, pixels, start, end, tolerance)
+        if best is None or end - start > best[1] - best[0]:
+            best = (start, end)
+    if best is None or best[1] - best[0] < max(2, min_center * w):
+        return None
+    return best
+
+
+def nine_slice_crop(np, pixels, span_x, span_y, keep=NINE_SLICE_KEEP):
+    """Cut the stretchable center down to `keep` rows/columns; borders and whole-image spans are unchanged."""
+    h, w = pixels.shape[:2]
+    if span_x and tuple(span_x) != (0, w):
+        cut = span_x[0] + min(keep, span_x[1] - span_x[0])
+        pixels = np.concatenate([pixels[:, :cut], pixels[:, span_x[1]:]], axis=1)
+    if span_y and tuple(span_y) != (0, h):
+        cut = span_y[0] + min(keep, span_y[1] - span_y[0])
+        pixels = np.concatenate([pixels[:cut], pixels[span_y[1]:]], axis=0)
+    return pixels
+
+
+def check_nine_slice(path, tolerance=NINE_SLICE_TOLERANCE, crop=False):
+    """
+    Detect 9-slice borders of a frame texture; with crop, shrink it in place to the minimal texture.
+    Returns a report dict ({} when nothing is stretchable), or None when NumPy/Pillow are unavailable.
+    """
+    try:
+        np = require_numpy()
+        require_pillow()
+    except RuntimeError as e:
+        log("WARNING: 9-slice detection skipped: %s" % e)
+        return None
+    pixels = load_rgba_array(np, path)
+    h, w = pixels.shape[:2]
+    # Compare premultiplied colour: whatever RGB is left under alpha 0 is invisible
+    visible = np.concatenate([pixels[..., :3] * (pixels[..., 3:] / 255.0), pixels[..., 3:]], axis=2)
+    span_x = nine_slice_axis(np, visible, tolerance)
+    span_y = nine_slice_axis(np, visible.transpose(1, 0, 2), tolerance)
+    if not span_x and not span_y:
+        log("9-slice: no stretchable region in %s" % path)
+        return {}
+    report = {"left": span_x[0] if span_x else 0, "right": w - span_x[1] if span_x else 0,
+              "top": span_y[0] if span_y else 0, "bottom": h - span_y[1] if span_y else 0,
+              "stretch_x": bool(span_x), "stretch_y": bool(span_y), "width": w, "height": h}
+    if crop:
+        pixels = nine_slice_crop(np, pixels, span_x, span_y)
+    if pixels.shape[:2] != (h, w):
+        save_rgba_array(np, pixels, path)
+        report.update({"cropped": True, "width": pixels.shape[1], "height": pixels.shape[0],
+                       "source_width": w, "source_height": h})
+    log("9-slice: %s borders L%d R%d T%d B%d (%dx%d)" % (path, report["left"], report["right"], report["top"],
+                                                         report["bottom"], report["width"], report["height"]))
+    return report
+
+
+# Texture Post-processing (color consistency)
+#
+# Renders from one style prefix still come back with different grading. Each image's opaque
+# pixels give a per-channel CDF; the group reference is the average of the per-image quantile
+# functions (the 1D Wasserstein barycenter), and each image is mapped onto it with a 256-entry
+# LUT per channel. The consistency score is 1 - mean |quantile - reference| / 255.
+
+def color_stats(np, pixels):
+    """
+    Per-channel CDFs (3, 256) and quantile functions (3, COLOR_LEVELS) of a uint8 RGBA image,
+    from every COLOR_SAMPLE_STRIDE-th row and column.
+    """
+    sample = pixels[::COLOR_SAMPLE_STRIDE, ::COLOR_SAMPLE_STRIDE]
+    rgb = sample[..., :3].reshape(-1, 3)
+    opaque = sample[..., 3].reshape(-1) > 0
+    if opaque.any() and not opaque.all():
+        rgb = rgb[opaque]
+    hist = np.bincount((rgb.astype(np.int64) + np.array([0, 256, 512])).ravel(), minlength=768)
+    cdf = np.cumsum(hist.reshape(3, 256), axis=1).astype(np.float64)
+    cdf /= np.maximum(cdf[:, -1:], 1.0)
+    levels = (np.arange(COLOR_LEVELS) + 0.5) / COLOR_LEVELS
+    quantiles = np.stack([np.searchsorted(cdf[c], levels) for c in range(3)]).astype(np.float64)
+    return cdf, quantiles
+
+
+def color_score(np, quantiles, reference):
+    return round(float(1.0 - np.abs(quantiles - reference).mean() / 255.0), 4)
+
+
+def color_lut(np, cdf, reference, strength=DEFAULT_COLOR_STRENGTH):
+    """(3, 256) uint8 LUT mapping each channel's distribution onto the reference quantiles."""
+    levels = (np.arange(COLOR_LEVELS) + 0.5) / COLOR_LEVELS
+    matched = np.stack([np.interp(cdf[c], levels, reference[c]) for c in range(3)])
+    identity = np.arange(256, dtype=np.float64)
+    return np.clip(np.rint(identity + strength * (matched - identity)), 0, 255).astype(np.uint8)
+
+
+def normalize_colors(reference_paths, target_paths, strength=DEFAULT_COLOR_STRENGTH, apply=True, output_paths=None):
+    """
+    Match target images to the reference built from reference_paths, in place or written to
+    output_paths (one per target). Returns {"reference_items", "results": [{"output_path",
+    "score_before", "score_after"?}]}, or None when NumPy/Pillow are unavailable.
+    """
+    try:
+        np = require_numpy()
+        require_pillow()
+    except RuntimeError as e:
+        log("WARNING: Color normalization skipped: %s" % e)
+        return None
+    Image = require_pillow()
+    targets = [str(p) for p in target_paths]
+    keep = set(targets) if apply else set()
+
+    def load(path):
+        with Image.open(path) as img:
+            img = img.convert("RGBA")
+        return path, color_stats(np, np.asarray(img)), img if path in keep else None
+
+    def correct(path, output):
+        (cdf, quantiles), img = loaded[path]
+        entry = {"output_path": output, "score_before": color_score(np, quantiles, reference)}
+        if apply:
+            lut = color_lut(np, cdf, reference, strength)
+            table = np.concatenate([lut.ravel(), np.arange(256, dtype=np.uint8)])
+            img.point(table.tolist()).save(output, compress_level=PNG_FAST_COMPRESS)
+            # The LUT is monotonic, so it maps quantiles to the new image's quantiles exactly
+            after = lut[np.arange(3)[:, None], quantiles.astype(np.intp)]
+            entry["score_after"] = color_score(np, after, reference)
+        return entry
+    # PNG decode/encode dominates and Pillow releases the GIL while doing it
+    with concurrent.futures.ThreadPoolExecutor(max_workers=min(8, os.cpu_count() or 1)) as pool:
+        loaded = dict((path, (stats, pixels)) for path, stats, pixels
+                      in pool.map(load, dict.fromkeys(map(str, list(reference_paths) + targets))))
+        reference = np.mean([loaded[str(p)][0][1] for p in reference_paths], axis=0)
+        results = list(pool.map(correct, targets, [str(p) for p in output_paths] if output_paths else targets))
+    return {"reference_items": len(reference_paths), "results": results}
+
+
+def normalize_batch_colors(pairs, group_by="category", strength=DEFAULT_COLOR_STRENGTH, local=Path, restage=None):
+    """
+    Normalize a finished batch given (item, result) pairs: per category (or the whole batch), the
+    reference comes from every output on disk (new and skipped) and only the images generated in
+    this run are corrected. Items with "color_normalize": false, cropped 9-slice frames and flipbook
+    sheets are left out. Adds a "color" entry to each corrected result; returns a summary dict.
+    local maps an output path to where its bytes currently are (OutputWriter.local); restage
+    (OutputWriter.restage) gives the copy a corrected target is written to, defaulting to local.
+    """
+    start = time.time()
+    groups = {}
+    for item, result in pairs:
+        path = result.get("output_path")
+        if (item.get("color_normalize", True) is False or (result.get("nine_slice") or {}).get("cropped")
+                or item.get("flipbook")
+                or result["status"] not in ("success", "skipped") or not path or not local(path).exists()):
+            continue
+        key = result.get("category", "") if group_by == "category" else ""
+        groups.setdefault(key, []).append(result)
+    summary = {"group_by": group_by, "strength": strength, "groups": {}}
+    for key, members in sorted(groups.items()):
+        targets = [r for r in members if r["status"] == "success"]
+        if not targets or len(members) < 2:
+            continue
+        report = normalize_colors([local(r["output_path"]) for r in members],
+                                  [(restage or local)(r["output_path"]) for r in targets], strength)
+        if report is None:
+            return None
+        for result, entry in zip(targets, report["results"]):
+            result["color"] = {"score_before": entry["score_before"], "score_after": entry["score_after"]}
+            emit_event("progress", stage="color", output_path=result["output_path"], **result["color"])
+        scores = [e["score_after"] for e in report["results"]]
+        summary["groups"][key or "batch"] = {"reference_items": report["reference_items"],
+                                             "corrected": len(targets), "min_score": min(scores)}
+    summary["seconds"] = round(time.time() - start, 2)
+    log("Color normalization: %d group(s) in %.2fs" % (len(summary["groups"]), summary["seconds"]))
+    return summary
+
+
+# VFX Flipbooks
+#
+# A flipbook is N renders of one prompt sharing a seed, each with an animation-phase suffix, so
+# the composition stays put while the effect grows and fades. Frames arrive out of order and are
+# analysed as they land: renders on an opaque background get an alpha keyed from brightness over
+# the border colour, then each frame is trimmed to its alpha bounding box. Packing keeps every
+# frame at its position in the render, around one pivot (the alpha-weighted centroid over all
+# frames) so the effect's own motion survives, inside one cell large enough for all of them,
+# scales the cells to the frame size and tiles them row-major into a tiles_x x tiles_y
+# sheet, the layout of the particle system's Texture Sheet Animation module (Grid, Whole Sheet).
+
+def flipbook_prompts(prompt, frames, frame_prompts=None):
+    """One prompt per frame: explicit frame_prompts, or prompt + animation phase."""
+    if frame_prompts:
+        return [compose_prompt(prompt, frame_prompts[i % len(frame_prompts)]) for i in range(frames)]
+    prompts = []
+    for i in range(frames):
+        phase = FLIPBOOK_PHASES[int(round(i * (len(FLIPBOOK_PHASES) - 1) / float(max(1, frames - 1))))]
+        prompts.append("%s, animation frame %d of %d, %s" % (prompt, i + 1, frames, phase))
+    return prompts
+
+
+def flipbook_frame(np, pixels):
+    """
+    Keyed, trimmed frame from a uint8 RGBA array: {"pixels", "pivot": (y, x) centroid within the
+    trimmed frame, "weight": total alpha, "bbox": [x, y, w, h] in the render}, or None when
+    nothing is above FLIPBOOK_ALPHA_TRIM.
+    """
+    pixels = pixels.astype(np.float32)
+    if pixels[..., 3].min() >= 250:
+        # No transparency from the renderer: alpha from brightness above the border colour
+        rgb = pixels[..., :3]
+        border = np.concatenate([rgb[0], rgb[-1], rgb[:, 0], rgb[:, -1]])
+        bg = np.median(border, axis=0)
+        alpha = np.abs(rgb - bg).max(axis=-1) / np.maximum(255.0 - bg.min(), 1.0)
+        pixels[..., 3] = np.clip(alpha * 255.0, 0, 255)
+    mask = pixels[..., 3] >= FLIPBOOK_ALPHA_TRIM
+    rows, cols = np.flatnonzero(mask.any(axis=1)), np.flatnonzero(mask.any(axis=0))
+    if not len(rows):
+        return None
+    y0, y1, x0, x1 = rows[0], rows[-1] + 1, cols[0], cols[-1] + 1
+    trimmed = pixels[y0:y1, x0:x1]
+    weight = trimmed[..., 3]
+    total = max(float(weight.sum()), 1e-6)
+    pivot = (float((weight.sum(axis=1) * np.arange(y1 - y0)).sum()) / total,
+             float((weight.sum(axis=0) * np.arange(x1 - x0)).sum()) / total)
+    return {"pixels": trimmed, "pivot": pivot, "weight": total,
+            "bbox": [int(x0), int(y0), int(x1 - x0), int(y1 - y0)]}
+
+
+def flipbook_pack(np, Image, frames, frame_size, columns=None):
+    """
+    Pack analysed frames (flipbook_frame results, in order) into a sheet.
+    Returns (uint8 RGBA sheet, tiles_x, tiles_y).
+    """
+    count = len(frames)
+    tiles_x = columns or int(np.ceil(np.sqrt(count)))
+    tiles_y = int(np.ceil(count / float(tiles_x)))
+    # One pivot for the whole animation, in render coordinates, then relative to each trimmed frame
+    weights = np.array([f["weight"] for f in frames])
+    centroids = np.array([[f["bbox"][1] + f["pivot"][0], f["bbox"][0] + f["pivot"][1]] for f in frames])
+    pivot_y, pivot_x = (centroids * weights[:, None]).sum(axis=0) / max(float(weights.sum()), 1e-6)
+    pivots = [(pivot_y - f["bbox"][1], pivot_x - f["bbox"][0]) for f in frames]
+    # Common cell: half extents around the pivot that fit every frame
+    ext = np.array([[p[0], f["pixels"].shape[0] - p[0], p[1], f["pixels"].shape[1] - p[1]]
+                    for f, p in zip(frames, pivots)])
+    half_h, half_w = float(ext[:, :2].max()), float(ext[:, 2:].max())
+    cell_h, cell_w = int(np.ceil(2 * half_h)), int(np.ceil(2 * half_w))
+    fw, fh = frame_size
+    scale = min(fw / float(cell_w), fh / float(cell_h))
+    size = (max(1, int(round(cell_w * scale))), max(1, int(round(cell_h * scale))))
+    off_x, off_y = (fw - size[0]) // 2, (fh - size[1]) // 2
+    cells = np.zeros((tiles_x * tiles_y, fh, fw, 4), dtype=np.uint8)
+    for i, (f, p) in enumerate(zip(frames, pivots)):
+        cell = np.zeros((cell_h, cell_w, 4), dtype=np.float32)
+        h, w = f["pixels"].shape[:2]
+        top, left = int(round(half_h - p[0])), int(round(half_w - p[1]))
+        top, left = min(max(top, 0), cell_h - h), min(max(left, 0), cell_w - w)
+        cell[top:top + h, left:left + w] = f["pixels"]
+        img = Image.fromarray(np.clip(np.rint(cell), 0, 255).astype(np.uint8), "RGBA").resize(size, Image.LANCZOS)
+        cells[i, off_y:off_y + size[1], off_x:off_x + size[0]] = np.asarray(img)
+    sheet = cells.reshape(tiles_y, tiles_x, fh, fw, 4).transpose(0, 2, 1, 3, 4).reshape(tiles_y * fh, tiles_x * fw, 4)
+    return sheet, tiles_x, tiles_y
+
+
+def flipbook_metadata(frame_results, tiles_x, tiles_y, frame_size, fps, seed):
+    """Sidecar for the Texture Sheet Animation module (Unity's row-major, top-left-first frame order)."""
+    fw, fh = frame_size
+    frames = len(frame_results)
+    return {"frames": frames, "tiles_x": tiles_x, "tiles_y": tiles_y, "frame_width": fw, "frame_height": fh,
+            "fps": fps, "duration_seconds": round(frames / float(fps), 3), "seed": seed, "pivot": [0.5, 0.5],
+            "texture_sheet_animation": {"mode": "Grid", "numTilesX": tiles_x, "numTilesY": tiles_y,
+                                        "animation": "WholeSheet", "startFrame": 0,
+                                        "frameOverTime": [[0.0, 0.0], [1.0, frames / float(tiles_x * tiles_y)]],
+                                        "cycleCount": 1},
+            "frame_list": [dict(r, index=i, rect=[(i % tiles_x) * fw, (i // tiles_x) * fh, fw, fh])
+                           for i, r in enumerate(frame_results)]}
+
+
+def generate_flipbook(creds, prompt, output, opts):
+    """
+    Render opts["frames"] frames concurrently and pack them into `output` (+ .flipbook.json).
+    opts: frames, frame_size (w, h), columns, fps, seed, params, frame_prompts, submit_delay,
+    timeout, poll_interval, max_retries, retry_delay, ledger, and an optional OutputWriter (writer).
+    Returns a result dict with "ok", "cost" and the sheet/metadata paths.
+    """
+    np, Image = require_numpy(), require_pillow()
+    output = Path(output).with_suffix(".png")
+    frames_dir = output.parent / (output.stem + FLIPBOOK_FRAMES_SUFFIX)
+    count = opts["frames"]
+    seed = opts.get("seed")
+    if seed is None or seed < 0:
+        seed = random.randint(1, 2 ** 31 - 1)
+    params = dict(opts.get("params") or {}, seed=seed)
+    prompts = flipbook_prompts(prompt, count, opts.get("frame_prompts"))
+    gate = SubmitGate(opts["submit_delay"])
+    start = time.time()
+
+    def render(index):
+        costs = []
+
+        def attempt():
+            gate.wait()
+            log("[frame %d/%d] Submitting..." % (index + 1, count))
+            gen = liblib_generate_and_wait(creds["liblib_access_key"], creds["liblib_secret_key"], prompts[index],
+                                           params, opts["timeout"], opts["poll_interval"], opts.get("ledger"))
+            costs.append(gen.get("cost", 0.0))
+            return gen
+        gen, error = retry_call("[frame %d/%d]" % (index + 1, count), attempt, opts["max_retries"], opts["retry_delay"])
+        return gen, error, sum(costs)
+    analysed = [None] * count
+    frame_results = [None] * count
+    errors = []
+    cost = 0.0
+    with concurrent.futures.ThreadPoolExecutor(max_workers=count) as pool:
+        futures = dict((pool.submit(render, i), i) for i in range(count))
+        # Download and analyse each frame as it lands, while the rest are still rendering
+        for future in concurrent.futures.as_completed(futures):
+            index = futures[future]
+            gen, error, frame_cost = future.result()
+            cost += frame_cost
+            if gen is None:
+                errors.append("frame %d: %s" % (index + 1, error))
+                continue
+            try:
+                path = download_file(gen["image_url"], frames_dir / ("frame_%02d.png" % index))
+                frame = flipbook_frame(np, load_rgba_array(np, path, np.uint8))
+            except (RuntimeError, OSError) as e:
+                errors.append("frame %d: %s" % (index + 1, e))
+                continue
+            if frame is None:
+                errors.append("frame %d: empty after alpha trim" % (index + 1))
+                continue
+            analysed[index] = frame
+            frame_results[index] = {"task_id": gen["task_id"], "prompt": prompts[index], "source_bbox": frame["bbox"]}
+            emit_event("progress", stage="frame", frame=index + 1, frames=count, task_id=gen["task_id"])
+    result = {"ok": False, "output_path": str(output.resolve()), "frames": count, "seed": seed,
+              "frames_dir": str(frames_dir.resolve()), "cost": round(cost, 2),
+              "elapsed_seconds": round(time.time() - start, 1)}
+    if errors:
+        result["error"] = "; ".join(sorted(errors))
+        return result
+    sheet, tiles_x, tiles_y = flipbook_pack(np, Image, analysed, opts["frame_size"], opts.get("columns"))
+    buf = io.BytesIO()
+    Image.fromarray(sheet, "RGBA").save(buf, "PNG", compress_level=PNG_FAST_COMPRESS)
+    write_output(output, buf.getvalue(), opts.get("writer"))
+    metadata = flipbook_metadata(frame_results, tiles_x, tiles_y, opts["frame_size"], opts["fps"], seed)
+    metadata_path = output.with_suffix(".flipbook.json")
+    write_output(metadata_path, json.dumps(metadata, indent=2, ensure_ascii=False).encode("utf-8"), opts.get("writer"))
+    log("Flipbook packed: %s (%dx%d tiles)" % (output, tiles_x, tiles_y))
+    result.update({"ok": True, "tiles_x": tiles_x, "tiles_y": tiles_y, "sheet_size": [sheet.shape[1], sheet.shape[0]],
+                   "metadata_path": str(metadata_path.resolve())})
+    return result
+
+
+# Visual Regression (screenshots vs mockups)
+#
+# Each screenshot is matched to the mockup whose screen name (UI_<Name>.png -> "name") appears
+# in its filename, center-cropped to the mockup's aspect ratio and both are downscaled to
+# COMPARE_MAX_SIDE. Scores: mean SSIM over COMPARE_WINDOW-pixel windows of the luma (box
+# filter via integral images), and the fraction of pixels whose CIE76 delta E exceeds
+# COMPARE_DELTA_E. The heatmap paints 1 - SSIM in red over the greyed mockup.
+
+def screen_key(name):
+    """Lowercase alphanumerics of a file stem, without the UI_ prefix."""
+    if name.upper().startswith("UI_"):
+        name = name[3:]
+    return "".join(c for c in name.lower() if c.isalnum())
+
+
+def mockup_index(mockup_dirs):
+    """{screen key: mockup path} for the PNGs under mockup_dirs."""
+    index = {}
+    for d in mockup_dirs:
+        for path in sorted(Path(d).rglob("*.png")):
+            index.setdefault(screen_key(path.stem), path)
+    return index
+
+
+def match_mockup(screenshot, index):
+    """Mockup whose screen name occurs in the screenshot's filename; the longest name wins."""
+    key = screen_key(Path(screenshot).stem)
+    found = [k for k in index if k and k in key]
+    return index[max(found, key=len)] if found else None
+
+
+def box_mean(np, a, win):
+    """Mean over every win x win window ("valid" size), from an integral image."""
+    c = np.pad(a, ((1, 0), (1, 0))).cumsum(axis=0).cumsum(axis=1)
+    return (c[win:, win:] - c[:-win, win:] - c[win:, :-win] + c[:-win, :-win]) / float(win * win)
+
+
+def ssim_map(np, x, y, win=COMPARE_WINDOW):
+    """SSIM per window of two (h, w) luma arrays in 0..255 (sample covariance, as in skimage)."""
+    c1, c2 = (0.01 * 255) ** 2, (0.03 * 255) ** 2
+    mx, my = box_mean(np, x, win), box_mean(np, y, win)
+    norm = win * win / (win * win - 1.0)
+    vx = (box_mean(np, x * x, win) - mx * mx) * norm
+    vy = (box_mean(np, y * y, win) - my * my) * norm
+    cov = (box_mean(np, x * y, win) - mx * my) * norm
+    return ((2 * mx * my + c1) * (2 * cov + c2)) / ((mx * mx + my * my + c1) * (vx + vy + c2))
+
+
+def rgb_to_lab(np, rgb):
+    """(..., 3) sRGB 0..255 -> CIELAB (D65)."""
+    c = rgb / 255.0
+    c = np.where(c > 0.04045, ((c + 0.055) / 1.055) ** 2.4, c / 12.92)
+    xyz = c @ np.array([[0.4124, 0.2126, 0.0193], [0.3576, 0.7152, 0.1192], [0.1805, 0.0722, 0.9505]])
+    xyz /= np.array([0.95047, 1.0, 1.08883])
+    f = np.where(xyz > 0.008856, np.cbrt(xyz), 7.787 * xyz + 16.0 / 116)
+    return np.stack([116 * f[..., 1] - 16, 500 * (f[..., 0] - f[..., 1]), 200 * (f[..., 1] - f[..., 2])], axis=-1)
+
+
+def compare_load(Image, screenshot, mockup, max_side):
+    """Both images as RGB at the mockup's aspect ratio, longest side at most max_side."""
+    with Image.open(mockup) as img:
+        ref = img.convert("RGB")
+    with Image.open(screenshot) as img:
+        shot = img.convert("RGB")
+    scale = min(1.0, float(max_side) / max(ref.size))
+    size = (max(1, int(round(ref.width * scale))), max(1, int(round(ref.height * scale))))
+    # Center-crop the screenshot to the mockup's aspect ratio (letterboxing, other resolutions)
+    aspect = ref.width / float(ref.height)
+    w, h = shot.size
+    cw, ch = (min(w, int(round(h * aspect))), min(h, int(round(w / aspect))))
+    left, top = (w - cw) // 2, (h - ch) // 2
+    shot = shot.crop((left, top, left + cw, top + ch))
+    return ref.resize(size, Image.BOX), shot.resize(size, Image.BOX)
+
+
+def compare_screenshot(job):
+    """
+    Score one (screenshot, mockup, max_side, heatmap path or None, delta_e) job. Top-level so
+    it can run in a worker process; returns a result dict.
+    """
+    screenshot, mockup, max_side, heatmap, delta_e = job
+    np, Image = require_numpy(), require_pillow()
+    ref, shot = compare_load(Image, screenshot, mockup, max_side)
+    a = np.asarray(ref, dtype=np.float64)
+    b = np.asarray(shot, dtype=np.float64)
+    luma = np.array([0.299, 0.587, 0.114])
+    smap = ssim_map(np, a @ luma, b @ luma, min(COMPARE_WINDOW, min(ref.size)))
+    de = np.sqrt(((rgb_to_lab(np, a) - rgb_to_lab(np, b)) ** 2).sum(axis=-1))
+    result = {"screenshot": str(screenshot), "mockup": str(mockup), "size": list(ref.size),
+              "ssim": round(float(smap.mean()), 4), "mean_delta_e": round(float(de.mean()), 2),
+              "changed_fraction": round(float((de > delta_e).mean()), 4)}
+    if heatmap:
+        pad = (a.shape[0] - smap.shape[0]) // 2, (a.shape[1] - smap.shape[1]) // 2
+        heat = np.clip(1.0 - np.pad(smap, ((pad[0], a.shape[0] - smap.shape[0] - pad[0]),
+                                           (pad[1], a.shape[1] - smap.shape[1] - pad[1])), mode="edge"), 0, 1)
+        grey = (a @ luma) * 0.5
+        rgb = np.stack([grey + heat * (255 - grey), grey * (1 - heat), grey * (1 - heat)], axis=-1)
+        Path(heatmap).parent.mkdir(parents=True, exist_ok=True)
+        Image.fromarray(np.clip(np.rint(rgb), 0, 255).astype(np.uint8), "RGB").save(heatmap, compress_level=PNG_FAST_COMPRESS)
+        result["heatmap"] = str(heatmap)
+    return result
+
+
+# Unity Asset Metadata
+#
+# Writing the .meta next to each output lets the editor import it once with the right
+# TextureImporter settings instead of importing with defaults and needing a manual reimport.
+# GUIDs are derived from the project-relative path, so reruns produce identical files.
+
+UNITY_TEXTURE_META = """fileFormatVersion: 2
+guid: %(guid)s
+TextureImporter:
+  internalIDToNameTable: []
+  externalObjects: {}
+  serializedVersion: 13
+  mipmaps:
+    mipMapMode: 0
+    enableMipMap: %(enable_mip)d
+    sRGBTexture: 1
+    linearTexture: 0
+    fadeOut: 0
+    borderMipMap: 0
+    mipMapsPreserveCoverage: 0
+    alphaTestReferenceValue: 0.5
+    mipMapFadeDistanceStart: 1
+    mipMapFadeDistanceEnd: 3
+  bumpmap:
+    convertToNormalMap: 0
+    externalNormalMap: 0
+    heightScale: 0.25
+    normalMapFilter: 0
+    flipGreenChannel: 0
+  isReadable: 0
+  streamingMipmaps: 0
+  streamingMipmapsPriority: 0
+  vTOnly: 0
+  ignoreMipmapLimit: 0
+  grayScaleToAlpha: 0
+  generateCubemap: 6
+  cubemapConvolution: 0
+  seamlessCubemap: 0
+  textureFormat: 1
+  maxTextureSize: %(max_size)d
+  textureSettings:
+    serializedVersion: 2
+    filterMode: 1
+    aniso: 1
+    mipBias: 0
+    wrapU: %(wrap)d
+    wrapV: %(wrap)d
+    wrapW: 0
+  nPOTScale: %(npot)d
+  lightmap: 0
+  compressionQuality: 50
+  spriteMode: %(sprite_mode)d
+  spriteExtrude: 1
+  spriteMeshType: %(mesh_type)d
+  alignment: 0
+  spritePivot: {x: 0.5, y: 0.5}
+  spritePixelsToUnits: 100
+  spriteBorder: {x: %(border_left)d, y: %(border_bottom)d, z: %(border_right)d, w: %(border_top)d}
+  spriteGenerateFallbackPhysicsShape: 1
+  alphaUsage: 1
+  alphaIsTransparency: %(alpha_transparency)d
+  spriteTessellationDetail: -1
+  textureType: %(texture_type)d
+  textureShape: 1
+  singleChannelComponent: 0
+  flipbookRows: 1
+  flipbookColumns: 1
+  maxTextureSizeSet: 0
+  compressionQualitySet: 0
+  textureFormatSet: 0
+  ignorePngGamma: 0
+  applyGammaDecoding: 0
+  swizzle: 50462976
+  cookieLightType: 0
+  platformSettings:
+  - serializedVersion: 3
+    buildTarget: DefaultTexturePlatform
+    maxTextureSize: %(max_size)d
+    resizeAlgorithm: 0
+    textureFormat: -1
+    textureCompression: 1
+    compressionQuality: 50
+    crunchedCompression: 0
+    allowsAlphaSplitting: 0
+    overridden: 0
+    ignorePlatformSupport: 0
+    androidETC2FallbackOverride: 0
+    forceMaximumCompressionQuality_BC6H_BC7: 0
+  - serializedVersion: 3
+    buildTarget: Standalone
+    maxTextureSize: %(max_size)d
+    resizeAlgorithm: 0
+    textureFormat: -1
+    textureCompression: 1
+    compressionQuality: 50
+    crunchedCompression: 0
+    allowsAlphaSplitting: 0
+    overridden: 0
+    ignorePlatformSupport: 0
+    androidETC2FallbackOverride: 0
+    forceMaximumCompressionQuality_BC6H_BC7: 0
+  - serializedVersion: 3
+    buildTarget: WebGL
+    maxTextureSize: %(max_size)d
+    resizeAlgorithm: 0
+    textureFormat: -1
+    textureCompression: 1
+    compressionQuality: 50
+    crunchedCompression: 0
+    allowsAlphaSplitting: 0
+    overridden: 0
+    ignorePlatformSupport: 0
+    androidETC2FallbackOverride: 0
+    forceMaximumCompressionQuality_BC6H_BC7: 0
+  - serializedVersion: 3
+    buildTarget: Android
+    maxTextureSize: %(max_size)d
+    resizeAlgorithm: 0
+    textureFormat: -1
+    textureCompression: 1
+    compressionQuality: 50
+    crunchedCompression: 0
+    allowsAlphaSplitting: 0
+    overridden: 0
+    ignorePlatformSupport: 0
+    androidETC2FallbackOverride: 0
+    forceMaximumCompressionQuality_BC6H_BC7: 0
+  spriteSheet:
+    serializedVersion: 2
+    sprites: []
+    outline: []
+    physicsShape: []
+    bones: []
+    spriteID: %(sprite_id)s
+    internalID: 0
+    vertices: []
+    indices: 
+    edges: []
+    weights: []
+    secondaryTextures: []
+    nameFileIdTable: {}
+  mipmapLimitGroupName: 
+  pSDRemoveMatte: 0
+  userData: 
+  assetBundleName: 
+  assetBundleVariant: 
+"""
+
+UNITY_FOLDER_META = """fileFormatVersion: 2
+guid: %(guid)s
+folderAsset: yes
+DefaultImporter:
+  externalObjects: {}
+  userData: 
+  assetBundleName: 
+  assetBundleVariant: 
+"""
+
+
+def unity_asset_path(path):
+    """(project_root, "Assets/...") for a path inside a Unity project, or None."""
+    path = Path(path).resolve()
+    for parent in path.parents:
+        if parent.name == UNITY_ASSETS_DIR:
+            return parent.parent, path.relative_to(parent.parent).as_posix()
+    return None
+
+
+def unity_guid(asset_path):
+    return hashlib.md5(asset_path.encode("utf-8")).hexdigest()
+
+
+def read_meta_guid(meta_path):
+    try:
+        with open(meta_path, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("guid:"):
+                    return line.split(":", 1)[1].strip()
+    except OSError:
+        pass
+    return None
+
+
+def unity_texture_preset(item):
+    """Importer preset name for a spec item: explicit "importer", else by category / filename prefix."""
+    if item.get("importer"):
+        return item["importer"]
+    category = str(item.get("category", "")).lower()
+    filename = str(item.get("filename", "")).lower()
+    if category in TILEABLE_CATEGORIES or filename.startswith("ground_"):
+        return "terrain"
+    if category in VFX_CATEGORIES or filename.startswith("vfx_"):
+        return "vfx"
+    return "sprite"
+
+
+def write_folder_metas(project_root, asset_dir, writer=None):
+    """Write .meta files for folders under Assets/ that don't have one yet."""
+    parts = asset_dir.split("/")
+    for depth in range(2, len(parts) + 1):
+        folder = "/".join(parts[:depth])
+        meta_path = project_root / (folder + ".meta")
+        if not meta_path.exists() and not (writer and writer.is_staged(meta_path)):
+            write_output(meta_path, (UNITY_FOLDER_META % {"guid": unity_guid(folder)}).encode("utf-8"), writer)
+
+
+def write_unity_meta(path, preset="sprite", mode="missing", nine_slice=None, writer=None):
+    """
+    Write <path>.meta with a deterministic GUID and the preset's TextureImporter settings.
+    mode="missing" leaves existing .meta files alone; "refresh" rewrites the settings but keeps
+    the existing GUID so references survive. A nine_slice report sets the sprite border (and a
+    Full Rect mesh, which sliced drawing needs). Returns the .meta path, or None when skipped.
+    """
+    if mode == "off":
+        return None
+    located = unity_asset_path(path)
+    if located is None:
+        return None
+    if preset not in UNITY_TEXTURE_PRESETS:
+        raise ValueError("unknown importer preset: %s" % preset)
+    project_root, asset_path = located
+    meta_path = Path(str(path) + ".meta")
+    guid = read_meta_guid(meta_path) if meta_path.exists() else None
+    if guid and mode != "refresh":
+        return None
+    guid = guid or unity_guid(asset_path)
+    write_folder_metas(project_root, asset_path.rsplit("/", 1)[0], writer)
+    border = nine_slice or {}
+    fields = dict(UNITY_TEXTURE_PRESETS[preset], guid=guid, max_size=UNITY_MAX_TEXTURE_SIZE,
+                  sprite_id=unity_guid(guid + ":sprite") if preset == "sprite" else "",
+                  mesh_type=0 if border else 1)
+    for side in ("left", "right", "top", "bottom"):
+        fields["border_" + side] = border.get(side, 0)
+    write_output(meta_path, (UNITY_TEXTURE_META % fields).encode("utf-8"), writer)
+    return meta_path
+
+
+# Asset Store
+#
+# Generated outputs and their variants packed into one append-only blob file plus a JSONL
+# index (one record per stored output: name, variant, sha256, offset, length, metadata).
+# Identical content is stored once; reads are zero-copy slices of a memory-mapped pack.
+# Everything lives under .sprite_cli/store, which Unity ignores; `store checkout` writes
+# the selected variants into Assets/.
+
+STORE_LOCK = threading.Lock()
+
+
+def store_open(store_dir=None):
+    """Load a store's index; returns a store dict for store_put/store_read. Release with store_close."""
+    root = Path(store_dir) if store_dir else DEFAULT_STORE_DIR
+    store = {"root": root, "pack": root / STORE_PACK_NAME, "index": root / STORE_INDEX_NAME,
+             "records": read_jsonl(root / STORE_INDEX_NAME), "by_hash": {}, "by_name": {},
+             "mmap": None, "view": None}
+    for record in store["records"]:
+        store["by_hash"].setdefault(record["hash"], record)
+        store["by_name"].setdefault(record.get("name"), []).append(record)
+    return store
+
+
+def store_close(store):
+    if store["mmap"] is not None:
+        try:
+            store["view"].release()
+            store["mmap"].close()
+        except BufferError:
+            pass  # slices still reference the mapping; it is unmapped when they are collected
+    store["mmap"] = store["view"] = None
+
+
+def store_read(store, record):
+    """Zero-copy memoryview of a record's bytes (remaps when the pack has grown since the last read)."""
+    end = record["offset"] + record["length"]
+    if store["mmap"] is None or end > len(store["mmap"]):
+        store_close(store)
+        with open(store["pack"], "rb") as f:
+            store["mmap"] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        store["view"] = memoryview(store["mmap"])
+    return store["view"][record["offset"]:end]
+
+
+def store_put(store, data, meta):
+    """
+    Store data under meta["name"]. Content already in the pack is not written again, and the same
+    content under the same name adds no new variant. Variants are numbered per name (after the
+    highest numeric one) unless meta["variant"] is given; an explicit variant the name already has
+    raises ValueError. Returns the index record.
+    """
+    digest = hashlib.sha256(data).hexdigest()
+    with STORE_LOCK:
+        variants = store["by_name"].setdefault(meta.get("name"), [])
+        for record in variants:
+            if record["hash"] == digest:
+                return record
+        taken = set(r.get("variant") for r in variants)
+        variant = str(meta.get("variant") or "")
+        if variant in taken:
+            raise ValueError("%s@%s already exists" % (meta.get("name"), variant))
+        if not variant:
+            variant = str(max([int(v) for v in taken if v and v.isdigit()] + [0]) + 1)
+        blob = store["by_hash"].get(digest)
+        store["root"].mkdir(parents=True, exist_ok=True)
+        if blob is None:
+            with open(store["pack"], "ab") as f:
+                offset = f.seek(0, os.SEEK_END)
+                f.write(data)
+        else:
+            offset = blob["offset"]
+        record = dict(meta, variant=variant, hash=digest,
+                      offset=offset, length=len(data), ts=time.strftime("%Y-%m-%dT%H:%M:%S"))
+        with open(store["index"], "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        store["records"].append(record)
+        store["by_hash"].setdefault(digest, record)
+        variants.append(record)
+    return record
+
+
+def store_put_file(store, path, meta=None, source=None):
+    """Store the file at `path` (its bytes read from `source` when given, e.g. a staged copy)."""
+    meta = dict(meta or {})
+    meta.setdefault("name", Path(path).name)
+    located = unity_asset_path(path)
+    if located:
+        meta.setdefault("asset_path", located[1])
+    with open(source or path, "rb") as f:
+        return store_put(store, f.read(), meta)
+
+
+def store_select(store, selectors):
+    """
+    Records for selectors: "name" (latest variant), "name@variant", or a sha256 prefix
+    (8+ hex chars). Returns (records, unmatched selectors).
+    """
+    found, missing = [], []
+    for selector in selectors:
+        name, _, variant = selector.partition("@")
+        matches = [r for r in store["by_name"].get(name, []) if not variant or r.get("variant") == variant]
+        if not matches and len(selector) >= 8 and all(c in string.hexdigits for c in selector):
+            matches = [r for r in store["records"] if r["hash"].startswith(selector.lower())]
+        if matches:
+            found.append(matches[-1])
+        else:
+            missing.append(selector)
+    return found, missing
+
+
+def store_checkout(store, record, output_root=None, unity_meta="missing", writer=None):
+    """
+    Write a record's bytes to <output_root>/<category>/<name>, or back to its original place under
+    Assets/ when no root is given. Writes the Unity .meta as well. Returns the written path.
+    With a writer, the store must stay open until the writer commits.
+    """
+    project = unity_asset_path(SCRIPT_DIR)
+    if output_root:
+        path = Path(output_root) / record.get("category", "") / record["name"]
+    elif record.get("asset_path") and project:
+        path = project[0] / record["asset_path"]
+    else:
+        raise ValueError("%s has no Assets/ path; pass an output root" % record["name"])
+    write_output(path, store_read(store, record), writer)
+    if path.suffix.lower() == ".png":
+        write_unity_meta(path, record.get("importer", "sprite"), unity_meta, record.get("nine_slice"), writer)
+    return path
+
+
+def store_export(store, records, dest_dir):
+    """Copy records (deduplicated) into another store, e.g. a single pack to share."""
+    dest = store_open(dest_dir)
+    try:
+        for record in records:
+            meta = dict((k, v) for k, v in record.items() if k not in ("hash", "offset", "length", "ts"))
+            if any(r.get("variant") == meta.get("variant") for r in dest["by_name"].get(meta.get("name"), [])):
+                meta.pop("variant")  # taken by other content in the destination: number it there
+            store_put(dest, store_read(store, record), meta)
+    finally:
+        store_close(dest)
+    return dest["root"]
+
+
+# GLB Post-processing (LOD chain)
+
+def require_numpy():
+    """Import NumPy lazily; it is only needed by the post-processing stages."""
+    try:
+        import numpy
+    except ImportError:
+        raise RuntimeError("NumPy not installed. Install with: pip install numpy")
+    return numpy
+
+
+def glb_open(path):
+    """
+    Memory-map a GLB file and locate its chunks without copying.
+    Returns {"gltf": dict, "bin": memoryview of the BIN chunk, "mmap": mmap}; release with glb_close.
+    """
+    with open(path, "rb") as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    glb = {"gltf": None, "bin": memoryview(b""), "mmap": mm}
+    magic, version, length = struct.unpack_from("<III", mm, 0)
+    if magic != GLB_MAGIC or version != 2:
+        glb_close(glb)
+        raise RuntimeError("Not a glTF 2.0 binary: %s" % path)
+    offset = 12
+    end = min(length, len(mm))
+    while offset + 8 <= end:
+        chunk_len, chunk_type = struct.unpack_from("<II", mm, offset)
+        start = offset + 8
+        if chunk_type == GLB_CHUNK_JSON:
+            glb["gltf"] = json.loads(mm[start:start + chunk_len].decode("utf-8"))
+        elif chunk_type == GLB_CHUNK_BIN and not len(glb["bin"]):
+            glb["bin"] = memoryview(mm)[start:start + chunk_len]
+        offset = start + chunk_len
+    if glb["gltf"] is None:
+        glb_close(glb)
+        raise RuntimeError("GLB has no JSON chunk: %s" % path)
+    return glb
+
+
+def glb_close(glb):
+    try:
+        glb["bin"].release()
+        glb["mmap"].close()
+    except BufferError:
+        pass  # arrays still view the mapping; it is unmapped when they are collected
+
+
+def glb_accessor(np, glb, index):
+    """Zero-copy NumPy view of an accessor in the BIN chunk (honours byteStride)."""
+    gltf = glb["gltf"]
+    acc = gltf["accessors"][index]
+    if "sparse" in acc or "bufferView" not in acc:
+        raise RuntimeError("Sparse or empty accessor %d is not supported" % index)
+    view = gltf["bufferViews"][acc["bufferView"]]
+    if view.get("buffer", 0) != 0 or "uri" in gltf["buffers"][view.get("buffer", 0)]:
+        raise RuntimeError("Accessor %d is not stored in the GLB BIN chunk" % index)
+    dtype = np.dtype(GLTF_COMPONENT_DTYPES[acc["componentType"]])
+    ncomp = GLTF_TYPE_SIZES[acc["type"]]
+    stride = view.get("byteStride") or dtype.itemsize * ncomp
+    arr = np.ndarray((acc["count"], ncomp), dtype=dtype, buffer=glb["bin"],
+                     offset=view.get("byteOffset", 0) + acc.get("byteOffset", 0),
+                     strides=(stride, dtype.itemsize))
+    return arr[:, 0] if acc["type"] == "SCALAR" else arr
+
+
+def glb_write(path, gltf, views):
+    """
+    Write a GLB. views[i] holds the bytes of gltf["bufferViews"][i]; views no longer referenced
+    by any accessor or image are dropped and the rest are packed 4-byte aligned into one BIN chunk.
+    """
+    used = set()
+    for acc in gltf.get("accessors", []):
+        if "bufferView" in acc:
+            used.add(acc["bufferView"])
+        for part in ("indices", "values"):
+            if part in acc.get("sparse", {}):
+                used.add(acc["sparse"][part]["bufferView"])
+    for image in gltf.get("images", []):
+        if "bufferView" in image:
+            used.add(image["bufferView"])
+    remap = {}
+    packed_views, packed_data = [], []
+    offset = 0
+    for old in sorted(used):
+        view = dict(gltf["bufferViews"][old])
+        data = views[old]
+        view.update({"buffer": 0, "byteOffset": offset, "byteLength": len(data)})
+        remap[old] = len(packed_views)
+        packed_views.append(view)
+        packed_data.append(data)
+        offset += len(data) + (-len(data) % 4)
+    for acc in gltf.get("accessors", []):
+        if "bufferView" in acc:
+            acc["bufferView"] = remap[acc["bufferView"]]
+        for part in ("indices", "values"):
+            if part in acc.get("sparse", {}):
+                acc["sparse"][part]["bufferView"] = remap[acc["sparse"][part]["bufferView"]]
+    for image in gltf.get("images", []):
+        if "bufferView" in image:
+            image["bufferView"] = remap[image["bufferView"]]
+    gltf["bufferViews"] = packed_views
+    gltf["buffers"] = [{"byteLength": offset}] if offset else []
+    json_bytes = json.dumps(gltf, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    json_bytes += b" " * (-len(json_bytes) % 4)
+    total = 12 + 8 + len(json_bytes) + (8 + offset if offset else 0)
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(struct.pack("<III", GLB_MAGIC, 2, total))
+        f.write(struct.pack("<II", len(json_bytes), GLB_CHUNK_JSON))
+        f.write(json_bytes)
+        if offset:
+            f.write(struct.pack("<II", offset, GLB_CHUNK_BIN))
+            for data in packed_data:
+                f.write(data)
+                f.write(b"\0" * (-len(data) % 4))
+    return path
+
+
+def mesh_quadrics(np, pos, faces, nv):
+    """Per-vertex error quadrics (nv, 4, 4): area-weighted sum of the planes of incident faces."""
+    p0 = pos[faces[:, 0]]
+    normal = face_normals(np, pos, faces)
+    double_area = np.linalg.norm(normal, axis=1)
+    unit = normal / np.maximum(double_area, 1e-20)[:, None]
+    plane = np.concatenate([unit, -(unit * p0).sum(1)[:, None]], axis=1)
+    k = (plane[:, :, None] * plane[:, None, :]).reshape(-1, 16) * (0.5 * double_area)[:, None]
+    corners = faces.ravel()
+    k = np.repeat(k, 3, axis=0)
+    q = np.empty((nv, 16))
+    for j in range(16):
+        q[:, j] = np.bincount(corners, weights=k[:, j], minlength=nv)
+    return q.reshape(nv, 4, 4)
+
+
+def face_normals(np, pos, faces):
+    """Unnormalized face normals (length = twice the triangle area)."""
+    p0 = pos[faces[:, 0]]
+    return np.cross(pos[faces[:, 1]] - p0, pos[faces[:, 2]] - p0)
+
+
+def collapse_flips(np, pos, faces, src, dst):
+    """
+    True for each half-edge collapse src->dst that, on its own, would flip (or zero out)
+    a face around src that survives the collapse.
+    """
+    corners = faces.ravel()
+    valence = np.bincount(corners, minlength=len(pos))
+    corner_faces = np.argsort(corners) // 3
+    starts = np.cumsum(valence) - valence
+    counts = valence[src]
+    pair = np.repeat(np.arange(len(src)), counts)
+    offsets = np.arange(len(pair)) - np.repeat(np.cumsum(counts) - counts, counts)
+    ring = faces[corner_faces[np.repeat(starts[src], counts) + offsets]]
+    survives = ~(ring == dst[pair, None]).any(1)
+    pair, ring = pair[survives], ring[survives]
+    moved = np.where(ring == src[pair, None], dst[pair, None], ring)
+    bad = np.zeros(len(src), dtype=bool)
+    bad[pair[faces_flipped(np, pos, ring, moved)]] = True
+    return bad
+
+
+def faces_flipped(np, pos, old, new):
+    """True where a face turns by more than LOD_FLIP_COSINE allows (or collapses to zero area)."""
+    n_old, n_new = face_normals(np, pos, old), face_normals(np, pos, new)
+    len_old = np.linalg.norm(n_old, axis=1)
+    bound = LOD_FLIP_COSINE * len_old * np.linalg.norm(n_new, axis=1)
+    return ((n_old * n_new).sum(1) <= bound) & (len_old > 0)
+
+
+def decimate_mesh(np, positions, faces, target_faces, quadrics=None):
+    """
+    Quadric-error decimation by batched half-edge collapses, vectorized with NumPy.
+
+    Vertices sharing a position (UV seams, hard normals) are welded into one group. A group
+    collapses onto a neighbouring group only if every one of its vertices has an edge into that
+    group; each vertex then moves onto its neighbour there, so positions, UVs and all other
+    per-vertex attributes stay valid and seams slide along themselves without cracking. Open
+    boundaries are locked.
+
+    Each pass costs every candidate, keeps the cheapest ones that do not flip a face on their
+    own, picks a group-disjoint subset (Luby-style random priorities), applies them all at once
+    and reverts any combination that still flips a face.
+
+    Returns (faces, quadrics); faces index the original vertex array, quadrics are per weld group.
+    """
+    pos = np.asarray(positions, dtype=np.float64) + 0.0  # fold -0.0 into 0.0 for welding
+    faces = np.asarray(faces, dtype=np.int64).reshape(-1, 3)
+    nv = len(pos)
+    wpos, weld = np.unique(pos, axis=0, return_inverse=True)
+    weld = weld.reshape(-1)
+    nw = len(wpos)
+    if quadrics is None:
+        quadrics = mesh_quadrics(np, wpos, weld[faces], nw)
+    homo = np.concatenate([wpos, np.ones((nw, 1))], axis=1)
+    rng = np.random.default_rng(0)
+    widen = 1
+    while len(faces) > target_faces:
+        wfaces = weld[faces]
+        wedges = np.concatenate([wfaces[:, [0, 1]], wfaces[:, [1, 2]], wfaces[:, [2, 0]]])
+        keys, counts = np.unique(wedges.min(1) * nw + wedges.max(1), return_counts=True)
+        locked = np.zeros(nw, dtype=bool)
+        locked[keys[counts != 2] // nw] = True
+        locked[keys[counts != 2] % nw] = True
+        live = np.zeros(nv, dtype=bool)
+        live[faces.ravel()] = True
+        group_size = np.bincount(weld[live], minlength=nw)
+        # Directed vertex edges a->b, one per (a, target group)
+        edges = np.concatenate([faces[:, [0, 1]], faces[:, [1, 2]], faces[:, [2, 0]]])
+        edges = np.concatenate([edges, edges[:, ::-1]])
+        reach_key = edges[:, 0] * nw + weld[edges[:, 1]]
+        order = np.argsort(reach_key)
+        first = order[np.concatenate([[True], np.diff(reach_key[order]) != 0])]
+        pa, pb = edges[first, 0], edges[first, 1]
+        cross = (weld[pa] != weld[pb]) & ~locked[weld[pa]]
+        pa, pb = pa[cross], pb[cross]
+        # Group collapses A->B; valid when all live vertices of A reach B
+        group_keys, pair_group, reach = np.unique(weld[pa] * nw + weld[pb], return_inverse=True, return_counts=True)
+        pair_group = pair_group.reshape(-1)
+        ga, gb = group_keys // nw, group_keys % nw
+        complete = reach == group_size[ga]
+        if not complete.any():
+            break
+        cost = np.einsum("ni,nij,nj->n", homo[gb], quadrics[ga] + quadrics[gb], homo[gb])
+        cost[~complete] = np.inf
+        movable = np.count_nonzero(complete)
+        needed = (len(faces) - target_faces + 1) // 2
+        pool = min(movable, max(1, min(needed, movable // LOD_POOL_DIVISOR)) * widen)
+        in_pool = np.zeros(len(cost), dtype=bool)
+        in_pool[np.argpartition(cost, pool - 1)[:pool]] = True
+        sel = in_pool[pair_group]
+        bad = np.zeros(len(cost), dtype=bool)
+        bad[pair_group[sel][collapse_flips(np, pos, faces, pa[sel], pb[sel])]] = True
+        cand = np.nonzero(in_pool & ~bad)[0]
+        # Random priorities within the cheap pool; a collapse is taken when it wins at both groups
+        chosen = np.zeros(len(cost), dtype=bool)
+        used = np.zeros(nw, dtype=bool)
+        for _ in range(LOD_SELECT_ROUNDS):
+            cand = cand[~used[ga[cand]] & ~used[gb[cand]]]
+            if not len(cand):
+                break
+            rank = rng.permutation(len(cand))
+            wrank = np.full(nw, len(cand))
+            np.minimum.at(wrank, ga[cand], rank)
+            np.minimum.at(wrank, gb[cand], rank)
+            take = cand[(wrank[ga[cand]] == rank) & (wrank[gb[cand]] == rank)]
+            chosen[take] = True
+            used[ga[take]] = True
+            used[gb[take]] = True
+        while True:
+            target = np.arange(nv)
+            apply = chosen[pair_group]
+            target[pa[apply]] = pb[apply]
+            moved = target[faces]
+            alive = (moved[:, 0] != moved[:, 1]) & (moved[:, 1] != moved[:, 2]) & (moved[:, 2] != moved[:, 0])
+            changed = alive & (moved != faces).any(1)
+            flipped = faces_flipped(np, pos, faces[changed], moved[changed])
+            if not flipped.any():
+                break
+            undo = np.zeros(nw, dtype=bool)
+            undo[wfaces[changed][flipped].ravel()] = True
+            chosen &= ~undo[ga]
+        if not chosen.any():
+            if pool >= movable:
+                break
+            widen *= 2  # every cheap candidate is blocked; look further up the cost order
+            continue
+        widen = 1
+        quadrics[gb[chosen]] += quadrics[ga[chosen]]
+        faces = moved[alive]
+    # Collapses that violate the link condition can leave coincident faces; keep one of each
+    _, first = np.unique(np.sort(faces, axis=1), axis=0, return_index=True)
+    return faces[np.sort(first)], quadrics
+
+
+def glb_generate_lods(input_path, budgets=DEFAULT_LOD_BUDGETS, output_dir=None):
+    """
+    Decimate every indexed triangle primitive of a GLB into a LOD chain (LOD0 -> LOD1 -> ...),
+    one GLB per triangle budget, written as <stem>_LOD<n>.glb. Materials, textures and
+    node hierarchy are carried over unchanged. A LOD whose decimation ran out of valid collapses
+    keeps its achieved count and is flagged "over_budget".
+    """
+    np = require_numpy()
+    input_path = Path(input_path)
+    out_dir = Path(output_dir) if output_dir else input_path.parent
+    start = time.time()
+    glb = glb_open(input_path)
+    try:
+        gltf = glb["gltf"]
+        unsupported = set(gltf.get("extensionsUsed", [])) & {"KHR_draco_mesh_compression", "EXT_meshopt_compression"}
+        if unsupported:
+            raise RuntimeError("Compressed meshes (%s) cannot be decimated" % ", ".join(sorted(unsupported)))
+        base_views = []
+        for view in gltf.get("bufferViews", []):
+            off = view.get("byteOffset", 0)
+            base_views.append(glb["bin"][off:off + view["byteLength"]])
+        prims, refs = [], {}
+        for mi, mesh in enumerate(gltf.get("meshes", [])):
+            for pi, prim in enumerate(mesh["primitives"]):
+                for acc in list(prim.get("attributes", {}).values()) + [prim.get("indices")]:
+                    refs[acc] = refs.get(acc, 0) + 1
+                if prim.get("mode", 4) != 4 or "indices" not in prim or "POSITION" not in prim.get("attributes", {}):
+                    continue
+                faces = glb_accessor(np, glb, prim["indices"]).astype(np.int64).reshape(-1, 3)
+                prims.append({"mesh": mi, "prim": pi, "faces": faces, "quadrics": None,
+                              "source_triangles": len(faces),
+                              "positions": glb_accessor(np, glb, prim["attributes"]["POSITION"])})
+        source_tris = sum(p["source_triangles"] for p in prims)
+        log("GLB loaded: %d primitive(s), %d triangles (%.2fs)" % (len(prims), source_tris, time.time() - start))
+        lods = []
+        for level, budget in enumerate(budgets):
+            lod_start = time.time()
+            for p in prims:
+                share = max(1, int(budget * p["source_triangles"] / max(source_tris, 1)))
+                if len(p["faces"]) > share:
+                    p["faces"], p["quadrics"] = decimate_mesh(np, p["positions"], p["faces"], share, p["quadrics"])
+            out_gltf = json.loads(json.dumps(gltf))
+            views = list(base_views)
+            vertices = 0
+            for p in prims:
+                vertices += glb_replace_primitive(np, glb, out_gltf, views, p, refs)
+            tris = sum(len(p["faces"]) for p in prims)
+            out_path = glb_write(out_dir / ("%s_LOD%d%s" % (input_path.stem, level, input_path.suffix or ".glb")),
+                                 out_gltf, views)
+            seconds = round(time.time() - lod_start, 2)
+            log("LOD%d: %d triangles, %d vertices (budget %d, %.2fs) -> %s"
+                % (level, tris, vertices, budget, seconds, out_path))
+            if tris > budget:
+                # Locked boundaries and flip checks can run out of collapses before the budget
+                log("WARNING: LOD%d is over budget: %d triangles for a budget of %d" % (level, tris, budget))
+            lods.append({"level": level, "budget": budget, "triangles": tris, "over_budget": tris > budget,
+                         "vertices": vertices, "output_path": str(out_path.resolve()), "seconds": seconds})
+    finally:
+        prims = base_views = views = None
+        glb_close(glb)
+    return {"input_path": str(input_path.resolve()), "source_triangles": source_tris, "lods": lods,
+            "over_budget": any(lod["over_budget"] for lod in lods),
+            "processing_seconds": round(time.time() - start, 2)}
+
+
+def glb_replace_primitive(np, glb, gltf, views, p, refs):
+    """Point a primitive at compacted copies of its indices and per-vertex accessors; returns vertex count."""
+    prim = gltf["meshes"][p["mesh"]]["primitives"][p["prim"]]
+    used, faces = np.unique(p["faces"], return_inverse=True)
+    faces = faces.reshape(-1)
+    index_type = 5123 if len(used) < 65535 else 5125
+    prim["indices"] = glb_add_accessor(np, gltf, views, faces.astype(GLTF_COMPONENT_DTYPES[index_type]),
+                                       prim["indices"], refs, 34963, index_type)
+    for name, acc in prim["attributes"].items():
+        data = glb_accessor(np, glb, acc)[used]
+        prim["attributes"][name] = glb_add_accessor(np, gltf, views, data, acc, refs, 34962)
+    for morph in prim.get("targets", []):
+        for name, acc in morph.items():
+            morph[name] = glb_add_accessor(np, gltf, views, glb_accessor(np, glb, acc)[used], acc, refs, 34962)
+    return len(used)
+
+
+def glb_add_accessor(np, gltf, views, data, index, refs, target, component_type=None):
+    """
+    Store data in a new bufferView and rewrite accessor `index` to use it
+    (or append a copy when other primitives still share the original accessor).
+    """
+    acc = dict(gltf["accessors"][index])
+    data = np.ascontiguousarray(data)
+    elem = data.dtype.itemsize * (data.shape[1] if data.ndim > 1 else 1)
+    view = {"buffer": 0, "target": target}
+    if target == 34962 and elem % 4:
+        # Vertex attribute elements must start on 4-byte boundaries
+        padded = np.zeros((len(data), elem + (-elem % 4)), dtype=np.uint8)
+        padded[:, :elem] = data.view(np.uint8).reshape(len(data), elem)
+        view["byteStride"] = padded.shape[1]
+        data_bytes = memoryview(padded).cast("B")
+    else:
+        data_bytes = memoryview(data).cast("B")
+    view["byteLength"] = len(data_bytes)
+    gltf["bufferViews"].append(view)
+    views.append(data_bytes)
+    acc.update({"bufferView": len(gltf["bufferViews"]) - 1, "count": len(data)})
+    acc.pop("byteOffset", None)
+    if component_type:
+        acc["componentType"] = component_type
+    if ("min" in acc or "max" in acc) and len(data):
+        flat = data.reshape(len(data), -1)
+        cast = float if data.dtype.kind == "f" else int
+        acc["min"] = [cast(v) for v in flat.min(0)]
+        acc["max"] = [cast(v) for v in flat.max(0)]
+    if refs.get(index, 0) > 1:
+        gltf["accessors"].append(acc)
+        return len(gltf["accessors"]) - 1
+    gltf["accessors"][index] = acc
+    return index
+
+
+# Subcommand: ui
+
+def cmd_ui(args):
+    creds = load_config(args.config)
+    if not creds["liblib_access_key"] or not creds["liblib_secret_key"]:
+        emit_result({"ok": False, "command": "ui", "error": "Missing LiblibAI credentials."})
+        return 1
+    prefix = args.style_prefix if args.style_prefix is not None else BASE_PROMPT
+    try:
+        variables = dict(v.split("=", 1) for v in args.var)
+        full_prompt = prompt_compiler({"prompt_template": args.prompt_template, "vars": variables}, prefix)(
+            {"prompt": args.prompt, "width": args.width or "", "height": args.height or ""})
+    except ValueError as e:
+        emit_result({"ok": False, "command": "ui", "error": "Bad prompt template: %s" % e})
+        return 1
+    params = {"steps": args.steps, "width": args.gen_width, "height": args.gen_height,
+              "imgCount": args.img_count, "seed": args.seed}
+    if args.template_uuid:
+        params["templateUuid"] = args.template_uuid
+    log("Generating UI image...")
+    log("Prompt: %s" % full_prompt)
+    result = liblib_generate_and_wait(
+        creds["liblib_access_key"], creds["liblib_secret_key"],
+        full_prompt, params, args.timeout, args.poll_interval, args.ledger
+    )
+    if result["ok"] and not args.no_download:
+        output_path = args.output or default_output_path("ui", ".png")
+        try:
+            transform = None
+            if args.width and args.height and not args.no_resize:
+                output_path, transform = resized_output(output_path, args.width, args.height)
+            download_file(result["image_url"], output_path, transform=transform)
+            result["output_path"] = str(Path(output_path).resolve())
+            meta_path = write_unity_meta(output_path, args.importer, args.unity_meta)
+            if meta_path:
+                result["meta_path"] = str(meta_path)
+        except (RuntimeError, OSError) as e:
+            result["ok"] = False
+            result["error"] = str(e)
+    if args.width: result["width"] = args.width
+    if args.height: result["height"] = args.height
+    result["command"] = "ui"
+    result["prompt"] = full_prompt
+    emit_result(result)
+    return 0 if result["ok"] else 1
+
+
+# Subcommand: vfx
+
+def flipbook_options(args, spec=None):
+    """generate_flipbook options from CLI args, overridden by an item's "flipbook" dict. ValueError if invalid."""
+    spec = spec or {}
+    width = spec.get("width") or getattr(args, "width", None) or DEFAULT_FLIPBOOK_FRAME_SIZE
+    height = spec.get("height") or getattr(args, "height", None) or DEFAULT_FLIPBOOK_FRAME_SIZE
+    params = {"steps": spec.get("steps", getattr(args, "steps", DEFAULT_STEPS)),
+              "width": spec.get("gen_width", getattr(args, "gen_width", DEFAULT_FLIPBOOK_GEN_SIZE)),
+              "height": spec.get("gen_height", getattr(args, "gen_height", DEFAULT_FLIPBOOK_GEN_SIZE))}
+    template = spec.get("template_uuid", getattr(args, "template_uuid", None))
+    if template:
+        params["templateUuid"] = template
+    try:
+        frames = int(spec.get("frames", getattr(args, "frames", DEFAULT_FLIPBOOK_FRAMES)))
+    except TypeError:
+        raise ValueError("flipbook frames must be a number")
+    if frames < 1:
+        raise ValueError("flipbook needs at least 1 frame, got %d" % frames)
+    return {"frames": frames,
+            "frame_size": (int(width), int(height)), "columns": spec.get("columns", getattr(args, "columns", None)),
+            "fps": spec.get("fps", getattr(args, "fps", DEFAULT_FLIPBOOK_FPS)),
+            "seed": spec.get("seed", getattr(args, "seed", None)), "params": params,
+            "frame_prompts": spec.get("frame_prompts"), "submit_delay": args.submit_delay,
+            "timeout": args.timeout, "poll_interval": args.poll_interval, "max_retries": args.max_retries,
+            "retry_delay": args.retry_delay, "ledger": args.ledger}
+
+
+def cmd_vfx(args):
+    creds = load_config(args.config)
+    if not creds["liblib_access_key"] or not creds["liblib_secret_key"]:
+        emit_result({"ok": False, "command": "vfx", "error": "Missing LiblibAI credentials."})
+        return 1
+    full_prompt = compose_prompt(args.style_prefix or "", args.prompt)
+    output = args.output or default_output_path("vfx", ".png")
+    try:
+        opts = flipbook_options(args)
+    except ValueError as e:
+        emit_result({"ok": False, "command": "vfx", "error": str(e)})
+        return 1
+    log("Generating %d-frame flipbook..." % opts["frames"])
+    try:
+        result = generate_flipbook(creds, full_prompt, output, opts)
+    except RuntimeError as e:
+        result = {"ok": False, "error": str(e)}
+    if result["ok"]:
+        try:
+            meta_path = write_unity_meta(result["output_path"], args.importer, args.unity_meta)
+            if meta_path:
+                result["meta_path"] = str(meta_path)
+        except (OSError, ValueError) as e:
+            log("WARNING: .meta not written: %s" % e)
+    result["command"] = "vfx"
+    result["prompt"] = full_prompt
+    emit_result(result)
+    return 0 if result["ok"] else 1
+
+
+# Subcommand: model
+
+def cmd_model(args):
+    creds = load_config(args.config, tripo_key_override=args.tripo_key)
+    if not creds["tripo_api_key"]:
+        emit_result({"ok": False, "command": "model", "error": "Missing Tripo3D API key."})
+        return 1
+    task_type = args.type
+    if task_type == "text_to_model" and not args.prompt:
+        emit_result({"ok": False, "command": "model", "error": "text_to_model requires --prompt"})
+        return 1
+    if task_type == "image_to_model" and not args.image_url:
+        emit_result({"ok": False, "command": "model", "error": "image_to_model requires --image-url"})
+        return 1
+    log("Generating 3D model (%s)..." % task_type)
+    result = tripo_generate_and_wait(
+        creds["tripo_api_key"], task_type,
+        prompt=args.prompt, image_url=args.image_url,
+        timeout=args.timeout, poll_interval=args.poll_interval
+    )
+    if result["ok"] and not args.no_download:
+        output_path = args.output or default_output_path("model", ".glb")
+        try:
+            download_file(result["model_url"], output_path)
+            result["output_path"] = str(Path(output_path).resolve())
+        except RuntimeError as e:
+            result["ok"] = False
+            result["error"] = str(e)
+    if result["ok"] and args.lod and result.get("output_path"):
+        try:
+            result["lod"] = glb_generate_lods(result["output_path"], parse_int_list(args.lod_budgets))
+        except (RuntimeError, ValueError, struct.error) as e:
+            log("WARNING: LOD generation skipped: %s" % e)
+            result["lod_error"] = str(e)
+    result["command"] = "model"
+    result["type"] = task_type
+    emit_result(result)
+    return 0 if result["ok"] else 1
+
+
+# Subcommand: lod
+
+def parse_int_list(text):
+    """Parse "10000,4000,1500" into [10000, 4000, 1500]."""
+    return [int(v) for v in str(text).split(",") if v.strip()]
+
+
+def cmd_lod(args):
+    try:
+        budgets = parse_int_list(args.budgets)
+    except ValueError:
+        emit_result({"ok": False, "command": "lod", "error": "Invalid --budgets: %s" % args.budgets})
+        return 1
+    if not Path(args.input).exists():
+        emit_result({"ok": False, "command": "lod", "error": "Input not found: %s" % args.input})
+        return 1
+    try:
+        result = glb_generate_lods(args.input, budgets, args.output_dir)
+    except (RuntimeError, ValueError, struct.error) as e:
+        emit_result({"ok": False, "command": "lod", "error": str(e)})
+        return 1
+    result.update({"ok": True, "command": "lod"})
+    emit_result(result)
+    return 0
+
+
+# Subcommand: tile
+
+def cmd_tile(args):
+    reports = []
+    failed = 0
+    for path in args.input:
+        if not Path(path).exists():
+            reports.append({"input_path": path, "ok": False, "error": "not found"})
+            failed += 1
+            continue
+        report = check_tiling(path, args.threshold, "blend" if args.fix else "off")
+        if report is None:
+            emit_result({"ok": False, "command": "tile", "error": "NumPy and Pillow are required"})
+            return 1
+        report["input_path"] = str(Path(path).resolve())
+        log("%s %s: seam score %.2f" % ("[OK]" if report["ok"] else "[SEAM]", path, report["score"]))
+        emit_event("item", **report)
+        reports.append(report)
+        failed += 0 if report["ok"] else 1
+    emit_result({"ok": failed == 0, "command": "tile", "total": len(reports), "failed": failed,
+                 "results": reports})
+    return 0 if failed == 0 else 1
+
+
+# Subcommand: slice
+
+def cmd_slice(args):
+    reports = []
+    failed = 0
+    for path in args.input:
+        if not Path(path).exists():
+            reports.append({"input_path": path, "ok": False, "error": "not found"})
+            failed += 1
+            continue
+        report = check_nine_slice(path, args.tolerance, args.crop)
+        if report is None:
+            emit_result({"ok": False, "command": "slice", "error": "NumPy and Pillow are required"})
+            return 1
+        report = dict(report, input_path=str(Path(path).resolve()), ok=bool(report))
+        if report["ok"]:
+            meta_path = write_unity_meta(path, args.importer, args.unity_meta, report)
+            if meta_path:
+                report["meta_path"] = str(meta_path)
+        else:
+            failed += 1
+        emit_event("item", **report)
+        reports.append(report)
+    emit_result({"ok": failed == 0, "command": "slice", "total": len(reports), "failed": failed,
+                 "results": reports})
+    return 0 if failed == 0 else 1
+
+
+# Subcommand: color
+
+def cmd_color(args):
+    missing = [p for p in args.input if not Path(p).exists()]
+    if missing:
+        emit_result({"ok": False, "command": "color", "error": "not found: %s" % ", ".join(missing)})
+        return 1
+    if len(args.input) < 2:
+        emit_result({"ok": False, "command": "color", "error": "need at least 2 images for a reference"})
+        return 1
+    if args.in_place or args.report_only:
+        outputs = list(args.input)
+    elif args.output_dir:
+        outputs = [Path(args.output_dir) / Path(p).name for p in args.input]
     else:
-        style_prefix = spec.get("style_prefix", BASE_PROMPT)
-    output_root = Path(args.output_root or spec.get("output_root", str(DEFAULT_OUTPUT_DIR)))
+        outputs = [Path(p).with_name(Path(p).stem + COLOR_OUTPUT_SUFFIX + Path(p).suffix) for p in args.input]
+    clashes = sorted(set(str(p) for p in outputs if outputs.count(p) > 1))
+    if clashes:
+        emit_result({"ok": False, "command": "color", "error": "inputs share an output path: %s" % ", ".join(clashes)})
+        return 1
+    if args.output_dir and not args.report_only:
+        Path(args.output_dir).mkdir(parents=True, exist_ok=True)
+    start = time.time()
+    report = normalize_colors(args.input, args.input, args.strength, apply=not args.report_only, output_paths=outputs)
+    if report is None:
+        emit_result({"ok": False, "command": "color", "error": "NumPy and Pillow are required"})
+        return 1
+    for path, entry in zip(args.input, report["results"]):
+        entry["input_path"] = str(path)
+        emit_event("item", **entry)
+    emit_result({"ok": True, "command": "color", "total": len(report["results"]), "strength": args.strength,
+                 "applied": not args.report_only, "in_place": bool(args.in_place and not args.report_only),
+                 "seconds": round(time.time() - start, 2),
+                 "results": report["results"]})
+    return 0
+
+
+# Subcommand: compare
+
+def screenshot_files(inputs):
+    """(path, path relative to its input directory) for image files in inputs, heatmaps excluded."""
+    files = []
+    for entry in map(Path, inputs):
+        paths = sorted(entry.rglob("*")) if entry.is_dir() else [entry]
+        for path in paths:
+            if path.suffix.lower() in (".png", ".jpg", ".jpeg") and not path.stem.endswith("_heatmap"):
+                files.append((path, path.relative_to(entry) if entry.is_dir() else Path(path.name)))
+    return files
+
+
+def cmd_compare(args):
+    inputs = args.input or [str(DEFAULT_SCREENSHOT_DIR)]
+    missing = [p for p in inputs if not Path(p).exists()]
+    if missing:
+        emit_result({"ok": False, "command": "compare", "error": "not found: %s" % ", ".join(missing)})
+        return 1
+    try:
+        require_numpy()
+        require_pillow()
+    except RuntimeError as e:
+        emit_result({"ok": False, "command": "compare", "error": str(e)})
+        return 1
+    index = mockup_index(args.mockups or [SCRIPT_DIR / d for d in COMPARE_MOCKUP_DIRS])
+    if not index:
+        emit_result({"ok": False, "command": "compare", "error": "no mockups found"})
+        return 1
+    heatmap_dir = None if args.no_heatmap else Path(args.heatmap_dir or DEFAULT_HEATMAP_DIR)
+    start = time.time()
+    results, jobs = [], []
+    for path, rel in screenshot_files(inputs):
+        mockup = match_mockup(path, index)
+        if mockup is None:
+            results.append({"screenshot": str(path), "status": "unmatched"})
+            emit_event("item", **results[-1])
+            continue
+        heatmap = heatmap_dir / rel.parent / (rel.stem + "_heatmap.png") if heatmap_dir else None
+        jobs.append((str(path), str(mockup), args.max_side, heatmap and str(heatmap), args.delta_e))
+    workers = max(1, min(args.jobs or os.cpu_count() or 1, len(jobs)))
+    log("Comparing %d screenshot(s) against %d mockup(s), %d worker(s)" % (len(jobs), len(index), workers))
+    # SSIM is numpy-bound, so spread the pairs over processes rather than threads
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = dict((pool.submit(compare_screenshot, job), job) for job in jobs)
+        for future in concurrent.futures.as_completed(futures):
+            job = futures[future]
+            try:
+                entry = future.result()
+                entry["status"] = "passed" if entry["ssim"] >= args.min_ssim else "failed"
+            except Exception as e:
+                entry = {"screenshot": job[0], "mockup": job[1], "status": "error", "error": str(e)}
+            log("%s: %s (ssim %s)" % (entry["status"].upper(), entry["screenshot"], entry.get("ssim", "-")))
+            results.append(entry)
+            emit_event("item", **entry)
+    results.sort(key=lambda r: r["screenshot"])
+    counts = dict((k, sum(1 for r in results if r["status"] == k)) for k in ("passed", "failed", "error", "unmatched"))
+    matched = set(r["mockup"] for r in results if "mockup" in r)
+    scores = [r["ssim"] for r in results if "ssim" in r]
+    summary = {"ok": bool(scores) and not counts["failed"] and not counts["error"], "command": "compare",
+               "total": len(results), "compared": len(scores), "min_ssim": args.min_ssim,
+               "mean_ssim": round(sum(scores) / len(scores), 4) if scores else None,
+               "worst_ssim": min(scores) if scores else None,
+               "not_captured": sorted(Path(p).stem for p in map(str, index.values()) if p not in matched),
+               "seconds": round(time.time() - start, 2), "results": results}
+    summary.update(counts)
+    if heatmap_dir:
+        summary["heatmap_dir"] = str(heatmap_dir)
+    emit_result(summary)
+    return 0 if summary["ok"] else 1
+
+
+# Subcommand: store
+
+def store_summary(record):
+    return dict((k, record[k]) for k in ("name", "variant", "category", "hash", "length", "asset_path", "ts")
+                if k in record)
+
+
+def cmd_store(args):
+    store = store_open(args.store)
+    try:
+        if args.action == "add":
+            results = []
+            for path in args.input:
+                meta = {"category": args.category, "importer": args.importer}
+                if args.variant:
+                    meta["variant"] = args.variant
+                try:
+                    results.append(dict(store_summary(store_put_file(store, path, meta)), status="success"))
+                except (OSError, ValueError) as e:
+                    results.append({"name": Path(path).name, "status": "failed", "error": str(e)})
+                emit_event("item", **results[-1])
+            failed = sum(1 for r in results if r["status"] == "failed")
+            emit_result({"ok": failed == 0, "command": "store", "action": "add", "total": len(results),
+                         "failed": failed, "results": results})
+            return 0 if failed == 0 else 1
+        if args.action == "list":
+            records = store["records"]
+            if args.select:
+                records = [r for r in records if r.get("name") in args.select]
+            results = [store_summary(r) for r in records]
+            for entry in results:
+                emit_event("item", **entry)
+            emit_result({"ok": True, "command": "store", "action": "list", "store": str(store["root"]),
+                         "total": len(records), "blobs": len(store["by_hash"]),
+                         "pack_bytes": store["pack"].stat().st_size if store["pack"].exists() else 0,
+                         "results": results})
+            return 0
+        if not args.select:
+            emit_result({"ok": False, "command": "store", "action": args.action, "error": "--select is required"})
+            return 1
+        records, missing = store_select(store, args.select)
+        if missing:
+            emit_result({"ok": False, "command": "store", "action": args.action,
+                         "error": "not in store: %s" % ", ".join(missing)})
+            return 1
+        if args.action == "export":
+            if not args.output:
+                emit_result({"ok": False, "command": "store", "action": "export", "error": "-o/--output is required"})
+                return 1
+            dest = store_export(store, records, args.output)
+            results = [store_summary(r) for r in records]
+            for entry in results:
+                emit_event("item", **entry)
+            emit_result({"ok": True, "command": "store", "action": "export", "output": str(dest),
+                         "total": len(records), "results": results})
+            return 0
+        results = []
+        writer = OutputWriter()
+        try:
+            for record in records:
+                try:
+                    path = store_checkout(store, record, args.output, args.unity_meta, writer)
+                    results.append(dict(store_summary(record), status="success", output_path=str(path)))
+                    log("Checked out %s@%s -> %s" % (record["name"], record["variant"], path))
+                except (OSError, ValueError) as e:
+                    results.append(dict(store_summary(record), status="failed", error=str(e)))
+        finally:
+            writer.close()
+        for error in writer.errors:
+            for r in results:
+                if r.get("output_path") == error["output_path"]:
+                    r.update(status="failed", error=error["error"])
+        for entry in results:
+            emit_event("item", **entry)
+        failed = sum(1 for r in results if r["status"] == "failed")
+        emit_result({"ok": failed == 0, "command": "store", "action": "checkout", "total": len(results),
+                     "failed": failed, "results": results})
+        return 0 if failed == 0 else 1
+    finally:
+        store_close(store)
+
+
+# Subcommand: batch
+
+def flipbook_frames(item):
+    """Renders an item costs: its flipbook frame count, or 1 (also for invalid counts, which fail the item)."""
+    if not item.get("flipbook"):
+        return 1
+    spec = item["flipbook"] if isinstance(item["flipbook"], dict) else {}
+    try:
+        return max(1, int(spec.get("frames", DEFAULT_FLIPBOOK_FRAMES)))
+    except (TypeError, ValueError):
+        return 1
+
+
+def run_flipbook_item(item, full_prompt, out_path, creds, args, files=None):
+    """Batch item with "flipbook": {"frames", "columns", "fps", "seed", "frame_prompts", ...}."""
+    spec = dict(item["flipbook"]) if isinstance(item["flipbook"], dict) else {}
+    spec.setdefault("width", item.get("width"))
+    spec.setdefault("height", item.get("height"))
+    result = {"filename": item.get("filename", ""), "category": item.get("category", "")}
+    try:
+        gen = generate_flipbook(creds, full_prompt, out_path, dict(flipbook_options(args, spec), writer=files))
+    except (RuntimeError, ValueError) as e:
+        gen = {"ok": False, "error": str(e)}
+    result.update(gen)
+    result["status"] = "success" if result.pop("ok") else "failed"
+    if result["status"] == "success":
+        try:
+            meta_path = write_unity_meta(result["output_path"], item.get("importer", "vfx"), args.unity_meta,
+                                         writer=files)
+            if meta_path:
+                result["meta_path"] = str(meta_path)
+        except (OSError, ValueError) as e:
+            log("WARNING: .meta not written for %s: %s" % (result["output_path"], e))
+    return result
+
+
+def cmd_batch(args):
+    creds = load_config(args.config)
+    if not creds["liblib_access_key"] or not creds["liblib_secret_key"]:
+        emit_result({"ok": False, "command": "batch", "error": "Missing LiblibAI credentials."})
+        return 1
+    try:
+        spec = open_spec(args.spec)
+    except Exception as e:
+        emit_result({"ok": False, "command": "batch", "error": "Failed to load spec: %s" % e})
+        return 1
+    total = spec["total"]
+    if not total:
+        emit_result({"ok": False, "command": "batch", "error": "No items in spec."})
+        return 1
+    header = spec["header"]
+    if args.style_prefix is not None:
+        style_prefix = args.style_prefix
+    else:
+        style_prefix = header.get("style_prefix", BASE_PROMPT)
+    output_root = Path(args.output_root or header.get("output_root", str(DEFAULT_OUTPUT_DIR)))
+    try:
+        compose = prompt_compiler(header, style_prefix)
+    except ValueError as e:
+        emit_result({"ok": False, "command": "batch", "error": "Bad prompt template: %s" % e})
+        return 1
+    color_mode = args.color_normalize or header.get("color_normalize", "off")
+    if color_mode not in COLOR_NORMALIZE_MODES:
+        emit_result({"ok": False, "command": "batch", "error": "Bad color_normalize %r (expected one of: %s)"
+                     % (color_mode, ", ".join(COLOR_NORMALIZE_MODES))})
+        return 1
     if args.dry_run:
-        plan = {"ok": True, "command": "batch", "dry_run": True, "total": len(items),
-                "style_prefix": style_prefix, "output_root": str(output_root), "items": []}
-        for item in items:
+        history = ledger_load(args.ledger)
+        plan = {"ok": True, "command": "batch", "dry_run": True, "total": total,
+                "style_prefix": style_prefix, "output_root": str(output_root)}
+        writer = ResultWriter(args.results)
+        cost = estimate_cost(None)
+        # Render time from the ledger plus our own download/post-processing time from past runs
+        est_seconds = estimate_render_seconds(None, history)
+        if not args.no_perf:
+            est_seconds = round(est_seconds + perf_local_seconds(args.perf_db), 1)
+        projected_cost = projected_seconds = 0.0
+        to_submit = 0
+        for item in spec["items"]():
             out_path = output_root / item.get("category", "") / item.get("filename", "")
-            plan["items"].append({
-                "category": item.get("category", ""), "filename": item.get("filename", ""),
-                "width": item.get("width"), "height": item.get("height"),
-                "prompt_preview": (style_prefix + ", " + item.get("prompt", ""))[:120] + "...",
-                "output_path": str(out_path), "exists": out_path.exists(),
-            })
-        emit_result(plan)
+            exists = out_path.exists()
+            entry = {"category": item.get("category", ""), "filename": item.get("filename", ""),
+                     "width": item.get("width"), "height": item.get("height"),
+                     "output_path": str(out_path), "exists": exists,
+                     "estimated_cost": cost, "estimated_seconds": est_seconds}
+            try:
+                entry["prompt_preview"] = compose(item)[:120] + "..."
+            except ValueError as e:
+                entry["error"] = str(e)
+            writer.add(entry)
+            if args.skip_existing and exists:
+                continue
+            to_submit += flipbook_frames(item)
+            projected_cost += cost * flipbook_frames(item)
+            projected_seconds += est_seconds
+        projected_seconds += max(0, to_submit - 1) * args.submit_delay
+        plan["projected_cost"] = round(projected_cost, 2)
+        plan["projected_seconds"] = round(projected_seconds, 1)
+        hedge = hedge_policy_for(history, None, args.hedge_after, args.hedge_percentile,
+                                 int(args.hedge_budget * to_submit))
+        plan["hedge_after_seconds"] = hedge.after_seconds
+        plan["max_hedges"] = hedge.max_hedges
+        if args.budget is not None:
+            plan["budget"] = args.budget
+            plan["within_budget"] = projected_cost <= args.budget
+        emit_result(writer.close(plan, "items"))
         return 0
-    results = []
+    writer = ResultWriter(args.results)
+    # Outputs are staged and moved into Assets/ together (every --commit-every items, and at the end)
+    files = OutputWriter(args.writer_threads)
+    commit_every = args.commit_every
+    if commit_every is None:
+        # Color normalization rewrites this run's outputs afterwards; commit them once, corrected
+        commit_every = 0 if color_mode != "off" else DEFAULT_COMMIT_EVERY
+    # Post-batch stages work on whole groups, so only they keep (item, result) pairs around
+    post = [] if color_mode != "off" or args.store else None
     succeeded = failed = skipped = 0
+    spent = 0.0
+    budget_hit = False
     start_time = time.time()
-    total = len(items)
+    history = ledger_load(args.ledger)
+    hedge = hedge_policy_for(history, None, args.hedge_after, args.hedge_percentile, int(args.hedge_budget * total),
+                             None if args.budget is None else lambda: args.budget - spent)
+    perf = None if args.no_perf else perf_open(args.perf_db)
+    run_id = perf_start_run(perf, "batch", args.spec)
+    if run_id is None:
+        perf = None
+    gen_defaults = build_gen_params("", None)
+    latencies = []
+    hedge_cost = 0.0
     log("Batch generation started: %d items" % total)
-    for idx, item in enumerate(items, 1):
-        category = item.get("category", "")
-        filename = item.get("filename", "unknown.png")
-        w, h = item.get("width"), item.get("height")
-        detail_prompt = item.get("prompt", "")
-        out_path = output_root / category / filename
-        if args.skip_existing and out_path.exists():
-            log("[%d/%d] SKIP (exists): %s" % (idx, total, out_path))
-            results.append({"filename": filename, "category": category, "status": "skipped", "output_path": str(out_path)})
-            skipped += 1
-            continue
-        full_prompt = (style_prefix + ", " + detail_prompt) if style_prefix else detail_prompt
-        if idx > 1 and args.submit_delay > 0:
-            log("Waiting %ds..." % args.submit_delay)
-            time.sleep(args.submit_delay)
-        log("[%d/%d] Generating: %s/%s" % (idx, total, category, filename))
-        item_result = None
-        last_error = "unknown"
-        for attempt in range(1, args.max_retries + 1):
+    emit_event("start", command="batch", total=total)
+
+    def add_result(item_result):
+        writer.add(item_result)
+        if post is not None and item_result["status"] in ("success", "skipped"):
+            post.append((item, item_result))
+        if commit_every and idx % commit_every == 0:
+            files.commit()
+    # Whatever happens (errors, Ctrl+C), renders already paid for are moved into place
+    try:
+        for idx, item in enumerate(spec["items"](), 1):
+            category = item.get("category", "")
+            filename = item.get("filename", "unknown.png")
+            w, h = item.get("width"), item.get("height")
+            out_path = output_root / category / filename
+            set_event_context(index=idx, total=total)
+            if args.skip_existing and out_path.exists():
+                log("[%d/%d] SKIP (exists): %s" % (idx, total, out_path))
+                add_result({"filename": filename, "category": category, "status": "skipped",
+                            "output_path": str(out_path)})
+                skipped += 1
+                continue
+            if budget_hit:
+                add_result({"filename": filename, "category": category, "status": "budget_exceeded"})
+                skipped += 1
+                continue
             try:
-                gen_result = liblib_generate_and_wait(
-                    creds["liblib_access_key"], creds["liblib_secret_key"],
-                    full_prompt, None, args.timeout, args.poll_interval
-                )
-                if gen_result["ok"]:
-                    download_file(gen_result["image_url"], out_path)
-                    if w and h: resize_image(out_path, w, h)
-                    item_result = {"filename": filename, "category": category, "status": "success",
-                                   "output_path": str(out_path), "image_url": gen_result.get("image_url", ""),
-                                   "task_id": gen_result.get("task_id", "")}
+                full_prompt = compose(item)
+            except ValueError as e:
+                log("[%d/%d] FAIL: %s: %s" % (idx, total, filename, e))
+                add_result({"filename": filename, "category": category, "status": "failed", "error": str(e)})
+                failed += 1
+                continue
+            if idx > 1 and args.submit_delay > 0:
+                log("Waiting %ds..." % args.submit_delay)
+                time.sleep(args.submit_delay)
+            log("[%d/%d] Generating: %s/%s" % (idx, total, category, filename))
+            set_event_context(index=idx, total=total, filename=filename, category=category)
+            if item.get("flipbook"):
+                if args.budget is not None and spent + flipbook_frames(item) * estimate_cost(None) > args.budget:
+                    log("[BUDGET] Flipbook would exceed budget, stopping submits")
+                    budget_hit = True
+                    add_result({"filename": filename, "category": category, "status": "budget_exceeded"})
+                    skipped += 1
+                    continue
+                item_result = run_flipbook_item(item, full_prompt, out_path, creds, args, files)
+                perf_add_item(perf, run_id, {"name": filename, "category": category, "status": item_result["status"],
+                                             "template": LIBLIB_TEMPLATE, "cost": item_result.get("cost"),
+                                             "elapsed_seconds": item_result.get("elapsed_seconds")})
+                spent += item_result.pop("cost", 0.0)
+                if item_result["status"] == "success":
                     succeeded += 1
-                    log("[OK] Saved: %s" % out_path)
-                    break
                 else:
-                    last_error = gen_result.get("error", "unknown")
-                    log("[WARN] Attempt %d/%d failed: %s" % (attempt, args.max_retries, last_error))
+                    failed += 1
+                set_event_context(index=idx, total=total)
+                add_result(item_result)
+                continue
+            item_result = None
+            last_error = "unknown"
+            item_start = time.time()
+            metrics = {"name": filename, "category": category, "template": LIBLIB_TEMPLATE,
+                       "width": gen_defaults["width"], "height": gen_defaults["height"],
+                       "steps": gen_defaults["steps"], "polls": 0, "retries": 0, "cost": 0.0, "hedged": 0}
+            for attempt in range(1, args.max_retries + 1):
+                if args.budget is not None and spent + estimate_cost(None) > args.budget:
+                    log("[BUDGET] Next task would exceed budget (%.2f + %.2f > %.2f), stopping submits"
+                        % (spent, estimate_cost(None), args.budget))
+                    budget_hit = True
+                    break
+                try:
+                    gen_result = liblib_generate_and_wait(
+                        creds["liblib_access_key"], creds["liblib_secret_key"],
+                        full_prompt, None, args.timeout, args.poll_interval, args.ledger, hedge
+                    )
+                    spent += gen_result.get("cost", 0.0)
+                    hedge_cost += gen_result.get("hedge_cost", 0.0)
+                    queued = gen_result.get("queue_seconds") or 0.0
+                    metrics.update(retries=attempt - 1, polls=metrics["polls"] + gen_result.get("polls", 0),
+                                   cost=metrics["cost"] + gen_result.get("cost", 0.0), queue_seconds=queued,
+                                   render_seconds=round(gen_result.get("elapsed_seconds", 0.0) - queued, 1),
+                                   hedged=max(metrics["hedged"], int(bool(gen_result.get("hedged")))))
+                    if gen_result["status"] in ("success", "timeout"):
+                        latencies.append(gen_result["elapsed_seconds"])
+                    if gen_result["ok"]:
+                        saved_path, transform = resized_output(out_path, w, h) if w and h else (out_path, None)
+                        download_file(gen_result["image_url"], saved_path, files, transform, metrics)
+                        post_start = time.time()
+                        item_result = {"filename": filename, "category": category, "status": "success",
+                                       "output_path": str(saved_path), "image_url": gen_result.get("image_url", ""),
+                                       "task_id": gen_result.get("task_id", "")}
+                        tiling = None
+                        if item_is_tileable(item) and args.tile_fix != "off":
+                            tiling = check_tiling(files.local(saved_path), args.tile_threshold, args.tile_fix)
+                            if tiling is not None:
+                                item_result["tiling"] = tiling
+                        if tiling is None or tiling["ok"]:
+                            nine_slice = None
+                            if item_is_nine_slice(item) and args.nine_slice != "off":
+                                crop = args.nine_slice == "crop" or item.get("nine_slice") == "crop"
+                                nine_slice = check_nine_slice(files.local(saved_path), args.nine_slice_tolerance, crop)
+                                if nine_slice is not None:
+                                    item_result["nine_slice"] = nine_slice
+                            try:
+                                meta_path = write_unity_meta(saved_path, unity_texture_preset(item), args.unity_meta,
+                                                             nine_slice, files)
+                                if meta_path:
+                                    item_result["meta_path"] = str(meta_path)
+                            except (OSError, ValueError) as e:
+                                log("WARNING: .meta not written for %s: %s" % (saved_path, e))
+                            metrics["post_seconds"] = round(time.time() - post_start, 2)
+                            succeeded += 1
+                            log("[OK] Saved: %s" % out_path)
+                            break
+                        metrics["post_seconds"] = round(time.time() - post_start, 2)
+                        last_error = "not tileable (seam score %.2f > %.2f)" % (tiling["score"], args.tile_threshold)
+                        if args.tile_fix == "regenerate" and attempt < args.max_retries:
+                            log("[WARN] Attempt %d/%d: %s, regenerating with a new seed"
+                                % (attempt, args.max_retries, last_error))
+                            item_result = None
+                        else:
+                            rejected = output_root / TILE_REJECT_DIR / category / Path(saved_path).name
+                            files.move(saved_path, rejected)
+                            item_result.update({"status": "needs_regeneration", "error": last_error,
+                                                "output_path": str(rejected)})
+                            failed += 1
+                            log("[REJECT] %s: %s -> %s" % (filename, last_error, rejected))
+                            break
+                    else:
+                        last_error = gen_result.get("error", "unknown")
+                        log("[WARN] Attempt %d/%d failed: %s" % (attempt, args.max_retries, last_error))
+                        if gen_result.get("retryable") is False:
+                            log("[FAIL] Permanent error, not retrying")
+                            break
+                except Exception as e:
+                    last_error = str(e)
+                    log("[WARN] Attempt %d/%d exception: %s" % (attempt, args.max_retries, last_error))
+                if attempt < args.max_retries:
+                    log("Retrying in %ds..." % args.retry_delay)
+                    emit_event("progress", stage="retry", attempt=attempt, error=last_error)
+                    time.sleep(args.retry_delay)
+            if item_result is None and budget_hit and last_error == "unknown":
+                item_result = {"filename": filename, "category": category, "status": "budget_exceeded"}
+                skipped += 1
+            elif item_result is None:
+                item_result = {"filename": filename, "category": category, "status": "failed", "error": last_error}
+                failed += 1
+            if item_result["status"] != "budget_exceeded":
+                perf_add_item(perf, run_id, dict(metrics, status=item_result["status"],
+                                                 elapsed_seconds=round(time.time() - item_start, 1)))
+            set_event_context(index=idx, total=total)
+            add_result(item_result)
+        set_event_context()
+        color = None
+        if color_mode != "off" and succeeded:
+            color = normalize_batch_colors(post, color_mode, args.color_strength, files.local, files.restage)
+        if args.store and succeeded:
+            store = store_open(None if args.store is True else args.store)
+            try:
+                for item, result in post:
+                    if result["status"] == "success":
+                        meta = {"category": result["category"], "importer": unity_texture_preset(item),
+                                "prompt": item.get("prompt", ""), "task_id": result.get("task_id", "")}
+                        if result.get("nine_slice"):
+                            meta["nine_slice"] = result["nine_slice"]
+                        record = store_put_file(store, result["output_path"], meta,
+                                                files.local(result["output_path"]))
+                        result["store"] = {"hash": record["hash"], "variant": record["variant"]}
+                        emit_event("progress", stage="stored", output_path=result["output_path"], **result["store"])
+            finally:
+                store_close(store)
+    finally:
+        commit_start = time.time()
+        committed = files.close()
+    commit_seconds = round(time.time() - commit_start, 2)
+    elapsed = round(time.time() - start_time, 1)
+    log("Batch complete: %d succeeded, %d skipped, %d failed (%.1fs, cost %.2f)"
+        % (succeeded, skipped, failed, elapsed, spent))
+    summary = {"ok": failed == 0 and not budget_hit and not files.errors, "command": "batch", "total": total,
+               "succeeded": succeeded, "skipped": skipped, "failed": failed,
+               "elapsed_seconds": elapsed, "cost_spent": round(spent, 2), "committed_files": committed}
+    if files.errors:
+        summary["write_errors"] = files.errors
+    if args.budget is not None:
+        summary["budget"] = args.budget
+        summary["budget_exceeded"] = budget_hit
+    if latencies:
+        # Baseline: ledger history before this batch, stuck (timed-out) tasks included
+        baseline = render_samples(None, history, ("success", "timeout"))
+        summary["latency"] = {"p50": percentile(latencies, 50), "p95": percentile(latencies, 95),
+                              "p99": percentile(latencies, 99)}
+        if baseline:
+            summary["latency"]["baseline_p99"] = percentile(baseline, 99)
+            summary["latency"]["p99_improvement"] = round(summary["latency"]["baseline_p99"]
+                                                          - summary["latency"]["p99"], 1)
+    summary["hedging"] = {"after_seconds": hedge.after_seconds, "max_hedges": hedge.max_hedges,
+                          "hedges": hedge.hedges, "wins": hedge.wins, "extra_cost": round(hedge_cost, 2)}
+    if color is not None:
+        summary["color_normalization"] = color
+    if run_id is not None:
+        summary["perf_run_id"] = run_id
+    perf_finish_run(perf, run_id, summary, color and color["seconds"], commit_seconds)
+    emit_result(writer.close(summary))
+    return 0 if summary["ok"] else 1
+
+
+# Subcommand: model-batch
+#
+# Spec format (JSON):
+#   {"output_root": "...", "style_prefix": "...", "lod_budgets": [10000, 4000, 1500],
+#    "items": [
+#      {"name": "chest", "type": "text_to_model", "prompt": "wooden treasure chest"},
+#      {"name": "tower", "type": "image_to_model", "image_url": "https://..."},
+#      {"name": "golem", "type": "image_to_model", "category": "Monsters",
+#       "concept": {"prompt": "stone golem, front view", "steps": 20, "width": 768, "height": 768}}
+#    ]}
+# "concept" renders a LiblibAI image (ui-style prompt) and feeds its image_url straight into
+# image_to_model. Output goes to <output_root>/<category>/<filename or name.glb>.
+
+class SubmitGate:
+    """Spaces task submissions from concurrent workers at least `delay` seconds apart."""
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.next_at = 0.0
+
+    def wait(self):
+        with self.lock:
+            now = time.time()
+            slot = max(now, self.next_at)
+            self.next_at = slot + self.delay
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def retry_call(label, attempt_fn, max_retries, retry_delay):
+    """
+    Call attempt_fn() (returns a result dict with "ok") up to max_retries times.
+    Stops early on errors flagged retryable=False. Returns (result or None, last_error).
+    """
+    last_error = "unknown"
+    for attempt in range(1, max_retries + 1):
+        try:
+            result = attempt_fn()
+            if result["ok"]:
+                return result, None
+            last_error = result.get("error", "unknown")
+            log("[WARN] %s attempt %d/%d failed: %s" % (label, attempt, max_retries, last_error))
+            if result.get("retryable") is False:
+                log("[FAIL] %s permanent error, not retrying" % label)
+                break
+        except Exception as e:
+            last_error = str(e)
+            log("[WARN] %s attempt %d/%d exception: %s" % (label, attempt, max_retries, last_error))
+        if attempt < max_retries:
+            log("%s retrying in %ds..." % (label, retry_delay))
+            emit_event("progress", stage="retry", attempt=attempt, error=last_error)
+            time.sleep(retry_delay)
+    return None, last_error
+
+
+def model_item_output(item, output_root):
+    name = item.get("name") or "model"
+    return output_root / item.get("category", "") / (item.get("filename") or name + ".glb")
+
+
+def model_item_error(item):
+    """Validation error for a model-batch item, or None."""
+    task_type = item.get("type", "text_to_model")
+    if task_type == "text_to_model" and not item.get("prompt"):
+        return "text_to_model requires prompt"
+    if task_type == "image_to_model" and not (item.get("image_url") or (item.get("concept") or {}).get("prompt")):
+        return "image_to_model requires image_url or concept.prompt"
+    if task_type not in ("text_to_model", "image_to_model"):
+        return "unknown type: %s" % task_type
+    return None
+
+
+def run_model_item(item, ctx):
+    """Render (optional concept) -> Tripo3D task -> download (-> LODs) for one spec item."""
+    args, creds = ctx["args"], ctx["creds"]
+    name = item.get("name") or "model"
+    task_type = item.get("type", "text_to_model")
+    out_path = model_item_output(item, ctx["output_root"])
+    label = "[%s]" % name
+    set_event_context(name=name)
+    result = {"name": name, "type": task_type, "category": item.get("category", ""),
+              "output_path": str(out_path)}
+    start = time.time()
+    image_url = item.get("image_url")
+    concept = item.get("concept")
+    if task_type == "image_to_model" and not image_url:
+        prompt = compose_prompt(ctx["style_prefix"], concept["prompt"])
+        params = dict((k, concept[k]) for k in ("steps", "width", "height", "imgCount", "seed", "templateUuid")
+                      if k in concept)
+
+        def render():
+            ctx["gate"].wait()
+            log("%s Rendering concept image..." % label)
+            return liblib_generate_and_wait(creds["liblib_access_key"], creds["liblib_secret_key"], prompt,
+                                            params, args.concept_timeout, args.poll_interval, args.ledger)
+        gen, error = retry_call(label + " concept", render, args.max_retries, args.retry_delay)
+        if gen is None:
+            result.update({"status": "failed", "error": "concept render failed: %s" % error,
+                           "elapsed_seconds": round(time.time() - start, 1)})
+            return result
+        image_url = gen["image_url"]
+        result.update({"concept_task_id": gen["task_id"], "image_url": image_url})
+
+    def generate():
+        ctx["gate"].wait()
+        log("%s Submitting %s..." % (label, task_type))
+        return tripo_generate_and_wait(creds["tripo_api_key"], task_type, prompt=item.get("prompt"),
+                                       image_url=image_url, timeout=args.timeout, poll_interval=args.poll_interval)
+    gen, error = retry_call(label, generate, args.max_retries, args.retry_delay)
+    if gen is None:
+        result.update({"status": "failed", "error": error, "elapsed_seconds": round(time.time() - start, 1)})
+        return result
+    result.update({"task_id": gen["task_id"], "model_url": gen["model_url"]})
+
+    # The finished model is paid for: a failed download fetches the same URL again, never resubmits
+    def download():
+        download_file(gen["model_url"], out_path)
+        return {"ok": True}
+    done, error = retry_call(label + " download", download, args.max_retries, args.retry_delay)
+    if done is None:
+        result.update({"status": "failed", "error": "download failed: %s" % error,
+                       "elapsed_seconds": round(time.time() - start, 1)})
+        return result
+    result["status"] = "success"
+    budgets = item.get("lod_budgets") or ctx["lod_budgets"]
+    if budgets:
+        try:
+            result["lod"] = glb_generate_lods(out_path, budgets)
+        except (RuntimeError, ValueError, struct.error) as e:
+            log("WARNING: %s LOD generation skipped: %s" % (label, e))
+            result["lod_error"] = str(e)
+    result["elapsed_seconds"] = round(time.time() - start, 1)
+    return result
+
+
+def cmd_model_batch(args):
+    creds = load_config(args.config, tripo_key_override=args.tripo_key)
+    try:
+        loaded = open_spec(args.spec)
+    except Exception as e:
+        emit_result({"ok": False, "command": "model-batch", "error": "Failed to load spec: %s" % e})
+        return 1
+    spec, items = loaded["header"], list(loaded["items"]())
+    if not items:
+        emit_result({"ok": False, "command": "model-batch", "error": "No items in spec."})
+        return 1
+    style_prefix = args.style_prefix if args.style_prefix is not None else spec.get("style_prefix", BASE_PROMPT)
+    output_root = Path(args.output_root or spec.get("output_root", str(DEFAULT_OUTPUT_DIR)))
+    lod_budgets = parse_int_list(args.lod_budgets) if args.lod_budgets else spec.get("lod_budgets")
+    if args.dry_run:
+        plan = {"ok": True, "command": "model-batch", "dry_run": True, "total": len(items),
+                "output_root": str(output_root), "concurrency": args.concurrency, "items": []}
+        for item in items:
+            out_path = model_item_output(item, output_root)
+            entry = {"name": item.get("name"), "type": item.get("type", "text_to_model"),
+                     "output_path": str(out_path), "exists": out_path.exists(),
+                     "chained": bool(item.get("concept") and not item.get("image_url"))}
+            error = model_item_error(item)
+            if error:
+                entry["error"] = error
+            plan["items"].append(entry)
+            emit_event("item", **entry)
+        emit_result(plan)
+        return 0
+    if not creds["tripo_api_key"]:
+        emit_result({"ok": False, "command": "model-batch", "error": "Missing Tripo3D API key."})
+        return 1
+    needs_liblib = any(i.get("concept") and not i.get("image_url") for i in items)
+    if needs_liblib and (not creds["liblib_access_key"] or not creds["liblib_secret_key"]):
+        emit_result({"ok": False, "command": "model-batch", "error": "Missing LiblibAI credentials for concept renders."})
+        return 1
+    ctx = {"args": args, "creds": creds, "style_prefix": style_prefix, "output_root": output_root,
+           "lod_budgets": lod_budgets, "gate": SubmitGate(args.submit_delay)}
+    total = len(items)
+    results = [None] * total
+    start_time = time.time()
+    log("Model batch started: %d items, concurrency %d" % (total, args.concurrency))
+    emit_event("start", command="model-batch", total=total)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, args.concurrency)) as pool:
+        futures = {}
+        for idx, item in enumerate(items):
+            out_path = model_item_output(item, output_root)
+            error = model_item_error(item)
+            if error:
+                results[idx] = {"name": item.get("name"), "type": item.get("type", "text_to_model"),
+                                "status": "failed", "error": error}
+                emit_event("item", **results[idx])
+            elif args.skip_existing and out_path.exists():
+                log("SKIP (exists): %s" % out_path)
+                results[idx] = {"name": item.get("name"), "type": item.get("type", "text_to_model"),
+                                "status": "skipped", "output_path": str(out_path)}
+                emit_event("item", **results[idx])
+            else:
+                futures[pool.submit(run_model_item, item, ctx)] = idx
+        done = 0
+        for future in concurrent.futures.as_completed(futures):
+            idx = futures[future]
+            try:
+                results[idx] = future.result()
             except Exception as e:
-                last_error = str(e)
-                log("[WARN] Attempt %d/%d exception: %s" % (attempt, args.max_retries, last_error))
-            if attempt < args.max_retries:
-                log("Retrying in %ds..." % args.retry_delay)
-                time.sleep(args.retry_delay)
-        if item_result is None:
-            item_result = {"filename": filename, "category": category, "status": "failed", "error": last_error}
-            failed += 1
-        results.append(item_result)
+                results[idx] = {"name": items[idx].get("name"), "status": "failed", "error": "unexpected: %s" % e}
+            done += 1
+            log("[%d/%d] %s: %s" % (done, len(futures), results[idx]["status"].upper(), results[idx].get("name")))
+            emit_event("item", index=idx + 1, total=total, **results[idx])
+    succeeded = sum(1 for r in results if r["status"] == "success")
+    skipped = sum(1 for r in results if r["status"] == "skipped")
+    failed = total - succeeded - skipped
     elapsed = round(time.time() - start_time, 1)
-    log("Batch complete: %d succeeded, %d skipped, %d failed (%.1fs)" % (succeeded, skipped, failed, elapsed))
-    emit_result({"ok": failed == 0, "command": "batch", "total": total,
+    log("Model batch complete: %d succeeded, %d skipped, %d failed (%.1fs)" % (succeeded, skipped, failed, elapsed))
+    emit_result({"ok": failed == 0, "command": "model-batch", "total": total,
                  "succeeded": succeeded, "skipped": skipped, "failed": failed,
                  "elapsed_seconds": elapsed, "results": results})
     return 0 if failed == 0 else 1
 
 
+# Subcommand: sweep
+#
+# Renders every prompt under every combination of settings and tabulates render time and cost
+# against quality proxies, so each category can use the cheapest settings that still look right.
+# Grid from the CLI, or from the spec's "sweep" block (CLI flags win):
+#   {"style_prefix": "...", "sweep": {"steps": [12, 20, 28], "sizes": ["512x896", "768x1344"],
+#                                     "template_uuids": ["..."], "seeds": [1234]},
+#    "items": [...]}
+# Metrics (on the render scaled to SWEEP_EVAL_SIDE): sharpness = Laplacian variance over opaque
+# pixels, alpha_coverage = opaque fraction, subject_coverage = fraction differing from the border.
+
+def parse_size_list(value):
+    """Parse "512x896,768x1344" (or a list of such strings) into [(512, 896), (768, 1344)]."""
+    if isinstance(value, str):
+        value = value.split(",")
+    sizes = []
+    for v in value:
+        w, h = str(v).lower().split("x")
+        sizes.append((int(w), int(h)))
+    return sizes
+
+
+def sweep_grid(args, header):
+    """Settings grid as a list of liblib params dicts (template x size x steps x seed)."""
+    grid = header.get("sweep") or {}
+    templates = args.template_uuid.split(",") if args.template_uuid else grid.get("template_uuids") or [LIBLIB_TEMPLATE]
+    sizes = parse_size_list(args.size if args.size else grid.get("sizes") or ["%dx%d" % (DEFAULT_GEN_WIDTH, DEFAULT_GEN_HEIGHT)])
+    steps = parse_int_list(args.steps) if args.steps else grid.get("steps") or [DEFAULT_STEPS]
+    # One shared seed by default, so settings are compared on the same composition
+    seeds = parse_int_list(args.seeds) if args.seeds else grid.get("seeds") or [random.randint(1, 2 ** 31 - 1)]
+    return [{"templateUuid": t, "width": w, "height": h, "steps": int(n), "seed": int(seed)}
+            for t in templates for (w, h) in sizes for n in steps for seed in seeds]
+
+
+def sweep_subjects(args, header, items):
+    """(name, category, full prompt) per swept prompt: --prompt values, else --per-category spec items."""
+    style_prefix = args.style_prefix if args.style_prefix is not None else header.get("style_prefix", BASE_PROMPT)
+    compose = prompt_compiler(header, style_prefix)
+    if args.prompt:
+        return [("prompt%d" % i, args.category, compose({"prompt": p, "category": args.category}))
+                for i, p in enumerate(args.prompt, 1)]
+    taken = {}
+    subjects = []
+    for item in items:
+        category = item.get("category", "")
+        if args.category and category != args.category:
+            continue
+        if taken.get(category, 0) >= args.per_category:
+            continue
+        taken[category] = taken.get(category, 0) + 1
+        subjects.append((Path(item.get("filename", "item%d" % len(subjects))).stem, category, compose(item)))
+    return subjects
+
+
+def render_quality(path):
+    """Sharpness / alpha coverage / subject coverage of a render (see above); None without numpy/Pillow."""
+    try:
+        np, Image = require_numpy(), require_pillow()
+    except RuntimeError:
+        return None
+    with Image.open(path) as img:
+        img = img.convert("RGBA")
+        scale = float(SWEEP_EVAL_SIDE) / max(img.size)
+        img = img.resize((max(1, int(round(img.width * scale))), max(1, int(round(img.height * scale)))), Image.LANCZOS)
+    px = np.asarray(img, dtype=np.float64)
+    rgb, opaque = px[:, :, :3], px[:, :, 3] >= FLIPBOOK_ALPHA_TRIM
+    gray = rgb @ np.array([0.299, 0.587, 0.114])
+    lap = (4 * gray[1:-1, 1:-1] - gray[:-2, 1:-1] - gray[2:, 1:-1] - gray[1:-1, :-2] - gray[1:-1, 2:])
+    inner = opaque[1:-1, 1:-1]
+    border = np.concatenate([rgb[0], rgb[-1], rgb[:, 0], rgb[:, -1]])
+    subject = (np.abs(rgb - np.median(border, axis=0)).max(axis=2) > SWEEP_SUBJECT_TOLERANCE) & opaque
+    return {"sharpness": round(float(lap[inner].var()), 1) if inner.any() else 0.0,
+            "alpha_coverage": round(float(opaque.mean()), 3),
+            "subject_coverage": round(float(subject.mean()), 3)}
+
+
+def run_sweep_job(job, ctx):
+    """Render one (subject, settings) job, download it into the sweep dir and score it."""
+    args, creds = ctx["args"], ctx["creds"]
+    params = job["params"]
+    result = {"name": job["name"], "category": job["category"], "template": params["templateUuid"],
+              "size": "%dx%d" % (params["width"], params["height"]), "steps": params["steps"], "seed": params["seed"]}
+    ctx["gate"].wait()
+    log("[%s] Rendering %s, %d steps..." % (job["name"], result["size"], params["steps"]))
+    gen = liblib_generate_and_wait(creds["liblib_access_key"], creds["liblib_secret_key"], job["prompt"], params,
+                                   args.timeout, args.poll_interval, args.ledger)
+    queued = gen.get("queue_seconds") or 0.0
+    result.update({"status": gen["status"], "task_id": gen.get("task_id"), "cost": gen.get("cost", 0.0),
+                   "queue_seconds": queued, "render_seconds": round(gen.get("elapsed_seconds", 0.0) - queued, 1)})
+    if not gen["ok"]:
+        result["error"] = gen.get("error", "unknown")
+        return result
+    out_path = ctx["output_dir"] / job["category"] / ("%s_%s_%s_s%d_%d.png" % (
+        job["name"], params["templateUuid"][:8], result["size"], params["steps"], params["seed"]))
+    try:
+        download_file(gen["image_url"], out_path)
+    except (RuntimeError, OSError) as e:
+        result.update({"status": "failed", "error": "download failed: %s" % e})
+        return result
+    result["output_path"] = str(out_path)
+    result.update(render_quality(out_path) or {})
+    return result
+
+
+def sweep_summarize(results, min_quality):
+    """
+    Per category and settings: n, render_p50, mean cost and quality metrics; plus the recommended
+    settings per category (cheapest, then fastest, within min_quality of the best sharpness).
+    """
+    groups = {}
+    for r in results:
+        groups.setdefault((r["category"], r["template"], r["size"], r["steps"]), []).append(r)
+    settings = []
+    for (category, template, size, steps), members in sorted(groups.items()):
+        done = [r for r in members if r["status"] == "success"]
+        entry = {"category": category, "template": template, "size": size, "steps": steps,
+                 "jobs": len(members), "succeeded": len(done)}
+        renders = [r["render_seconds"] for r in done]
+        entry["render_p50"] = round(percentile(renders, 50), 1) if renders else None
+        entry["cost"] = round(statistics.mean(r["cost"] for r in done), 2) if done else None
+        for key in ("sharpness", "alpha_coverage", "subject_coverage"):
+            values = [r[key] for r in done if key in r]
+            entry[key] = round(statistics.mean(values), 3) if values else None
+        settings.append(entry)
+    recommended = {}
+    for category in sorted(set(e["category"] for e in settings)):
+        scored = [e for e in settings if e["category"] == category and e["sharpness"] is not None]
+        if not scored:
+            continue
+        best = max(e["sharpness"] for e in scored)
+        good = [e for e in scored if e["sharpness"] >= min_quality * best]
+        recommended[category] = min(good, key=lambda e: (e["cost"], e["render_p50"]))
+    return settings, recommended
+
+
+def log_sweep_table(settings, recommended):
+    log("%-12s %-8s %-10s %5s %4s %8s %7s %10s %6s %7s" % ("category", "template", "size", "steps", "ok",
+                                                          "p50 s", "cost", "sharpness", "alpha", "subject"))
+    for e in settings:
+        mark = " *" if recommended.get(e["category"]) is e else ""
+        log("%-12s %-8s %-10s %5d %4s %8s %7s %10s %6s %7s%s" % (
+            e["category"][:12] or "-", e["template"][:8], e["size"], e["steps"],
+            "%d/%d" % (e["succeeded"], e["jobs"]), e["render_p50"], e["cost"], e["sharpness"],
+            e["alpha_coverage"], e["subject_coverage"], mark))
+
+
+def cmd_sweep(args):
+    creds = load_config(args.config)
+    header, items = {}, []
+    if args.spec:
+        try:
+            loaded = open_spec(args.spec)
+        except Exception as e:
+            emit_result({"ok": False, "command": "sweep", "error": "Failed to load spec: %s" % e})
+            return 1
+        header, items = loaded["header"], loaded["items"]()
+    elif not args.prompt:
+        emit_result({"ok": False, "command": "sweep", "error": "Give --prompt or --spec."})
+        return 1
+    try:
+        grid = sweep_grid(args, header)
+        subjects = sweep_subjects(args, header, items)
+    except ValueError as e:
+        emit_result({"ok": False, "command": "sweep", "error": "Bad sweep settings: %s" % e})
+        return 1
+    if not subjects:
+        emit_result({"ok": False, "command": "sweep", "error": "No prompts to sweep."})
+        return 1
+    jobs = [{"name": name, "category": category, "prompt": prompt, "params": params}
+            for name, category, prompt in subjects for params in grid]
+    total = len(jobs)
+    if args.dry_run:
+        history = ledger_load(args.ledger)
+        plan = {"ok": True, "command": "sweep", "dry_run": True, "total": total, "settings": len(grid),
+                "prompts": len(subjects), "concurrency": args.concurrency, "items": []}
+        for job in jobs:
+            params = job["params"]
+            entry = {"name": job["name"], "category": job["category"], "template": params["templateUuid"],
+                     "size": "%dx%d" % (params["width"], params["height"]), "steps": params["steps"],
+                     "seed": params["seed"], "prompt_preview": job["prompt"][:120] + "...",
+                     "estimated_cost": estimate_cost(params),
+                     "estimated_seconds": estimate_render_seconds(params, history)}
+            plan["items"].append(entry)
+            emit_event("item", **entry)
+        plan["estimated_cost"] = round(sum(e["estimated_cost"] for e in plan["items"]), 2)
+        plan["estimated_wall_seconds"] = round(sum(e["estimated_seconds"] for e in plan["items"])
+                                               / max(1, min(args.concurrency, total)), 1)
+        emit_result(plan)
+        return 0
+    if not creds["liblib_access_key"] or not creds["liblib_secret_key"]:
+        emit_result({"ok": False, "command": "sweep", "error": "Missing LiblibAI credentials."})
+        return 1
+    output_dir = Path(args.output_dir) if args.output_dir else DEFAULT_SWEEP_DIR / time.strftime("%Y%m%d_%H%M%S")
+    ctx = {"args": args, "creds": creds, "output_dir": output_dir, "gate": SubmitGate(args.submit_delay)}
+    results = [None] * total
+    start_time = time.time()
+    log("Sweep started: %d prompts x %d settings = %d renders, concurrency %d"
+        % (len(subjects), len(grid), total, args.concurrency))
+    emit_event("start", command="sweep", total=total)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, args.concurrency)) as pool:
+        futures = dict((pool.submit(run_sweep_job, job, ctx), idx) for idx, job in enumerate(jobs))
+        done = 0
+        for future in concurrent.futures.as_completed(futures):
+            idx = futures[future]
+            try:
+                results[idx] = future.result()
+            except Exception as e:
+                job = jobs[idx]
+                results[idx] = {"name": job["name"], "category": job["category"],
+                                "template": job["params"]["templateUuid"],
+                                "size": "%dx%d" % (job["params"]["width"], job["params"]["height"]),
+                                "steps": job["params"]["steps"], "seed": job["params"]["seed"],
+                                "status": "failed", "error": "unexpected: %s" % e}
+            done += 1
+            log("[%d/%d] %s: %s %s/%d steps" % (done, total, results[idx]["status"].upper(), results[idx]["name"],
+                                                results[idx]["size"], results[idx]["steps"]))
+            emit_event("item", index=idx + 1, total=total, **results[idx])
+    settings, recommended = sweep_summarize(results, args.min_quality)
+    log_sweep_table(settings, recommended)
+    succeeded = sum(1 for r in results if r["status"] == "success")
+    result = {"ok": succeeded > 0, "command": "sweep", "total": total, "succeeded": succeeded,
+              "failed": total - succeeded, "cost_spent": round(sum(r.get("cost", 0.0) for r in results), 2),
+              "elapsed_seconds": round(time.time() - start_time, 1), "output_dir": str(output_dir),
+              "settings": settings, "recommended": recommended, "results": results}
+    try:
+        output_dir.mkdir(parents=True, exist_ok=True)
+        atomic_write(output_dir / "sweep.json", json.dumps(result, ensure_ascii=False, indent=2).encode("utf-8"))
+        result["report_path"] = str(output_dir / "sweep.json")
+    except OSError as e:
+        log("WARNING: Sweep report not written: %s" % e)
+    emit_result(result)
+    return 0 if result["ok"] else 1
+
+
+# Subcommand: perf
+
+def cmd_perf(args):
+    path = Path(args.db) if args.db else DEFAULT_PERF_DB
+    if not path.exists():
+        emit_result({"ok": False, "command": "perf", "error": "no performance database at %s (run a batch first)" % path})
+        return 1
+    db = perf_open(path)
+    if db is None:
+        emit_result({"ok": False, "command": "perf", "error": "cannot open %s" % path})
+        return 1
+    try:
+        report = perf_report(db, args.days, args.window, args.baseline, args.bucket, args.threshold)
+    finally:
+        db.close()
+    for r in report["regressions"]:
+        log("[REGRESSION] %s: %s -> %s (last %dd vs previous %dd)"
+            % (r["metric"], r["baseline"], r["recent"], args.window, args.baseline))
+    result = {"ok": not (args.fail_on_regression and report["regressions"]), "command": "perf",
+              "action": args.action, "db": str(path)}
+    result.update(report)
+    emit_result(result)
+    return 0 if result["ok"] else 1
+
+
 # Subcommand: status
 
 def cmd_status(args):
@@ -537,6 +4079,9 @@ def build_parser():
     p_ui.add_argument("--height", type=int, default=None)
     p_ui.add_argument("-o", "--output", default=None)
     p_ui.add_argument("--style-prefix", default=None)
+    p_ui.add_argument("--prompt-template", default=None,
+                      help="e.g. \"{style}, {prompt}, {palette} palette\" (variables: style, prompt, width, height, --var)")
+    p_ui.add_argument("--var", action="append", default=[], metavar="KEY=VALUE", help="Prompt template variable")
     p_ui.add_argument("--template-uuid", default=LIBLIB_TEMPLATE)
     p_ui.add_argument("--steps", type=int, default=DEFAULT_STEPS)
     p_ui.add_argument("--seed", type=int, default=DEFAULT_SEED)
@@ -548,20 +4093,111 @@ def build_parser():
     p_ui.add_argument("-c", "--config", default=None)
     p_ui.add_argument("--no-resize", action="store_true")
     p_ui.add_argument("--no-download", action="store_true")
+    p_ui.add_argument("--ledger", default=None, help="Cost ledger path (default: .sprite_cli/cost_ledger.jsonl)")
+    p_ui.add_argument("--importer", choices=sorted(UNITY_TEXTURE_PRESETS), default="sprite",
+                      help="Unity TextureImporter preset for the .meta (default: sprite)")
+    p_ui.add_argument("--unity-meta", choices=["missing", "refresh", "off"], default="missing",
+                      help="Write Unity .meta files next to outputs inside Assets/ (default: missing only)")
     # model
     p_model = sub.add_parser("model", help="Generate 3D model via Tripo3D")
     p_model.add_argument("--type", default="text_to_model", choices=["text_to_model", "image_to_model"])
     p_model.add_argument("--prompt", default=None)
     p_model.add_argument("--image-url", default=None)
     p_model.add_argument("-o", "--output", default=None)
-    p_model.add_argument("--timeout", type=int, default=600)
+    p_model.add_argument("--timeout", type=int, default=DEFAULT_MODEL_TIMEOUT)
     p_model.add_argument("--poll-interval", type=int, default=DEFAULT_POLL_INTERVAL)
     p_model.add_argument("--tripo-key", default=None)
     p_model.add_argument("-c", "--config", default=None)
     p_model.add_argument("--no-download", action="store_true")
+    p_model.add_argument("--lod", action="store_true", help="Generate LOD GLBs after download")
+    p_model.add_argument("--lod-budgets", default=",".join(str(b) for b in DEFAULT_LOD_BUDGETS))
+    # vfx
+    p_vfx = sub.add_parser("vfx", help="Animated VFX: concurrent seed-locked frames packed into a flipbook sheet")
+    p_vfx.add_argument("--prompt", required=True)
+    p_vfx.add_argument("--frames", type=int, default=DEFAULT_FLIPBOOK_FRAMES)
+    p_vfx.add_argument("--columns", type=int, default=None, help="Tiles per row (default: ceil(sqrt(frames)))")
+    p_vfx.add_argument("--width", type=int, default=DEFAULT_FLIPBOOK_FRAME_SIZE, help="Frame width in the sheet")
+    p_vfx.add_argument("--height", type=int, default=DEFAULT_FLIPBOOK_FRAME_SIZE, help="Frame height in the sheet")
+    p_vfx.add_argument("--fps", type=float, default=DEFAULT_FLIPBOOK_FPS)
+    p_vfx.add_argument("--seed", type=int, default=None, help="Seed shared by every frame (default: random)")
+    p_vfx.add_argument("-o", "--output", default=None)
+    p_vfx.add_argument("--style-prefix", default=None)
+    p_vfx.add_argument("--template-uuid", default=LIBLIB_TEMPLATE)
+    p_vfx.add_argument("--steps", type=int, default=DEFAULT_STEPS)
+    p_vfx.add_argument("--gen-width", type=int, default=DEFAULT_FLIPBOOK_GEN_SIZE)
+    p_vfx.add_argument("--gen-height", type=int, default=DEFAULT_FLIPBOOK_GEN_SIZE)
+    p_vfx.add_argument("--submit-delay", type=int, default=DEFAULT_SUBMIT_DELAY,
+                       help="Minimum seconds between frame submissions")
+    p_vfx.add_argument("--max-retries", type=int, default=DEFAULT_MAX_RETRIES)
+    p_vfx.add_argument("--retry-delay", type=int, default=DEFAULT_RETRY_DELAY)
+    p_vfx.add_argument("--timeout", type=int, default=DEFAULT_TIMEOUT)
+    p_vfx.add_argument("--poll-interval", type=int, default=DEFAULT_POLL_INTERVAL)
+    p_vfx.add_argument("-c", "--config", default=None)
+    p_vfx.add_argument("--ledger", default=None, help="Cost ledger path (default: .sprite_cli/cost_ledger.jsonl)")
+    p_vfx.add_argument("--importer", choices=sorted(UNITY_TEXTURE_PRESETS), default="vfx")
+    p_vfx.add_argument("--unity-meta", choices=["missing", "refresh", "off"], default="missing")
+    # lod
+    p_lod = sub.add_parser("lod", help="Decimate a GLB into a LOD chain (<stem>_LOD0..N.glb)")
+    p_lod.add_argument("-i", "--input", required=True)
+    p_lod.add_argument("--budgets", default=",".join(str(b) for b in DEFAULT_LOD_BUDGETS),
+                       help="Triangle budget per LOD level, comma separated")
+    p_lod.add_argument("-o", "--output-dir", default=None)
+    # tile
+    p_tile = sub.add_parser("tile", help="Check (and repair) seamless tiling of textures")
+    p_tile.add_argument("-i", "--input", nargs="+", required=True)
+    p_tile.add_argument("--threshold", type=float, default=TILE_SEAM_THRESHOLD)
+    p_tile.add_argument("--fix", action="store_true", help="Offset-and-blend repair in place when over threshold")
+    # slice
+    p_slice = sub.add_parser("slice", help="Detect 9-slice borders of frame textures (and crop to minimal size)")
+    p_slice.add_argument("-i", "--input", nargs="+", required=True)
+    p_slice.add_argument("--tolerance", type=float, default=NINE_SLICE_TOLERANCE,
+                         help="Max mean per-channel difference (0-255) between adjacent stretchable rows/columns")
+    p_slice.add_argument("--crop", action="store_true", help="Shrink the stretchable center in place")
+    p_slice.add_argument("--importer", choices=sorted(UNITY_TEXTURE_PRESETS), default="sprite")
+    p_slice.add_argument("--unity-meta", choices=["missing", "refresh", "off"], default="refresh",
+                         help="Write the borders into the Unity .meta (default: refresh, keeping the GUID)")
+    # color
+    p_color = sub.add_parser("color", help="Score and normalize color consistency across a set of images")
+    p_color.add_argument("-i", "--input", nargs="+", required=True)
+    p_color.add_argument("--strength", type=float, default=DEFAULT_COLOR_STRENGTH)
+    p_color.add_argument("--report-only", action="store_true", help="Only report consistency scores")
+    p_color_out = p_color.add_mutually_exclusive_group()
+    p_color_out.add_argument("--in-place", action="store_true", help="Overwrite the inputs with the corrected images")
+    p_color_out.add_argument("-o", "--output-dir",
+                             help="Write corrected images here (default: <stem>%s next to each input)"
+                             % COLOR_OUTPUT_SUFFIX)
+    # compare
+    p_compare = sub.add_parser("compare", help="Score Unity screenshots against the UI mockups (SSIM, delta E, heatmaps)")
+    p_compare.add_argument("-i", "--input", nargs="*", default=None,
+                           help="Screenshot files or directories (default: .task/screenshots)")
+    p_compare.add_argument("--mockups", nargs="+", default=None, help="Mockup directories (default: Screens, Popups)")
+    p_compare.add_argument("--min-ssim", type=float, default=DEFAULT_COMPARE_MIN_SSIM,
+                           help="Fail (exit 1) when a screenshot scores below this SSIM")
+    p_compare.add_argument("--delta-e", type=float, default=COMPARE_DELTA_E,
+                           help="CIE76 delta E counted as a visible change in changed_fraction")
+    p_compare.add_argument("--max-side", type=int, default=COMPARE_MAX_SIDE,
+                           help="Compare at this resolution (longest side, pixels)")
+    p_compare.add_argument("--jobs", type=int, default=None, help="Worker processes (default: CPU count)")
+    p_compare.add_argument("--heatmap-dir", default=None, help="Heatmap output (default: .sprite_cli/compare)")
+    p_compare.add_argument("--no-heatmap", action="store_true")
+    # store
+    p_store = sub.add_parser("store", help="Packed asset store: add, list, checkout into Assets/, export")
+    p_store.add_argument("action", choices=["add", "list", "checkout", "export"])
+    p_store.add_argument("-i", "--input", nargs="+", default=[], help="add: files to store")
+    p_store.add_argument("--select", nargs="+", default=None,
+                         help="name (latest variant), name@variant or a sha256 prefix")
+    p_store.add_argument("-o", "--output", default=None,
+                         help="checkout: output root (default: original Assets/ path); export: destination store")
+    p_store.add_argument("--category", default="")
+    p_store.add_argument("--variant", default=None)
+    p_store.add_argument("--importer", choices=sorted(UNITY_TEXTURE_PRESETS), default="sprite")
+    p_store.add_argument("--unity-meta", choices=["missing", "refresh", "off"], default="missing")
+    p_store.add_argument("--store", default=None, help="Store directory (default: .sprite_cli/store)")
     # batch
     p_batch = sub.add_parser("batch", help="Batch generate UI images from JSON spec")
-    p_batch.add_argument("-s", "--spec", required=True)
+    p_batch.add_argument("-s", "--spec", required=True, help="JSON spec, or JSONL (one item per line) for large specs")
+    p_batch.add_argument("--results", default=None,
+                         help="Write per-item results (or dry-run items) to this JSONL file as they happen (replaced each run)")
     p_batch.add_argument("--output-root", default=None)
     p_batch.add_argument("--style-prefix", default=None)
     p_batch.add_argument("--submit-delay", type=int, default=DEFAULT_SUBMIT_DELAY)
@@ -572,22 +4208,132 @@ def build_parser():
     p_batch.add_argument("--skip-existing", action="store_true")
     p_batch.add_argument("-c", "--config", default=None)
     p_batch.add_argument("--dry-run", action="store_true")
+    p_batch.add_argument("--tile-threshold", type=float, default=TILE_SEAM_THRESHOLD,
+                         help="Max seam score for tileable (terrain) items; ~1.0 is seamless")
+    p_batch.add_argument("--tile-fix", choices=["blend", "regenerate", "off"], default="blend",
+                         help="Over threshold: offset-and-blend repair, or regenerate with a new seed")
+    p_batch.add_argument("--nine-slice", choices=["detect", "crop", "off"], default="detect",
+                         help="Frame items (\"nine_slice\" or frame/panel filenames): detect borders, or also crop")
+    p_batch.add_argument("--nine-slice-tolerance", type=float, default=NINE_SLICE_TOLERANCE)
+    p_batch.add_argument("--color-normalize", choices=COLOR_NORMALIZE_MODES, default=None,
+                         help="Match new outputs' color distribution to their category/batch (default: spec or off)")
+    p_batch.add_argument("--color-strength", type=float, default=DEFAULT_COLOR_STRENGTH,
+                         help="0..1 blend between the original and the matched colors")
+    p_batch.add_argument("--store", nargs="?", const=True, default=None,
+                         help="Also keep outputs as variants in the packed asset store (optional store dir)")
+    p_batch.add_argument("--unity-meta", choices=["missing", "refresh", "off"], default="missing",
+                         help="Write Unity .meta files (importer preset per category, or item \"importer\")")
+    p_batch.add_argument("--perf-db", default=None,
+                         help="Record run/item timings here (default: .sprite_cli/perf.sqlite3)")
+    p_batch.add_argument("--no-perf", action="store_true", help="Do not record timings")
+    p_batch.add_argument("--writer-threads", type=int, default=DEFAULT_WRITER_THREADS,
+                         help="Threads encoding/writing outputs into the staging folder")
+    p_batch.add_argument("--commit-every", type=int, default=None,
+                         help="Move staged outputs into place every N items (0: once, after the batch; default: %d, "
+                              "or once when color normalization is on)" % DEFAULT_COMMIT_EVERY)
+    p_batch.add_argument("--budget", type=float, default=None,
+                         help="Stop submitting once estimated spend would exceed this many points")
+    p_batch.add_argument("--ledger", default=None, help="Cost ledger path (default: .sprite_cli/cost_ledger.jsonl)")
+    p_batch.add_argument("--hedge-budget", type=float, default=DEFAULT_HEDGE_BUDGET,
+                         help="Max duplicate (hedge) submits as a fraction of items (default: 0.1, 0 disables)")
+    p_batch.add_argument("--hedge-percentile", type=float, default=DEFAULT_HEDGE_PERCENTILE,
+                         help="Hedge a task once it runs past this percentile of ledger render times")
+    p_batch.add_argument("--hedge-after", type=float, default=None,
+                         help="Fixed hedge threshold in seconds (overrides --hedge-percentile)")
+    # model-batch
+    p_mbatch = sub.add_parser("model-batch", help="Concurrent Tripo3D batch from JSON spec (with concept render chaining)")
+    p_mbatch.add_argument("-s", "--spec", required=True)
+    p_mbatch.add_argument("--output-root", default=None)
+    p_mbatch.add_argument("--style-prefix", default=None, help="Prefix for concept render prompts")
+    p_mbatch.add_argument("--concurrency", type=int, default=DEFAULT_MODEL_CONCURRENCY)
+    p_mbatch.add_argument("--submit-delay", type=int, default=DEFAULT_SUBMIT_DELAY,
+                          help="Minimum seconds between task submissions across workers")
+    p_mbatch.add_argument("--max-retries", type=int, default=DEFAULT_MAX_RETRIES)
+    p_mbatch.add_argument("--retry-delay", type=int, default=DEFAULT_RETRY_DELAY)
+    p_mbatch.add_argument("--timeout", type=int, default=DEFAULT_MODEL_TIMEOUT)
+    p_mbatch.add_argument("--concept-timeout", type=int, default=DEFAULT_TIMEOUT)
+    p_mbatch.add_argument("--poll-interval", type=int, default=DEFAULT_POLL_INTERVAL)
+    p_mbatch.add_argument("--lod-budgets", default=None, help="Generate LODs after download, e.g. 10000,4000,1500")
+    p_mbatch.add_argument("--skip-existing", action="store_true")
+    p_mbatch.add_argument("--tripo-key", default=None)
+    p_mbatch.add_argument("-c", "--config", default=None)
+    p_mbatch.add_argument("--ledger", default=None, help="Cost ledger path (default: .sprite_cli/cost_ledger.jsonl)")
+    p_mbatch.add_argument("--dry-run", action="store_true")
+    # sweep
+    p_sweep = sub.add_parser("sweep", help="Render prompts over a settings grid; time and cost vs quality per category")
+    p_sweep.add_argument("--prompt", action="append", default=[], help="Prompt to sweep (repeatable)")
+    p_sweep.add_argument("-s", "--spec", default=None, help="Sweep spec items (and the spec's \"sweep\" grid)")
+    p_sweep.add_argument("--category", default="", help="Category of --prompt, or only this spec category")
+    p_sweep.add_argument("--per-category", type=int, default=1, help="Spec items swept per category")
+    p_sweep.add_argument("--style-prefix", default=None)
+    p_sweep.add_argument("--steps", default=None, help="e.g. 12,20,28")
+    p_sweep.add_argument("--size", default=None, help="Generation sizes, e.g. 512x896,768x1344")
+    p_sweep.add_argument("--template-uuid", default=None, help="Comma-separated LiblibAI templates")
+    p_sweep.add_argument("--seeds", default=None, help="Comma-separated seeds (default: one random seed for all)")
+    p_sweep.add_argument("--min-quality", type=float, default=DEFAULT_SWEEP_MIN_QUALITY,
+                         help="Recommend the cheapest settings within this fraction of the best sharpness")
+    p_sweep.add_argument("--output-dir", default=None, help="Renders and sweep.json (default: .sprite_cli/sweep/<time>)")
+    p_sweep.add_argument("--concurrency", type=int, default=DEFAULT_MODEL_CONCURRENCY)
+    p_sweep.add_argument("--submit-delay", type=int, default=DEFAULT_SUBMIT_DELAY,
+                         help="Minimum seconds between task submissions across workers")
+    p_sweep.add_argument("--timeout", type=int, default=DEFAULT_TIMEOUT)
+    p_sweep.add_argument("--poll-interval", type=int, default=DEFAULT_POLL_INTERVAL)
+    p_sweep.add_argument("-c", "--config", default=None)
+    p_sweep.add_argument("--ledger", default=None, help="Cost ledger path (default: .sprite_cli/cost_ledger.jsonl)")
+    p_sweep.add_argument("--dry-run", action="store_true")
+    # perf
+    p_perf = sub.add_parser("perf", help="Performance history of batch runs: trends, percentiles, regressions")
+    p_perf.add_argument("action", choices=["report"])
+    p_perf.add_argument("--db", default=None, help="Database path (default: .sprite_cli/perf.sqlite3)")
+    p_perf.add_argument("--days", type=int, default=PERF_WINDOW_DAYS + PERF_BASELINE_DAYS,
+                        help="Trend range in days")
+    p_perf.add_argument("--bucket", choices=["week", "day"], default="week")
+    p_perf.add_argument("--window", type=int, default=PERF_WINDOW_DAYS, help="Recent window in days")
+    p_perf.add_argument("--baseline", type=int, default=PERF_BASELINE_DAYS,
+                        help="Baseline: this many days before the recent window")
+    p_perf.add_argument("--threshold", type=float, default=PERF_REGRESSION_THRESHOLD,
+                        help="Relative slowdown that counts as a regression")
+    p_perf.add_argument("--fail-on-regression", action="store_true", help="Exit 1 when a regression is flagged")
     # status
     p_status = sub.add_parser("status", help="Query task status")
     p_status.add_argument("--service", required=True, choices=["liblib", "tripo"])
     p_status.add_argument("--task-id", required=True)
     p_status.add_argument("--tripo-key", default=None)
     p_status.add_argument("-c", "--config", default=None)
+    for name, p in sub.choices.items():
+        p.add_argument("--output-format", choices=["json", "ndjson"], default="json",
+                       help="ndjson: stream start/progress/item/summary events, one JSON object per line")
+        if name in ("ui", "model", "vfx", "batch", "model-batch", "sweep"):
+            p.add_argument("--callback-port", type=int, default=None,
+                           help="Run a local receiver for completion callbacks on this port (0: any free port)")
+            p.add_argument("--callback-host", default=DEFAULT_CALLBACK_HOST)
+            p.add_argument("--callback-url", default=None,
+                           help="Public base URL forwarding to the receiver (tunnel); default http://host:port")
+            p.add_argument("--verify-interval", type=int, default=DEFAULT_VERIFY_INTERVAL,
+                           help="With a receiver: seconds between verification polls when no callback arrives")
     return parser
 
 
 def main():
     parser = build_parser()
     args = parser.parse_args()
+    OUTPUT["format"] = getattr(args, "output_format", "json")
     try:
+        if getattr(args, "callback_port", None) is not None:
+            callback_start(args.callback_port, args.callback_url, args.callback_host, args.verify_interval)
         if args.command == "ui": exit_code = cmd_ui(args)
         elif args.command == "model": exit_code = cmd_model(args)
+        elif args.command == "vfx": exit_code = cmd_vfx(args)
+        elif args.command == "lod": exit_code = cmd_lod(args)
+        elif args.command == "tile": exit_code = cmd_tile(args)
+        elif args.command == "slice": exit_code = cmd_slice(args)
+        elif args.command == "color": exit_code = cmd_color(args)
+        elif args.command == "compare": exit_code = cmd_compare(args)
+        elif args.command == "store": exit_code = cmd_store(args)
         elif args.command == "batch": exit_code = cmd_batch(args)
+        elif args.command == "model-batch": exit_code = cmd_model_batch(args)
+        elif args.command == "sweep": exit_code = cmd_sweep(args)
+        elif args.command == "perf": exit_code = cmd_perf(args)
         elif args.command == "status": exit_code = cmd_status(args)
         else:
             emit_result({"ok": False, "command": args.command, "error": "Unknown command"})
@@ -600,6 +4346,8 @@ def main():
         log("Unexpected error: %s" % e)
         emit_result({"ok": False, "command": getattr(args, "command", "unknown"), "error": "unexpected: %s" % e})
         exit_code = 1
+    finally:
+        callback_stop()
     sys.exit(exit_code)
 
 
@@ -177,35 +177,64 @@ def main():
 
     requests_list = task_data.get("generation_requests", [])
 
+    # 状态日志: 每完成一项追加一行, 避免每次重写整个任务文件 (大任务文件下是 O(n^2) 的写入)
+    # 上次中断留下的日志在启动时合并回来
+    journal_file = task_file + ".status.jsonl"
+    done_status = {}
+    torn_tail = False
+    if os.path.exists(journal_file):
+        with open(journal_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                # 进程在写入中途被杀时最后一行可能不完整, 跳过无法解析的行
+                torn_tail = not line.endswith("\n")
+                try:
+                    entry = json.loads(line)
+                    done_status[entry["filename"]] = entry["status"]
+                except (ValueError, KeyError, TypeError):
+                    continue
+        for req in requests_list:
+            if req["filename"] in done_status:
+                req["status"] = done_status[req["filename"]]
+        print(f"[INFO] Restored {len(done_status)} statuses from {journal_file}")
+
     print(f"[INFO] Found {len(requests_list)} generation requests")
     print(f"[INFO] Output directory: {OUTPUT_DIR}")
 
     success_count = 0
     fail_count = 0
 
-    for req in requests_list:
-        if req.get("status") == "completed":
-            print(f"\n[SKIP] Already completed: {req['filename']}")
-            continue
-
-        success = generate_image(
-            prompt=req["prompt"],
-            negative_prompt=req.get("negative_prompt", ""),
-            width=req["width"],
-            height=req["height"],
-            filename=req["filename"]
-        )
-
-        if success:
-            req["status"] = "completed"
-            success_count += 1
-        else:
-            req["status"] = "failed"
-            fail_count += 1
-
-        # 更新任务文件
-        with open(task_file, 'w', encoding='utf-8') as f:
-            json.dump(task_data, f, indent=2, ensure_ascii=False)
+    with open(journal_file, 'a', encoding='utf-8') as journal:
+        if torn_tail:
+            # 不完整的行另起一行, 新记录不会拼接到它后面
+            journal.write("\n")
+        for req in requests_list:
+            if req.get("status") == "completed":
+                print(f"\n[SKIP] Already completed: {req['filename']}")
+                continue
+
+            success = generate_image(
+                prompt=req["prompt"],
+                negative_prompt=req.get("negative_prompt", ""),
+                width=req["width"],
+                height=req["height"],
+                filename=req["filename"]
+            )
+
+            if success:
+                req["status"] = "completed"
+                success_count += 1
+            else:
+                req["status"] = "failed"
+                fail_count += 1
+
+            # 追加状态日志
+            journal.write(json.dumps({"filename": req["filename"], "status": req["status"]}, ensure_ascii=False) + "\n")
+            journal.flush()
+
+    # 更新任务文件 (只写一次), 然后删除已合并的日志
+    with open(task_file, 'w', encoding='utf-8') as f:
+        json.dump(task_data, f, indent=2, ensure_ascii=False)
+    os.remove(journal_file)
 
     print(f"\n[DONE] Success: {success_count}, Failed: {fail_count}")
 